@@ -50,9 +50,13 @@ def hidden_markov_model(distribution, *args, K=3, N=100):
                   name='A')
 
     # Hidden states (with unknown initial state probabilities and state
-    # transition probabilities)
+    # transition probabilities). The transitions are time-invariant, thus the
+    # emission log-likelihoods from the mixture are passed directly to the
+    # forward-backward recursion and the smoothed marginals directly to the
+    # mixture.
     Z = CategoricalMarkovChain(alpha, A,
                                states=N,
+                               homogeneous=True,
                                name='Z')
 
     # Emission/observation distribution
@@ -41,6 +41,9 @@ from .exponential import Exponential
 from .gaussian import Gaussian, GaussianARD
 from .wishart import Wishart
 from .gamma import Gamma
+from .gaussian_wishart import GaussianGammaISO, GaussianWishart
+from .gaussian_wishart import GaussianFromGaussianGamma
+from .gaussian_wishart import GaussianFromGaussianWishart
 
 from .gaussian_markov_chain import GaussianMarkovChain
 from .gaussian_markov_chain import VaryingGaussianMarkovChain
@@ -52,3 +55,4 @@ from .mixture import Mixture
 
 from .dot import Dot
 from .dot import SumMultiply
+from .dot import SparseDot
@@ -40,6 +40,57 @@ from bayespy.utils import random
 from bayespy.utils import utils
 
 
+def _check_categories(x, D):
+    """
+    Check that x contains valid category indices.
+    """
+    x = np.asanyarray(x)
+    if not utils.isinteger(x):
+        raise ValueError("Values must be integers")
+    if np.any(x < 0) or np.any(x >= D):
+        raise ValueError("Invalid category index")
+    return x
+
+
+def _categorical_counts(x, D, plates, weights=None):
+    """
+    Count the categories over the plates.
+
+    The counts are summed over the plate axes of `x` which are singular or
+    missing in `plates`, thus the result has shape plates+(D,). Optional
+    `weights` are broadcasted to the shape of `x`. The counts are computed by
+    scattering the indices, thus no one-hot array of shape
+    np.shape(x)+(D,) is created.
+    """
+    shape_x = np.shape(x)
+    shape = tuple(plates) + (D,)
+    plates = (1,) * (len(shape_x) - len(plates)) + tuple(plates)
+    # Flat index of the count for each element of x
+    index = 0
+    for (axis, size) in enumerate(plates):
+        if size > 1:
+            index = (index * size 
+                     + np.reshape(np.arange(size), 
+                                  (-1,) + (1,)*(len(shape_x)-axis-1)))
+    index = np.ravel(np.broadcast_to(index * D + x, shape_x))
+    if weights is not None:
+        weights = np.ravel(np.broadcast_to(weights, shape_x))
+    counts = np.bincount(index, 
+                         weights=weights, 
+                         minlength=int(np.prod(plates))*D)
+    return np.reshape(counts.astype(float), shape)
+
+
+def _categorical_gather(phi, x):
+    """
+    Pick the elements phi[...,x] without forming one-hot arrays.
+
+    The leading axes of `phi` are broadcasted against `x`.
+    """
+    phi = utils.atleast_nd(phi, np.ndim(x)+1)
+    return np.take_along_axis(phi, x[...,np.newaxis], axis=-1)[...,0]
+
+
 class CategoricalMoments(MultinomialMoments):
     """
     Class for the moments of categorical variables.
@@ -67,7 +118,7 @@ class CategoricalMoments(MultinomialMoments):
             raise ValueError("Invalid category index")
 
         u0 = np.zeros((np.size(x), self.D))
-        u0[[np.arange(np.size(x)), np.ravel(x)]] = 1
+        u0[(np.arange(np.size(x)), np.ravel(x))] = 1
         u0 = np.reshape(u0, np.shape(x) + (self.D,))
 
         return [u0]
@@ -143,7 +194,7 @@ class CategoricalDistribution(MultinomialDistribution):
 
         # Form a binary matrix with only one non-zero (1) in the last axis
         u0 = np.zeros((np.size(x), self.D))
-        u0[[np.arange(np.size(x)), np.ravel(x)]] = 1
+        u0[(np.arange(np.size(x)), np.ravel(x))] = 1
         u0 = np.reshape(u0, np.shape(x) + (self.D,))
         u = [u0]
 
@@ -158,7 +209,6 @@ class Categorical(Multinomial):
     Node for categorical random variables.
     """
 
-
     @classmethod
     @ensureparents
     def _constructor(cls, p, **kwargs):
@@ -189,6 +239,35 @@ class Categorical(Multinomial):
                 cls._parent_moments)
     
 
+    def _compress_observations(self, x, mask=True):
+        """
+        Keep fully observed values as integer indices.
+
+        The message to the parent is computed by counting the indices and the
+        lower bound by picking the log-probabilities of the observed
+        categories. For large numbers of categories, create the node with
+        initialize=False in order to avoid computing the moments from the
+        prior before observing.
+        """
+        if not np.all(mask) or np.shape(x) != self.plates:
+            return None
+        return _check_categories(x, self.dims[0][0])
+
+    def _compressed_moments(self):
+        return self._moments.compute_fixed_moments(self._observations)
+
+    def _compressed_message_to_parent(self, index):
+        return [_categorical_counts(self._observations,
+                                    self.dims[0][0],
+                                    self.parents[index].plates)]
+
+    def _compressed_lower_bound(self):
+        u_parents = self._message_from_parents()
+        phi = self._distribution.compute_phi_from_parents(*u_parents)
+        L = (self._distribution.compute_cgf_from_parents(*u_parents)
+             + _categorical_gather(phi[0], self._observations))
+        return np.sum(L)
+
     def random(self):
         """
         Draw a random sample from the distribution.
@@ -22,6 +22,7 @@
 ######################################################################
 
 import numpy as np
+import scipy.sparse as sp
 
 from .deterministic import Deterministic
 from .expfamily import ExponentialFamily, \
@@ -55,16 +56,52 @@ class CategoricalMarkovChainMoments(Moments):
 
 
 class CategoricalMarkovChainDistribution(ExponentialFamilyDistribution):
-
-
-    def __init__(self, categories, states):
+    """
+    Distribution of a categorical Markov chain.
+
+    If `homogeneous` is True, the state transition probabilities are the same
+    for every step. Then, the natural parameters are the initial state terms
+    (K,), the transition terms (K,K) and the per-state terms (N,K) from the
+    children, and the moments are the initial state probabilities (K,), the
+    pairwise state probabilities summed over the steps (K,K) and the state
+    probabilities (N,K). Otherwise, the transition terms and the pairwise
+    probabilities are given separately for each step (N-1,K,K).
+
+    Homogeneous chains may consist of several independent chains packed
+    along the time axis, `lengths` giving the length of each chain. Then,
+    the moments of the initial state and the pairwise probabilities are
+    summed over the chains.
+
+    For homogeneous chains, `pattern` can give the allowed state transitions
+    as a boolean (K,K) array or a sparse matrix. The other transitions have
+    zero probability and the recursions cost O(N*nnz) instead of O(N*K*K).
+    """
+
+
+    def __init__(self, categories, states, homogeneous=False, pattern=None,
+                 lengths=None):
         self.K = categories
         self.N = states
+        self.homogeneous = homogeneous
+        self.pattern = pattern
+        if pattern is not None:
+            # Dense mask of the allowed transitions
+            if sp.issparse(pattern):
+                pattern = pattern.toarray()
+            self.allowed = np.asarray(pattern, dtype=bool)
+        else:
+            self.allowed = None
+        if homogeneous and lengths is None:
+            lengths = [states]
+        self.lengths = lengths
 
     def compute_message_to_parent(self, parent, index, u, u_p0, u_P):
         if index == 0:
             return [ u[0] ]
         elif index == 1:
+            if self.homogeneous:
+                # Add the time axis
+                return [ u[1][...,None,:,:] ]
             return [ u[1] ]
         else:
             raise ValueError("Parent index out of bounds")
@@ -81,12 +118,35 @@ class CategoricalMarkovChainDistribution(ExponentialFamilyDistribution):
 
     def compute_phi_from_parents(self, u_p0, u_P, mask=True):
         phi0 = u_p0[0]
+        if self.homogeneous:
+            phi1 = u_P[0]
+            if np.ndim(phi1) >= 3:
+                # Remove the time axis
+                phi1 = phi1[...,0,:,:]
+            phi1 = phi1 * np.ones((self.K,self.K))
+            if self.allowed is not None:
+                # The recursions ignore the disallowed transitions
+                phi1 = np.where(self.allowed, phi1, 0)
+            # The per-state terms come only from the children
+            phi2 = np.zeros((self.N,self.K))
+            return [phi0, phi1, phi2]
         phi1 = u_P[0] * np.ones((self.N-1,self.K,self.K))
         return [phi0, phi1]
 
     def compute_moments_and_cgf(self, phi, mask=True):
         logp0 = phi[0]
         logP = phi[1]
+        if self.homogeneous:
+            logq = phi[2]
+            (z0, zz, z, cgf) = random.alpha_beta_recursion_packed(logp0,
+                                                                  logP,
+                                                                  logq,
+                                                                  self.lengths,
+                                                                  pattern=self.pattern)
+            if self.allowed is not None:
+                zz = np.where(self.allowed, zz, 0)
+            u = [z0, zz, z]
+            return (u, cgf)
         (z0, zz, cgf) = random.alpha_beta_recursion(logp0, logP)
         u = [z0, zz]
         return (u, cgf)
@@ -101,6 +161,8 @@ class CategoricalMarkovChainDistribution(ExponentialFamilyDistribution):
         if index == 0:
             return plates
         elif index == 1:
+            if self.homogeneous:
+                return plates + (1, self.K)
             return plates + (self.N-1, self.K)
         else:
             raise ValueError("Parent index out of bounds")
@@ -122,12 +184,43 @@ class CategoricalMarkovChain(ExponentialFamily):
 
     @classmethod
     @ensureparents
-    def _constructor(cls, p0, P, states=None, **kwargs):
+    def _constructor(cls, p0, P, states=None, homogeneous=False, pattern=None,
+                     lengths=None, **kwargs):
+        """
+        Constructs distribution and moments objects.
+
+        If `homogeneous` is True, the state transition probabilities must be
+        the same for every step and the node uses a compact representation:
+        the pairwise state probabilities are summed over the steps instead of
+        storing them for each step separately.
+
+        For homogeneous chains, `pattern` can be given as a boolean (D,D)
+        array or a sparse matrix of the allowed state transitions, for
+        instance, a banded matrix for left-to-right models. The other
+        transitions are given zero probability.  If `P` is a Dirichlet node,
+        its support must be the same pattern, that is, it must be created as
+        `Dirichlet(alpha, pattern=pattern)`, so that the posterior
+        approximation of `P` is zero outside the pattern too.
+
+        Several independent homogeneous chains of varying lengths can be
+        packed into one node by concatenating them along the time axis and
+        giving the lengths of the chains in `lengths`. The chains share the
+        initial state and transition probabilities, thus there is no need to
+        pad the chains to the same length.
+        """
 
         # Number of categories
         D = p0.dims[0][0]
         # Number of states
-        if len(P.plates) < 2:
+        if lengths is not None:
+            if not homogeneous:
+                raise ValueError("Packed chains are supported only for "
+                                 "homogeneous chains")
+            if states is not None and np.sum(lengths) != states:
+                raise ValueError("Lengths of the packed chains are "
+                                 "inconsistent with the number of states")
+            N = int(np.sum(lengths))
+        elif len(P.plates) < 2:
             if states is None:
                 raise ValueError("Could not infer the length of the Markov "
                                  "chain")
@@ -153,10 +246,40 @@ class CategoricalMarkovChain(ExponentialFamily):
         if len(P.plates) < 1 or P.plates[-1] != D:
             raise ValueError("Transition probability matrix is not square")
 
-        dims = ( (D,), (N-1,D,D) )
+        if homogeneous:
+            if len(P.plates) >= 2 and P.plates[-2] != 1:
+                raise ValueError("Transition probability matrix varies in "
+                                 "time, thus the chain is not homogeneous")
+            dims = ( (D,), (D,D), (N,D) )
+        else:
+            if pattern is not None:
+                raise ValueError("Sparse transitions are supported only for "
+                                 "homogeneous chains")
+            dims = ( (D,), (N-1,D,D) )
+
+        if pattern is not None and np.shape(pattern) != (D,D):
+            raise ValueError("Sparsity pattern of the transition matrix has "
+                             "wrong shape")
+
+        if pattern is not None and isinstance(P, Dirichlet):
+            support = P._distribution.pattern
+            shape = P.plates + P.dims[0]
+            allowed = pattern.toarray() if sp.issparse(pattern) else pattern
+            if (support is None or 
+                not np.array_equal(np.broadcast_to(support, shape),
+                                   np.broadcast_to(np.asarray(allowed, 
+                                                              dtype=bool),
+                                                   shape))):
+                raise ValueError("The support of the Dirichlet transition "
+                                 "probabilities must be the sparsity pattern "
+                                 "of the chain, give it as "
+                                 "Dirichlet(alpha, pattern=pattern)")
 
         parents = [p0, P]
-        distribution = CategoricalMarkovChainDistribution(D, N)
+        distribution = CategoricalMarkovChainDistribution(D, N, 
+                                                          homogeneous=homogeneous,
+                                                          pattern=pattern,
+                                                          lengths=lengths)
         moments = CategoricalMarkovChainMoments(D)
         parent_moments = cls._parent_moments
 
@@ -183,6 +306,10 @@ class CategoricalMarkovChainToCategorical(Deterministic):
         super().__init__(Z, dims=dims, **kwargs)
         
     def _compute_moments(self, u_Z):
+        if len(u_Z) == 3:
+            # Homogeneous chain has the marginal probabilities explicitly
+            return [u_Z[2]]
+
         # Add time axis to p0
         p0 = u_Z[0][...,None,:]
         # Sum joint probability arrays to marginal probability vectors
@@ -202,6 +329,9 @@ class CategoricalMarkovChainToCategorical(Deterministic):
         return [P]
 
     def _compute_message_to_parent(self, index, m, u_Z):
+        if len(self.parents[0].dims) == 3:
+            # Homogeneous chain: the message goes only to the per-state terms
+            return [None, None, m[0]]
         m0 = m[0][...,0,:]
         m1 = m[0][...,1:,None,:]
         return [m0, m1]
@@ -220,7 +350,10 @@ class CategoricalMarkovChainToCategorical(Deterministic):
     
     def _plates_from_parent(self, index):
         if index == 0:
-            N = self.parents[0].dims[1][0]
+            N = self.parents[0].dims[-1][0]
+            if len(self.parents[0].dims) == 3:
+                # Homogeneous chain has the state probabilities explicitly
+                return self.parents[0].plates + (N,)
             return self.parents[0].plates + (N+1,)
         else:
             raise ValueError("Parent index out of bounds")
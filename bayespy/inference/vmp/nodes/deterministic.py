@@ -223,6 +223,15 @@ def tile(X, tiles):
                 # Add variable dimensions to tiles
                 tiles_ind = tiles + (1,)*len(self.dims[ind])
 
+                # Utilize broadcasting: Plate axes along which the message has
+                # been broadcasted (zero stride) are handled as unit axes, so
+                # that the broadcasted message is not copied when reshaping.
+                m[ind] = np.asarray(m[ind])
+                ndim_plates = np.ndim(m[ind]) - len(self.dims[ind])
+                m[ind] = m[ind][tuple(slice(0, 1) if (st == 0 and j < ndim_plates)
+                                      else slice(None)
+                                      for (j, st) in enumerate(m[ind].strides))]
+
                 # Make shape tuples equal length
                 shape_m = np.shape(m[ind])
                 (tiles_ind, shape, shape_m) = utils.make_equal_length(tiles_ind,
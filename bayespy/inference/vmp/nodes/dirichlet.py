@@ -27,6 +27,7 @@ Module for the Dirichlet distribution node.
 
 import numpy as np
 import scipy.special as special
+import scipy.sparse as sp
 
 from bayespy.utils import random
 
@@ -108,6 +109,16 @@ class DirichletDistribution(ExponentialFamilyDistribution):
     Class for the VMP formulas of Dirichlet variables.
     """
 
+    def __init__(self, pattern=None):
+        """
+        Create VMP formula node for a Dirichlet variable.
+
+        `pattern` is a boolean array of the support, that is, the other
+        probabilities are zero.  It broadcasts to the plates and the
+        dimensionality of the variable.
+        """
+        self.pattern = pattern
+
     
     def compute_message_to_parent(self, parent, index, u_self, u_alpha):
         """
@@ -126,13 +137,34 @@ class DirichletDistribution(ExponentialFamilyDistribution):
     def compute_moments_and_cgf(self, phi, mask=True):
         """
         Compute the moments and :math:`g(\phi)`.
+
+        If the support is restricted by a pattern, the distribution is defined
+        over the elements in the support and the concentration parameters of
+        the other elements are ignored.
         """
-        sum_gammaln = np.sum(special.gammaln(phi[0]), axis=-1)
-        gammaln_sum = special.gammaln(np.sum(phi[0], axis=-1))
-        psi_sum = special.psi(np.sum(phi[0], axis=-1, keepdims=True))
+        alpha = phi[0]
+        support = self.pattern
+        if support is None:
+            if np.any(alpha <= 0):
+                raise ValueError("The concentration parameters must be "
+                                 "positive")
+            sum_gammaln = np.sum(special.gammaln(alpha), axis=-1)
+            alpha_sum = np.sum(alpha, axis=-1)
+        else:
+            if np.any(np.logical_and(support, alpha <= 0)):
+                raise ValueError("The concentration parameters must be "
+                                 "positive in the support")
+            alpha = np.where(support, alpha, 1)
+            sum_gammaln = np.sum(np.where(support, special.gammaln(alpha), 0),
+                                 axis=-1)
+            alpha_sum = np.sum(np.where(support, alpha, 0), axis=-1)
+        gammaln_sum = special.gammaln(alpha_sum)
+        psi_sum = special.psi(alpha_sum)[...,None]
         
         # Moments <log x>
-        u0 = special.psi(phi[0]) - psi_sum
+        u0 = special.psi(alpha) - psi_sum
+        if support is not None:
+            u0 = np.where(support, u0, -np.inf)
         u = [u0]
         # G
         g = gammaln_sum - sum_gammaln
@@ -166,29 +198,82 @@ class Dirichlet(ExponentialFamily):
 
     @classmethod
     @ensureparents
-    def _constructor(cls, alpha, **kwargs):
+    def _constructor(cls, alpha, pattern=None, **kwargs):
         """
         Constructs distribution and moments objects.
+
+        `pattern` can be given as a boolean array or a sparse matrix of the
+        support, that is, the other probabilities are zero in the prior and
+        in the posterior approximation.  It broadcasts to the plates and the
+        dimensionality of the variable.
         """
         # Number of categories
         D = alpha.dims[0][0]
 
         parents = [alpha]
+        plates = cls._total_plates(kwargs.get('plates'), alpha.plates)
+
+        if pattern is None:
+            distribution = cls._distribution
+        else:
+            if sp.issparse(pattern):
+                pattern = pattern.toarray()
+            pattern = np.asarray(pattern, dtype=bool)
+            try:
+                np.broadcast_to(pattern, plates + (D,))
+            except ValueError:
+                raise ValueError("The support pattern has shape %s which "
+                                 "does not broadcast to %s"
+                                 % (np.shape(pattern), plates + (D,)))
+            if not np.all(np.any(pattern, axis=-1)):
+                raise ValueError("The support pattern must contain at least "
+                                 "one element for each distribution")
+            distribution = DirichletDistribution(pattern=pattern)
         
         return ( parents,
                  kwargs,
                  ( (D,), ),
-                 cls._total_plates(kwargs.get('plates'), alpha.plates),
-                 cls._distribution, 
+                 plates,
+                 distribution, 
                  cls._moments, 
                  cls._parent_moments)
 
                  
+    def lower_bound_contribution(self):
+        """
+        Compute the lower bound contribution of the node.
+
+        If the support is restricted by a pattern, the prior is restricted to
+        the support too.
+        """
+        support = self._distribution.pattern
+        if support is None:
+            return super().lower_bound_contribution()
+
+        # Prior and posterior concentrations in the support
+        alpha_p = self._message_from_parents()[0][0]
+        alpha_p = np.where(support, alpha_p, 1)
+        alpha_q = np.where(support, self.phi[0], 0)
+        logp = np.where(support, self.u[0], 0)
+        g_p = (special.gammaln(np.sum(np.where(support, alpha_p, 0), axis=-1))
+               - np.sum(np.where(support, special.gammaln(alpha_p), 0),
+                        axis=-1))
+        alpha_p = np.where(support, alpha_p, 0)
+        L = g_p - self.g + np.sum((alpha_p - alpha_q) * logp, axis=-1)
+
+        return (np.sum(np.where(self.mask, L, 0))
+                * self._plate_multiplier(self.plates,
+                                         np.shape(L),
+                                         np.shape(self.mask)))
+
     def random(self):
         """
         Draw a random sample from the distribution.
         """
-        return random.dirichlet(self.phi[0], size=self.plates)
+        alpha = self.phi[0]
+        if self._distribution.pattern is not None:
+            alpha = np.where(self._distribution.pattern, alpha, 0)
+        return random.dirichlet(alpha, size=self.plates)
         
 
     def show(self):
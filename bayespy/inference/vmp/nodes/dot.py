@@ -22,6 +22,7 @@
 ######################################################################
 
 import numpy as np
+import scipy.sparse as sp
 
 from bayespy.utils import utils
 
@@ -84,16 +85,12 @@ class SumMultiply(Deterministic):
     Note
     ----
 
-    This operation can be extremely slow if not used wisely. For large and
-    complex operations, it is sometimes more efficient to split the operation
-    into multiple nodes. For instance, the example above could probably be
-    computed faster by
-
-        XZ = SumMultiply(X, [0,1,2], Z, [2,0], [0,1])
-        SumMultiply(XZ, [0,1], Y, [1,2], [2,0])
-
-    because the third axis ('c') could be summed out already in the first
-    operation. This same effect applies also to numpy.einsum in general.
+    The order in which the operands are contracted is optimized for the
+    shapes of the inputs and the pairwise contractions are computed with BLAS
+    when possible. The optimized orders are cached in the node, thus the
+    planning is done only once for each shape signature. For instance, in the
+    example above, the third axis ('c') is summed out before multiplying by Y
+    if that is cheaper.
     """
 
     def __init__(self, *args, iterator_axis=None, **kwargs):
@@ -236,14 +233,96 @@ class SumMultiply(Deterministic):
         self.in_keys = [ [full_keyset.index(key) for key in keyset]
                          for keyset in keysets ]
 
+        # Contraction paths for einsum, one for each shape signature
+        self._einsum_paths = {}
+
         super().__init__(*nodes,
                          dims=(tuple(dim0),tuple(dim1)),
                          **kwargs)
 
-            
+
+    def _einsum(self, *args):
+        """
+        Compute einsum using a contraction path planned for the shapes.
+
+        The arguments are given in the interleaved format of numpy.einsum. The
+        order of the pairwise contractions is optimized once for each shape
+        signature and cached, so that the products are computed with
+        tensordot (BLAS) whenever possible.
+        """
+        signature = tuple((np.shape(arg) if i % 2 == 0 else tuple(arg))
+                          for (i, arg) in enumerate(args))
+        path = self._einsum_paths.get(signature)
+        if path is None:
+            # Optimal order is feasible only for a few operands
+            optimize = 'optimal' if len(args) // 2 <= 6 else 'greedy'
+            path = np.einsum_path(*args, optimize=optimize)[0]
+            self._einsum_paths[signature] = path
+        return np.einsum(*args, optimize=path)
+
+
+
+    def _gemm_plates(self):
+        """
+        Check whether the inner product can be computed with matrix products.
+
+        This is possible for the inner product of two vectors whose non-unit
+        plates do not overlap, for instance, plates (M,1) and (1,N) as in
+        matrix factorization models. Returns the plates of the two parents
+        padded to the same length, or None.
+        """
+        if (len(self.parents) != 2 
+            or len(self.out_keys) != 0
+            or len(self.in_keys[0]) != 1
+            or self.in_keys[0] != self.in_keys[1]):
+            return None
+        L = len(self.plates)
+        plates = [(1,)*(L-len(parent.plates)) + parent.plates
+                  for parent in self.parents]
+        if any(a > 1 and b > 1 for (a, b) in zip(*plates)):
+            return None
+        return plates
+
+    def _gemm_unpack(self, R, plates):
+        """
+        Transform a matrix of shape [prod(plates[0]), prod(plates[1])] to an
+        array with the plates of this node.
+        """
+        L = len(self.plates)
+        R = np.reshape(R, plates[0] + plates[1])
+        R = np.transpose(R, [j + k*L for j in range(L) for k in range(2)])
+        return np.reshape(R, self.plates)
+
+    def _gemm_pack(self, X, plates):
+        """
+        Transform an array with plates given by the plates of the two parents
+        to a matrix of shape [prod(plates[0]), prod(plates[1])].
+        """
+        L = len(self.plates)
+        X = np.reshape(X, [n for pair in zip(*plates) for n in pair])
+        X = np.transpose(X, [2*j + k for k in range(2) for j in range(L)])
+        return np.reshape(X, (int(np.prod(plates[0])), int(np.prod(plates[1]))))
+
+    def _gemm_moments(self, u_parent, index, ind, plates):
+        """
+        Reshape the moments of a parent to a matrix with a row for each plate.
+        """
+        shape = plates[index] + self.parents[index].dims[ind]
+        u = np.broadcast_to(u_parent[ind], shape)
+        return np.reshape(u, (int(np.prod(plates[index])), -1))
 
     def _compute_moments(self, *u_parents):
 
+        # Inner product of two vectors over disjoint plates:
+        #   <x_i>'<w_j> and tr(<x_i x_i'> <w_j w_j'>) 
+        # for all plates i and j using matrix products
+        plates = self._gemm_plates()
+        if plates is not None:
+            return [self._gemm_unpack(
+                        np.dot(self._gemm_moments(u_parents[0], 0, ind, plates),
+                               self._gemm_moments(u_parents[1], 1, ind, plates).T),
+                        plates)
+                    for ind in range(2)]
 
         # Compute the number of plate axes for each node
         plate_counts0 = [(np.ndim(u_parent[0]) - len(keys))
@@ -267,7 +346,7 @@ class SumMultiply(Deterministic):
         u0 = [u[0] for u in u_parents]
         
         args = utils.zipper_merge(u0, in_all_keys) + [out_all_keys]
-        x0 = np.einsum(*args)
+        x0 = self._einsum(*args)
 
         #
         # Compute the covariance
@@ -282,7 +361,7 @@ class SumMultiply(Deterministic):
                                                            self.in_keys)]
         u1 = [u[1] for u in u_parents]
         args = utils.zipper_merge(u1, in_all_keys) + [out_all_keys]
-        x1 = np.einsum(*args)
+        x1 = self._einsum(*args)
 
         return [x0, x1]
 
@@ -303,6 +382,40 @@ class SumMultiply(Deterministic):
         if index >= len(self.parents):
             raise ValueError("Parent index larger than the number of parents")
 
+        # Inner product of two vectors over disjoint plates: the messages are
+        # matrix products of the child messages and the moments of the other
+        # parent
+        plates = self._gemm_plates()
+        if plates is not None:
+            u = self.parents[1-index].get_moments()
+            m = self._message_from_children()
+            parent = self.parents[index]
+            L = len(self.plates)
+            msg = list()
+            for ind in range(2):
+                X = self.mask * m[ind]
+                X = np.reshape(X, (1,)*(L-np.ndim(X)) + np.shape(X))
+                # The plates of the parents along which the message varies
+                plates_m = [tuple(n if s > 1 else 1 
+                                  for (n, s) in zip(plates_k, np.shape(X)))
+                            for plates_k in plates]
+                # Sum the moments of the other parent over the plates along
+                # which the message is constant
+                dims = parent.dims[ind]
+                u_other = np.broadcast_to(u[ind], plates[1-index] + dims)
+                axes = tuple(j for j in range(L)
+                             if plates_m[1-index][j] != plates[1-index][j])
+                u_other = np.sum(u_other, axis=axes, keepdims=True)
+                u_other = np.reshape(u_other, 
+                                     (int(np.prod(plates_m[1-index])), -1))
+                X = self._gemm_pack(X, plates_m)
+                if index == 1:
+                    X = X.T
+                X = np.dot(X, u_other)
+                X = np.reshape(X, plates_m[index] + dims)
+                msg.append(utils.squeeze_to_dim(X, len(parent.get_shape(ind))))
+            return msg
+
         # Get messages from other parents and children
         u_parents = self._message_from_parents(exclude=index)
         m = self._message_from_children()
@@ -424,7 +537,7 @@ class SumMultiply(Deterministic):
             args.append(parent_keys)
 
             # THE BEEF: Compute the message
-            msg[ind] = np.einsum(*args)
+            msg[ind] = self._einsum(*args)
 
             # Find the correct shape for the message array
             message_shape = list(np.shape(msg[ind]))
@@ -456,6 +569,121 @@ class SumMultiply(Deterministic):
         
         return msg
 
+class SparseDot(Deterministic):
+    """
+    Compute the inner products of Gaussian vectors for given pairs of plates.
+
+    For a set of index pairs (rows[k], cols[k]), the node computes
+
+        y[k] = x[rows[k]]' * w[cols[k]]
+
+    where X has plates (N,) and W has plates (M,). The resulting node has
+    plates (len(rows),). This is the equivalent of 
+
+        Dot(X[:,None], W[None,:])[rows,cols]
+
+    but the moments are computed only for the given pairs and the messages to
+    the parents are summed with sparse matrix products, thus the cost is
+    linear in the number of pairs instead of N*M. This is useful, for
+    instance, in matrix factorization with sparsely observed data.
+    """
+
+    def __init__(self, X, W, rows, cols, **kwargs):
+        """
+        SparseDot(X, W, rows, cols)
+        """
+        self._moments = GaussianMoments(0)
+        self._parent_moments = (GaussianMoments(1),
+                                GaussianMoments(1))
+
+        X = self._ensure_moments(X, self._parent_moments[0])
+        W = self._ensure_moments(W, self._parent_moments[1])
+        if X.dims[0] != W.dims[0]:
+            raise ValueError("The dimensionalities of the vectors do not "
+                             "match")
+        if len(X.plates) != 1 or len(W.plates) != 1:
+            raise ValueError("The nodes must have exactly one plate axis")
+
+        rows = np.asarray(rows)
+        cols = np.asarray(cols)
+        if (np.ndim(rows) != 1 
+            or np.shape(rows) != np.shape(cols)
+            or not utils.isinteger(rows)
+            or not utils.isinteger(cols)):
+            raise ValueError("The indices must be integer vectors of equal "
+                             "length")
+        if (np.any(rows < 0) or np.any(rows >= X.plates[0])
+            or np.any(cols < 0) or np.any(cols >= W.plates[0])):
+            raise ValueError("The indices are out of bounds")
+        self.rows = rows
+        self.cols = cols
+
+        super().__init__(X, W, dims=((),()), **kwargs)
+
+    def _plates_to_parent(self, index):
+        return self.parents[index].plates
+
+    def _plates_from_parent(self, index):
+        return np.shape(self.rows)
+
+    def _compute_mask_to_parent(self, index, mask):
+        indices = self.rows if index == 0 else self.cols
+        mask_parent = np.zeros(self.parents[index].plates, dtype=bool)
+        mask_parent[indices[np.broadcast_to(mask, np.shape(indices))]] = True
+        return mask_parent
+
+    @staticmethod
+    def _gather(u, indices, ndim):
+        """
+        Pick the moments of the given plates unless the moments are
+        broadcasted over the plates.
+        """
+        if np.ndim(u) > ndim and np.shape(u)[0] > 1:
+            return u[indices]
+        return u
+
+    def _compute_moments(self, u_X, u_W):
+        (X, XX) = [self._gather(u, self.rows, ndim)
+                   for (u, ndim) in zip(u_X, (1,2))]
+        (W, WW) = [self._gather(u, self.cols, ndim) 
+                   for (u, ndim) in zip(u_W, (1,2))]
+        ones = np.ones(np.shape(self.rows))
+        return [ones * np.einsum('...i,...i->...', X, W),
+                ones * np.einsum('...ij,...ij->...', XX, WW)]
+
+    def _message_to_parent(self, index):
+        """
+        Compute the message to a parent node.
+
+        The messages of the pairs are summed to the plates of the parent by
+        multiplying the moments of the other parent by sparse matrices.
+        """
+
+        if index >= len(self.parents):
+            raise ValueError("Parent index larger than the number of parents")
+
+        u = self.parents[1-index].get_moments()
+        m = self._message_from_children()
+        mask = self.mask
+
+        (N, M) = (self.parents[0].plates[0], self.parents[1].plates[0])
+        K = len(self.rows)
+        msg = list()
+        for ind in range(2):
+            # Sparse matrix of the messages with the shape of the plates
+            # (N,M) or (M,N)
+            m_ind = np.broadcast_to(mask * m[ind], (K,))
+            A = sp.csr_matrix((m_ind, (self.rows, self.cols)), shape=(N,M))
+            if index == 1:
+                A = A.T.tocsr()
+            dims = self.parents[index].dims[ind]
+            u_ind = np.broadcast_to(u[ind], (A.shape[1],) + dims)
+            u_ind = np.reshape(u_ind, (A.shape[1], -1))
+            msg.append(np.reshape(A.dot(u_ind), (A.shape[0],) + dims))
+
+        return msg
+
+
 def Dot(*args, **kwargs):
     """
     Node for computing inner product of several Gaussian vectors.
@@ -22,6 +22,7 @@
 ######################################################################
 
 import numpy as np
+import scipy.sparse as sp
 
 from bayespy.utils import utils
 
@@ -66,9 +67,11 @@ class ExponentialFamilyDistribution(Distribution):
         for (phi_i, u_i, ndims_i) in zip(phi, u, ndims):
             # Axes to sum (dimensions of the variable, not the plates)
             axis_sum = tuple(range(-ndims_i,0))
-            # Compute the term
-            # TODO/FIXME: Use einsum!
-            L = L + np.sum(phi_i * u_i, axis=axis_sum)
+            # Compute the term without forming the broadcasted product
+            if ndims_i > 0:
+                L = L + utils.sum_multiply(phi_i, u_i, axis=axis_sum)
+            else:
+                L = L + phi_i * u_i
         return L
 
 
@@ -109,6 +112,11 @@ class ExponentialFamily(Stochastic):
        _compute_mask_to_parent(index, mask)
        _plates_to_parent(self, index)
        _plates_from_parent(self, index)
+    2. If they keep observations in a compressed form:
+       _compress_observations(x, *args, mask=True)
+       _compressed_moments()
+       _compressed_message_to_parent(index)
+       _compressed_lower_bound()
     
     """
 
@@ -118,6 +126,10 @@ class ExponentialFamily(Stochastic):
     # Sub-classes should overwrite this
     _distribution = None
 
+    # Fully observed values in a compressed form (e.g., integer indices or a
+    # sparse matrix) or None
+    _observations = None
+
     @useconstructor
     def __init__(self, *parents, initialize=True, **kwargs):
 
@@ -281,8 +293,21 @@ class ExponentialFamily(Stochastic):
     def observe(self, x, *args, mask=True):
         """
         Fix moments, compute f and propagate mask.
+
+        If the sub-class can compress the observations, the moments are not
+        computed. Instead, the compressed observations are used for the
+        messages to the parents and the lower bound, and the moments are
+        formed only if they are requested.
         """
 
+        # Keep compressed observations as such
+        self._observations = self._compress_observations(x, *args, mask=mask)
+        if self._observations is not None:
+            self.f = 0
+            self.observed = True
+            self._update_mask()
+            return
+
         # Compute fixed moments
         (u, f) = self._distribution.compute_fixed_moments_and_f(x, *args,
                                                                 mask=mask)
@@ -309,8 +334,60 @@ class ExponentialFamily(Stochastic):
         self.observed = mask
         self._update_mask()
 
+    def unobserve(self):
+        if self._observations is not None:
+            # Use the observations as the current moments
+            self.u = self._compressed_moments()
+            self._observations = None
+        super().unobserve()
+
+    def get_moments(self):
+        if self._observations is not None:
+            return self._compressed_moments()
+        return super().get_moments()
+
+    def _message_to_parent(self, index):
+        if self._observations is not None:
+            m = self._compressed_message_to_parent(index)
+            if m is not None:
+                return m
+        return super()._message_to_parent(index)
+
+    def _compress_observations(self, x, *args, mask=True):
+        """
+        Compress the observations or return None.
+
+        Sub-classes may implement this together with the other methods for
+        compressed observations in order to avoid forming the moment arrays
+        of the observations. The observations should be validated here.
+        """
+        return None
+
+    def _compressed_moments(self):
+        """
+        Compute the moments of the compressed observations.
+        """
+        raise NotImplementedError()
+
+    def _compressed_message_to_parent(self, index):
+        """
+        Compute the message to a parent from the compressed observations.
+
+        Returns None if the message should be computed from the moments.
+        """
+        raise NotImplementedError()
+
+    def _compressed_lower_bound(self):
+        """
+        Compute the lower bound term from the compressed observations.
+        """
+        raise NotImplementedError()
+
     def lower_bound_contribution(self, gradient=False):
         # Compute E[ log p(X|parents) - log q(X) ] over q(X)q(parents)
+
+        if self._observations is not None:
+            return self._compressed_lower_bound()
         
         # Messages from parents
         #u_parents = [parent.message_to_child() for parent in self.parents]
@@ -389,6 +466,15 @@ class ExponentialFamily(Stochastic):
             utils.write_to_hdf5(group, self.phi[i], 'phi%d' % i)
         utils.write_to_hdf5(group, self.f, 'f')
         utils.write_to_hdf5(group, self.g, 'g')
+        # The moments are not up to date for compressed observations
+        if sp.issparse(self._observations):
+            x = sp.csr_matrix(self._observations)
+            utils.write_to_hdf5(group, x.data, 'observations_data')
+            utils.write_to_hdf5(group, x.indices, 'observations_indices')
+            utils.write_to_hdf5(group, x.indptr, 'observations_indptr')
+            utils.write_to_hdf5(group, x.shape, 'observations_shape')
+        elif self._observations is not None:
+            utils.write_to_hdf5(group, self._observations, 'observations')
         super().save(group)
     
     def load(self, group):
@@ -402,6 +488,16 @@ class ExponentialFamily(Stochastic):
             
         self.f = group['f'][...]
         self.g = group['g'][...]
+        if 'observations_data' in group:
+            self._observations = sp.csr_matrix(
+                (group['observations_data'][...],
+                 group['observations_indices'][...],
+                 group['observations_indptr'][...]),
+                shape=tuple(group['observations_shape'][...]))
+        elif 'observations' in group:
+            self._observations = group['observations'][...]
+        else:
+            self._observations = None
         super().load(group)
 
         
@@ -73,6 +73,10 @@ class GaussianDistribution(ExponentialFamilyDistribution):
                 -0.5 * u_Lambda[0]]
 
     def compute_moments_and_cgf(self, phi, mask=True):
+        if utils.linalg.has_shared_matrix(phi[1]):
+            # All plates have the same precision matrix, thus factorize it
+            # only once
+            return compute_shared_moments_and_cgf(phi[0], phi[1])
         # TODO: Compute -2*phi[1] and simplify the formulas
         L = utils.utils.m_chol(-2*phi[1])
         k = np.shape(phi[0])[-1]
@@ -506,15 +510,20 @@ class GaussianARDDistribution(ExponentialFamilyDistribution):
             phi0 = np.reshape(phi[0], phi[0].shape[:-self.ndim] + (D,))
             phi1 = np.reshape(phi[1], phi[1].shape[:-2*self.ndim] + (D,D))
 
-            # Compute the moments
-            L = utils.linalg.chol(-2*phi1)
-            Cov = utils.linalg.chol_inv(L)
-            u0 = utils.linalg.chol_solve(L, phi0)
-            u1 = utils.linalg.outer(u0, u0) + Cov
+            if utils.linalg.has_shared_matrix(phi1):
+                # All plates have the same precision matrix, thus factorize
+                # it only once
+                ((u0, u1), g) = compute_shared_moments_and_cgf(phi0, phi1)
+            else:
+                # Compute the moments
+                L = utils.linalg.chol(-2*phi1)
+                Cov = utils.linalg.chol_inv(L)
+                u0 = utils.linalg.chol_solve(L, phi0)
+                u1 = utils.linalg.outer(u0, u0) + Cov
 
-            # Compute CGF
-            g = (- 0.5 * np.einsum('...i,...i', u0, phi0)
-                 + 0.5 * utils.linalg.chol_logdet(L))
+                # Compute CGF
+                g = (- 0.5 * np.einsum('...i,...i', u0, phi0)
+                     + 0.5 * utils.linalg.chol_logdet(L))
 
             # Reshape to arrays
             u0 = np.reshape(u0, u0.shape[:-1] + self.shape)
@@ -973,6 +982,30 @@ class GaussianARD(ExponentialFamily):
         return
 
 
+def compute_shared_moments_and_cgf(phi0, phi1):
+    """
+    Compute the moments and the CGF when the plates share the precision matrix.
+
+    `phi1` has only unit plate axes, that is, it is broadcasted over the
+    plates.  Instead of factorizing the precision matrix for each plate, it is
+    factorized once and the factor is applied to all the vectors in `phi0`
+    with a single multiple right-hand-side solve.
+    """
+    D = np.shape(phi1)[-1]
+    ndim_plates = max(np.ndim(phi0)-1, np.ndim(phi1)-2)
+    Lambda = -2 * np.reshape(phi1, (D,D))
+    L = utils.linalg.chol(Lambda)
+    Cov = utils.linalg.chol_inv(L)
+    u0 = utils.linalg.chol_solve_shared(L, phi0)
+    u1 = utils.linalg.outer(u0, u0) + Cov
+    g = (- 0.5 * np.einsum('...i,...i', u0, phi0)
+         + 0.5 * utils.linalg.chol_logdet(L))
+    # Keep the plate axes of the broadcasted precision matrix
+    u0 = utils.utils.add_leading_axes(u0, ndim_plates-np.ndim(u0)+1)
+    u1 = utils.utils.add_leading_axes(u1, ndim_plates-np.ndim(u1)+2)
+    g = utils.utils.add_leading_axes(g, ndim_plates-np.ndim(g))
+    return ([u0, u1], g)
+
 def reshape_gaussian_array(dims_from, dims_to, x0, x1):
     """
     Reshape the moments Gaussian array variable.
@@ -1032,6 +1065,10 @@ def left_rotate_covariance(Cov, R, axis=-1, ndim=1):
     if axis >= 0:
         axis -= ndim
 
+    # For vectors, the rotation is a matrix product which uses BLAS
+    if ndim == 1:
+        return np.matmul(R, Cov)
+
     # Rotation from left
     axes_R = [Ellipsis, ndim+abs(axis)+1, ndim+abs(axis)]
     axes_Cov = [Ellipsis] + list(range(ndim+abs(axis),
@@ -1061,6 +1098,11 @@ def right_rotate_covariance(Cov, R, axis=-1, ndim=1):
     if axis >= 0:
         axis -= ndim
 
+    # If the last axis is rotated, the rotation is a matrix product which uses
+    # BLAS
+    if axis == -1:
+        return np.matmul(Cov, np.swapaxes(R, -1, -2))
+
     # Rotation from right
     axes_R = [Ellipsis, abs(axis)+1, abs(axis)]
     axes_Cov = [Ellipsis] + list(range(abs(axis),
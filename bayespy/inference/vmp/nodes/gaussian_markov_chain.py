@@ -56,15 +56,65 @@ class GaussianMarkovChainMoments(Moments):
         return [u0, u1, u2]
         
     
+def _add_outer(C, x, y):
+    """
+    Compute C + x*y' in-place if possible.
+
+    The outer product is added one row at a time in order to avoid a
+    temporary array of the full size.
+    """
+    shape = np.shape(x) + np.shape(y)[-1:]
+    if np.shape(C) != utils.broadcasted_shape(np.shape(C), shape):
+        return C + x[...,:,np.newaxis] * y[...,np.newaxis,:]
+    for d in range(np.shape(x)[-1]):
+        C[...,d,:] += x[...,d,np.newaxis] * y
+    return C
+
+
 class TemplateGaussianMarkovChainDistribution(ExponentialFamilyDistribution):
     """
     Sub-classes implement distribution specific computations.
+
+    The block-tridiagonal system of the natural parameters is solved
+    either with sequential Kalman-type recursions (`solver='sequential'`)
+    or with cyclic reduction (`solver='cyclic'`), which has only O(log N)
+    sequential steps and is much faster for long chains.  The sequential
+    solver switches to the steady state in time-invariant parts of the
+    chain once the recursions have converged within the relative tolerance
+    `steady_state_tol`.
+
+    If `lengths` is given, the N time instances consist of independent
+    chains of the given lengths concatenated along the time axis. The
+    blocks coupling consecutive chains are zero, thus the solvers process
+    the packed chains as one block-tridiagonal system without padding.
     """
 
+    _solvers = ('sequential', 'cyclic')
+
+    steady_state_tol = 1e-12
     
-    def __init__(self, N, D):
+    def __init__(self, N, D, solver='sequential', lengths=None):
         self.N = N
         self.D = D
+        if solver not in self._solvers:
+            raise ValueError("Unknown solver %s for the Markov chain" 
+                             % (solver,))
+        self.solver = solver
+        self.lengths = lengths
+        if lengths is not None:
+            lengths = np.asarray(lengths, dtype=int)
+            if np.ndim(lengths) != 1 or np.any(lengths < 1):
+                raise ValueError("Lengths of the chains must be positive")
+            if np.sum(lengths) != N:
+                raise ValueError("Lengths of the chains do not sum to the "
+                                 "number of time instances")
+            # Start indices of the chains and the indices of the
+            # transitions between the chains
+            self.starts = np.cumsum(lengths) - lengths
+            self.breaks = self.starts[1:] - 1
+            # Mask for the transitions inside the chains
+            self.transitions = np.ones(N-1, dtype=bool)
+            self.transitions[self.breaks] = False
         super().__init__()
 
     def compute_message_to_parent(self, parent, index, u_self, *u_parents):
@@ -99,12 +149,29 @@ class TemplateGaussianMarkovChainDistribution(ExponentialFamilyDistribution):
         # sub-diagonal blocks so we would need to divide by two anyway.
         B = -phi[2]
 
-        (CovXnXn, CovXpXn, Xn, ldet) = linalg.block_banded_solve(A, B, y)
+        # A and B are temporary arrays, thus the solver may overwrite them
+        # with the covariance blocks
+        if self.solver == 'cyclic':
+            (CovXnXn, CovXpXn, Xn, ldet) = linalg.block_banded_cyclic_reduction(
+                A, 
+                B, 
+                y, 
+                overwrite=True)
+        else:
+            (CovXnXn, CovXpXn, Xn, ldet) = linalg.block_banded_solve(
+                A, 
+                B, 
+                y, 
+                overwrite=True,
+                tol=self.steady_state_tol)
 
         # Compute moments
         u0 = Xn
-        u1 = CovXnXn + Xn[...,:,np.newaxis] * Xn[...,np.newaxis,:]
-        u2 = CovXpXn + Xn[...,:-1,:,np.newaxis] * Xn[...,1:,np.newaxis,:]
+        u1 = _add_outer(CovXnXn, Xn, Xn)
+        u2 = _add_outer(CovXpXn, Xn[...,:-1,:], Xn[...,1:,:])
+        if self.lengths is not None:
+            # No cross-covariances between the packed chains
+            u2[...,self.breaks,:,:] = 0
         u = [u0, u1, u2]
 
         # Compute cumulant-generating function
@@ -122,6 +189,8 @@ class TemplateGaussianMarkovChainDistribution(ExponentialFamilyDistribution):
         u0 = x
         u1 = x[...,:,np.newaxis] * x[...,np.newaxis,:]
         u2 = x[...,:-1,:,np.newaxis] * x[...,1:,np.newaxis,:]
+        if self.lengths is not None:
+            u2[...,self.breaks,:,:] = 0
         u = [u0, u1, u2]
 
         f = -0.5 * np.shape(x)[-2] * np.shape(x)[-1] * np.log(2*np.pi)
@@ -275,6 +344,9 @@ class GaussianMarkovChainDistribution(TemplateGaussianMarkovChainDistribution):
             XnXn = u[1]
             XpXn = u[2]
             v = u_v[0]
+            if self.lengths is not None:
+                # Ignore the transitions between the packed chains
+                v = v * self.transitions[:,np.newaxis]
             m0 = v[...,np.newaxis] * XpXn.swapaxes(-1,-2)
             # The following message matrix could be huge, so let's use a help
             # function which computes sum(v*XnXn) without computing the huge
@@ -294,6 +366,10 @@ class GaussianMarkovChainDistribution(TemplateGaussianMarkovChainDistribution):
                   + np.einsum('...ik,...ki->...i', A, XpXn)
                   - 0.5*np.einsum('...ikl,...kl->...i', AA, XnXn[...,:-1,:,:]))
             m1 = 0.5
+            if self.lengths is not None:
+                # Ignore the transitions between the packed chains
+                m0 = m0 * self.transitions[:,np.newaxis]
+                m1 = m1 * self.transitions[:,np.newaxis]
         elif index == 4: # N
             raise NotImplementedError()
 
@@ -357,12 +433,22 @@ class GaussianMarkovChainDistribution(TemplateGaussianMarkovChainDistribution):
         phi1 = np.zeros(plates_phi1+(N,D,D))
         phi2 = np.zeros(plates_phi2+(N-1,D,D))
 
+        if self.lengths is not None:
+            # The packed chains start from the initial state distribution and
+            # there are no transitions between the chains
+            starts = self.starts
+            v = v * self.transitions[:,np.newaxis]
+        else:
+            starts = [0]
+
         # Parameters for x0
-        phi0[...,0,:] = np.einsum('...ik,...k->...i', Lambda, mu)
-        phi1[...,0,:,:] = Lambda
+        phi0[...,starts,:] = np.einsum('...ik,...k->...i', 
+                                       Lambda, 
+                                       mu)[...,np.newaxis,:]
+        phi1[..., 1:, :, :] = v[...,np.newaxis]*np.identity(D)
+        phi1[...,starts,:,:] = Lambda[...,np.newaxis,:,:]
 
         # Diagonal blocks: -0.5 * (V_i + A_{i+1}' * V_{i+1} * A_{i+1})
-        phi1[..., 1:, :, :] = v[...,np.newaxis]*np.identity(D)
         phi1[..., :-1, :, :] += np.einsum('...kij,...k->...ij', AA, v)
         phi1 *= -0.5
 
@@ -377,6 +463,15 @@ class GaussianMarkovChainDistribution(TemplateGaussianMarkovChainDistribution):
         """
         Compute CGF using the moments of the parents.
         """
+        if self.lengths is not None:
+            # Sum over the packed chains ignoring the transitions between
+            # the chains
+            g0 = -0.5 * np.einsum('...ij,...ij->...', u_mu[1], u_Lambda[0])
+            g1 = 0.5 * u_Lambda[1]
+            logdet_v = utils.atleast_nd(u_v[1], 2)
+            g2 = 0.5 * np.sum(self.transitions[:,np.newaxis] * logdet_v,
+                              axis=(-1,-2))
+            return len(self.starts) * (g0 + g1) + g2
         return _compute_cgf_for_gaussian_markov_chain(u_mu[1],
                                                       u_Lambda[0],
                                                       u_Lambda[1],
@@ -457,6 +552,19 @@ class GaussianMarkovChain(_TemplateGaussianMarkovChain):
 
     Time dimension is over the last plate.
 
+    Optional keyword argument `solver` selects the algorithm for the
+    smoothing: 'sequential' (default) uses Kalman-type forward and
+    backward recursions and 'cyclic' uses cyclic reduction, which is
+    faster for long chains. The same keyword is accepted by the other
+    Gaussian Markov chain nodes.
+
+    Optional keyword argument `lengths` packs several independent chains of
+    varying lengths into one node: the chains are concatenated along the
+    time axis and `lengths` gives the length of each chain. Each chain
+    starts from `mu` and `Lambda`, and the messages to the shared dynamics
+    `A` and `v` are summed over the transitions inside the chains, so the
+    chains need not be padded to the same length.
+
     Hmm.. The number of time instances is one more than the plates in
     A and V. Input N -> Output N+1.
 
@@ -486,7 +594,8 @@ class GaussianMarkovChain(_TemplateGaussianMarkovChain):
 
     @classmethod
     @ensureparents
-    def _constructor(cls, mu, Lambda, A, v, n=None, **kwargs):
+    def _constructor(cls, mu, Lambda, A, v, n=None, solver='sequential',
+                     lengths=None, **kwargs):
         """
         Constructs distribution and moments objects.
         
@@ -515,6 +624,11 @@ class GaussianMarkovChain(_TemplateGaussianMarkovChain):
         if n_v != n_A and n_v != 1 and n_A != 1:
             raise Exception("Plates of A and v are giving different number of time instances")
         n_A = max(n_v, n_A)
+        if lengths is not None:
+            if n is not None and n != np.sum(lengths):
+                raise ValueError("The number of time instances must equal "
+                                 "the total length of the packed chains")
+            n = int(np.sum(lengths))
         if n is None:
             if n_A == 1:
                 raise Exception("The number of time instances could not be "
@@ -567,7 +681,8 @@ class GaussianMarkovChain(_TemplateGaussianMarkovChain):
 
         
         dims = ( (M,D), (M,D,D), (M-1,D,D) )
-        distribution = GaussianMarkovChainDistribution(M, D)
+        distribution = GaussianMarkovChainDistribution(M, D, solver=solver,
+                                                       lengths=lengths)
 
         parents = [mu, Lambda, A, v]
 
@@ -903,7 +1018,8 @@ class VaryingGaussianMarkovChain(_TemplateGaussianMarkovChain):
 
     @classmethod
     @ensureparents
-    def _constructor(cls, mu, Lambda, B, S, v, n=None, **kwargs):
+    def _constructor(cls, mu, Lambda, B, S, v, n=None, solver='sequential',
+                     **kwargs):
         """
         Constructs distribution and moments objects.
         
@@ -990,7 +1106,8 @@ class VaryingGaussianMarkovChain(_TemplateGaussianMarkovChain):
 
         
         dims = ( (M,D), (M,D,D), (M-1,D,D) )
-        distribution = VaryingGaussianMarkovChainDistribution(M, D)
+        distribution = VaryingGaussianMarkovChainDistribution(M, D,
+                                                              solver=solver)
 
         parents = [mu, Lambda, B, S, v]
 
@@ -1015,9 +1132,9 @@ class SwitchingGaussianMarkovChainDistribution(TemplateGaussianMarkovChainDistri
     """
 
 
-    def __init__(self, N, D, K):
+    def __init__(self, N, D, K, **kwargs):
         self.K = K
-        super().__init__(N, D)
+        super().__init__(N, D, **kwargs)
         
     def compute_message_to_parent(self, parent, index, u, u_mu, u_Lambda, u_B,
                                    u_Z, u_v):
@@ -1336,7 +1453,8 @@ class SwitchingGaussianMarkovChain(_TemplateGaussianMarkovChain):
 
 
     @classmethod
-    def _constructor(cls, mu, Lambda, B, Z, v, n=None, **kwargs):
+    def _constructor(cls, mu, Lambda, B, Z, v, n=None, solver='sequential',
+                     **kwargs):
         """
         Constructs distribution and moments objects.
         
@@ -1436,7 +1554,8 @@ class SwitchingGaussianMarkovChain(_TemplateGaussianMarkovChain):
 
         
         dims = ( (M,D), (M,D,D), (M-1,D,D) )
-        distribution = SwitchingGaussianMarkovChainDistribution(M, D, K)
+        distribution = SwitchingGaussianMarkovChainDistribution(M, D, K,
+                                                                solver=solver)
 
         parents = [mu, Lambda, B, Z, v]
 
@@ -31,8 +31,11 @@ from scipy import special
 from .expfamily import (ExponentialFamily,
                         ExponentialFamilyDistribution,
                         useconstructor)
-from .gaussian import GaussianMoments
-from .gamma import GammaMoments
+from .gaussian import (GaussianMoments,
+                       GaussianDistribution,
+                       Gaussian)
+from .gamma import (GammaMoments,
+                    GammaPriorMoments)
 from .wishart import (WishartMoments,
                       WishartPriorMoments)
 from .node import (Moments,
@@ -153,7 +156,7 @@ class GaussianWishartMoments(Moments):
         u0 = np.einsum('...ik,...k->...i', Lambda, x)
         u1 = np.einsum('...i,...ij,...j->...', x, Lambda, x)
         u2 = np.copy(Lambda)
-        u3 = linalg.logdet_cov(Lambda)
+        u3 = utils.m_chol_logdet(utils.m_chol(Lambda))
 
         return [u0, u1, u2, u3]
     
@@ -177,45 +180,89 @@ class GaussianWishartMoments(Moments):
 
 
 class GaussianGammaISODistribution(ExponentialFamilyDistribution):
-    """
+    r"""
     Class for the VMP formulas of Gaussian-Gamma-ISO variables.
+
+    The variable is a pair :math:`(\mathbf{x}, \tau)` with
+
+    .. math::
+
+        \mathbf{x}|\tau \sim \mathcal{N}(\boldsymbol{\mu}, \tau\mathbf{\Lambda}),
+
+        \tau \sim \mathcal{G}(a, b),
+
+    and moments :math:`[\tau\mathbf{x}, \tau\mathbf{xx}^T, \tau, \log\tau]`.
     """    
 
 
-    def compute_message_to_parent(self, parent, index, u, u_mu_Lambda, u_a, u_b):
+    def compute_message_to_parent(self, parent, index, u, u_mu, u_Lambda, u_a, u_b):
         """
         Compute the message to a parent node.
         """
         if index == 0:
-            raise NotImplementedError()
+            Lambda = u_Lambda[0]
+            tau = u[2][...,np.newaxis,np.newaxis]
+            return [utils.m_dot(Lambda, u[0]),
+                    -0.5 * tau * Lambda]
         elif index == 1:
-            raise NotImplementedError()
+            mu = u_mu[0]
+            mumu = u_mu[1]
+            tau = u[2][...,np.newaxis,np.newaxis]
+            xmu = utils.m_outer(u[0], mu)
+            return [-0.5 * (u[1] - xmu - xmu.swapaxes(-1,-2) + tau * mumu),
+                    0.5]
         elif index == 2:
-            raise NotImplementedError()
+            raise Exception("No analytic solution exists")
+        elif index == 3:
+            return [-u[2],
+                    u_a[0]]
         else:
             raise ValueError("Index out of bounds")
 
 
-    def compute_phi_from_parents(self, u_mu_Lambda, u_a, u_b, mask=True):
+    def compute_phi_from_parents(self, u_mu, u_Lambda, u_a, u_b, mask=True):
         """
         Compute the natural parameter vector given parent moments.
         """
-        raise NotImplementedError()
+        mu = u_mu[0]
+        mumu = u_mu[1]
+        Lambda = u_Lambda[0]
+        a = u_a[0]
+        b = u_b[0]
+        D = np.shape(Lambda)[-1]
+        return [utils.m_dot(Lambda, mu),
+                -0.5 * Lambda,
+                -0.5 * np.einsum('...ij,...ij->...', mumu, Lambda) - b,
+                a + 0.5*D]
 
 
     def compute_moments_and_cgf(self, phi, mask=True):
         """
         Compute the moments and :math:`g(\phi)`.
         """
-        raise NotImplementedError()
+        (mu, L, a, b) = self._compute_parameters(phi)
+        Cov = utils.m_chol_inv(L)
+        tau = a / b
+        u0 = tau[...,np.newaxis] * mu
+        u1 = tau[...,np.newaxis,np.newaxis] * utils.m_outer(mu, mu) + Cov
+        u2 = tau
+        u3 = special.digamma(a) - np.log(b)
+        u = [u0, u1, u2, u3]
+        g = (0.5 * utils.m_chol_logdet(L)
+             + a * np.log(b)
+             - special.gammaln(a))
         return (u, g)
 
     
-    def compute_cgf_from_parents(self, u_mu_Lambda, u_a, u_b):
+    def compute_cgf_from_parents(self, u_mu, u_Lambda, u_a, u_b):
         """
         Compute :math:`\mathrm{E}_{q(p)}[g(p)]`
         """
-        raise NotImplementedError()
+        logdet_Lambda = u_Lambda[1]
+        a = u_a[0]
+        gammaln_a = u_a[1]
+        log_b = u_b[1]
+        g = 0.5 * logdet_Lambda + a * log_b - gammaln_a
         return g
 
     
@@ -223,13 +270,41 @@ class GaussianGammaISODistribution(ExponentialFamilyDistribution):
         """
         Compute the moments and :math:`f(x)` for a fixed value.
         """
-        raise NotImplementedError()
+        u = GaussianGammaISOMoments().compute_fixed_moments(x, alpha)
+        D = np.shape(x)[-1]
+        f = -np.log(alpha) - 0.5*D*np.log(2*np.pi)
         return (u, f)
 
+
+    @staticmethod
+    def _compute_parameters(phi):
+        """
+        Compute the mean vector, the Cholesky factor of the precision matrix
+        and the shape and rate of the precision scale from `phi`.
+        """
+        D = np.shape(phi[0])[-1]
+        L = utils.m_chol(-2*phi[1])
+        mu = utils.m_chol_solve(L, phi[0])
+        a = phi[3] - 0.5*D
+        b = -phi[2] - 0.5*np.einsum('...i,...i->...', mu, phi[0])
+        return (mu, L, a, b)
+
     
 class GaussianWishartDistribution(ExponentialFamilyDistribution):
-    """
+    r"""
     Class for the VMP formulas of Gaussian-Wishart variables.
+
+    The variable is a pair :math:`(\mathbf{x}, \mathbf{\Lambda})` with
+
+    .. math::
+
+        \mathbf{x}|\mathbf{\Lambda} \sim \mathcal{N}(\boldsymbol{\mu},
+        \alpha\mathbf{\Lambda}),
+
+        \mathbf{\Lambda} \sim \mathcal{W}(n, \mathbf{V}),
+
+    and moments :math:`[\mathbf{\Lambda x}, \mathbf{x}^T\mathbf{\Lambda x},
+    \mathbf{\Lambda}, \log|\mathbf{\Lambda}|]`.
     """    
 
 
@@ -238,13 +313,23 @@ class GaussianWishartDistribution(ExponentialFamilyDistribution):
         Compute the message to a parent node.
         """
         if index == 0:
-            raise NotImplementedError()
+            alpha = u_alpha[0]
+            return [utils.add_trailing_axes(alpha, 1) * u[0],
+                    -0.5 * utils.add_trailing_axes(alpha, 2) * u[2]]
         elif index == 1:
-            raise NotImplementedError()
+            mu = u_mu[0]
+            mumu = u_mu[1]
+            D = np.shape(u[0])[-1]
+            return [-0.5 * (u[1]
+                            - 2 * np.einsum('...i,...i->...', mu, u[0])
+                            + np.einsum('...ij,...ij->...', mumu, u[2])),
+                    0.5 * D]
         elif index == 2:
-            raise NotImplementedError()
+            n = u_n[0]
+            return [-0.5 * u[2],
+                    0.5 * n]
         elif index == 3:
-            raise NotImplementedError()
+            raise Exception("No analytic solution exists")
         else:
             raise ValueError("Index out of bounds")
 
@@ -253,14 +338,33 @@ class GaussianWishartDistribution(ExponentialFamilyDistribution):
         """
         Compute the natural parameter vector given parent moments.
         """
-        raise NotImplementedError()
+        mu = u_mu[0]
+        mumu = u_mu[1]
+        alpha = u_alpha[0]
+        V = u_V[0]
+        n = u_n[0]
+        return [utils.add_trailing_axes(alpha, 1) * mu,
+                -0.5 * alpha,
+                -0.5 * (V + utils.add_trailing_axes(alpha, 2) * mumu),
+                0.5 * (n + 1)]
 
 
     def compute_moments_and_cgf(self, phi, mask=True):
         """
         Compute the moments and :math:`g(\phi)`.
         """
-        raise NotImplementedError()
+        (mu, alpha, U, n) = self._compute_parameters(phi)
+        D = np.shape(mu)[-1]
+        logdet_V = utils.m_chol_logdet(U)
+        Lambda = utils.add_trailing_axes(n, 2) * utils.m_chol_inv(U)
+        u0 = utils.m_dot(Lambda, mu)
+        u1 = np.einsum('...i,...i->...', mu, u0) + D / alpha
+        u2 = Lambda
+        u3 = -logdet_V + D*np.log(2) + utils.m_digamma(0.5*n, D)
+        u = [u0, u1, u2, u3]
+        g = (0.5 * D * np.log(alpha)
+             + 0.5 * n * (logdet_V - D*np.log(2))
+             - special.multigammaln(0.5*n, D))
         return (u, g)
 
     
@@ -268,7 +372,14 @@ class GaussianWishartDistribution(ExponentialFamilyDistribution):
         """
         Compute :math:`\mathrm{E}_{q(p)}[g(p)]`
         """
-        raise NotImplementedError()
+        D = np.shape(u_V[0])[-1]
+        log_alpha = u_alpha[1]
+        logdet_V = u_V[1]
+        n = u_n[0]
+        gammaln_n = u_n[1]
+        g = (0.5 * D * log_alpha
+             + 0.5 * n * (logdet_V - D*np.log(2))
+             - gammaln_n)
         return g
 
     
@@ -276,12 +387,132 @@ class GaussianWishartDistribution(ExponentialFamilyDistribution):
         """
         Compute the moments and :math:`f(x)` for a fixed value.
         """
-        raise NotImplementedError()
+        u = GaussianWishartMoments().compute_fixed_moments(x, Lambda)
+        D = np.shape(x)[-1]
+        f = -0.5*(D+1)*u[3] - 0.5*D*np.log(2*np.pi)
         return (u, f)
 
+
+    @staticmethod
+    def _compute_parameters(phi):
+        """
+        Compute the mean vector, the precision scale, the Cholesky factor of
+        the scale matrix and the degrees of freedom from `phi`.
+        """
+        alpha = -2*phi[1]
+        mu = phi[0] / utils.add_trailing_axes(alpha, 1)
+        n = 2*phi[3] - 1
+        V = -2*phi[2] - utils.add_trailing_axes(alpha, 2) * utils.m_outer(mu, mu)
+        U = utils.m_chol(V)
+        return (mu, alpha, U, n)
+
+
+class GaussianGammaISO(ExponentialFamily):
+    r"""
+    Node for Gaussian-gamma (isotropic) random variables.
+
+    The prior:
     
-class GaussianWishart(ExponentialFamily):
+    .. math::
+
+        p(x, \tau| \mu, \Lambda, a, b)
+
+        p(x|\tau, \mu, \Lambda) = \mathcal{N}(x | \mu, \tau^{-1} \Lambda^{-1})
+
+        p(\tau|a, b) = \mathcal{G}(\tau | a, b)
+
+    The posterior approximation :math:`q(x, \tau)` has the same Gaussian-gamma
+    form. Thus, the dependency between the mean vector and the precision scale
+    is kept in the posterior approximation which usually leads to much faster
+    convergence than separate Gaussian and gamma nodes. The node can be used
+    as the parent of :class:`GaussianFromGaussianGamma` nodes.
     """
+    
+    _moments = GaussianGammaISOMoments()
+    _parent_moments = (GaussianMoments(1),
+                       WishartMoments(),
+                       GammaPriorMoments(),
+                       GammaMoments())
+    _distribution = GaussianGammaISODistribution()
+    
+
+    @classmethod
+    @ensureparents
+    def _constructor(cls, mu, Lambda, a, b, **kwargs):
+        """
+        Constructs distribution and moments objects.
+
+        This method is called if useconstructor decorator is used for __init__.
+
+        `mu` is the mean/location vector
+        `Lambda` is the precision matrix
+        `a` is the shape of the precision scale
+        `b` is the rate of the precision scale
+        """
+
+        D = mu.dims[0][0]
+
+        # Check shapes
+        if mu.dims != ( (D,), (D,D) ):
+            raise ValueError("Mean vector has wrong shape")
+
+        if Lambda.dims != ( (D,D), () ):
+            raise ValueError("Precision matrix has wrong shape")
+
+        if tuple(a.dims) != ( (), () ):
+            raise ValueError("Shape has wrong shape")
+
+        if b.dims != ( (), () ):
+            raise ValueError("Rate has wrong shape")
+
+        dims = ( (D,), (D,D), (), () )
+
+        parents = [mu, Lambda, a, b]
+
+        return (parents,
+                kwargs,
+                dims,
+                cls._total_plates(kwargs.get('plates'),
+                                  cls._distribution.plates_from_parent(0, mu.plates),
+                                  cls._distribution.plates_from_parent(1, Lambda.plates),
+                                  cls._distribution.plates_from_parent(2, a.plates),
+                                  cls._distribution.plates_from_parent(3, b.plates)),
+                cls._distribution, 
+                cls._moments, 
+                cls._parent_moments)
+
+    
+    def random(self):
+        """
+        Draw a random sample from the distribution.
+        """
+        (mu, L, a, b) = self._distribution._compute_parameters(self.phi)
+        tau = np.random.gamma(a, 1/b, size=self.plates)
+        z = np.random.normal(0, 1, self.get_shape(0))
+        # Compute mu + inv(L)*z/sqrt(tau) where Lambda = L'*L
+        z = utils.m_solve_triangular(L, z, lower=False)
+        x = mu + z / np.sqrt(tau)[...,np.newaxis]
+        return (x, tau)
+
+    
+    def show(self):
+        """
+        Print the distribution using standard parameterization.
+        """
+        (mu, L, a, b) = self._distribution._compute_parameters(self.phi)
+        print("%s ~ Gaussian-gamma(mu, Lambda, a, b)" % self.name)
+        print("  mu =")
+        print(mu)
+        print("  Lambda =")
+        print(-2*self.phi[1])
+        print("  a =")
+        print(a)
+        print("  b =")
+        print(b)
+
+    
+class GaussianWishart(ExponentialFamily):
+    r"""
     Node for Gaussian-Wishart random variables.
 
     The prior:
@@ -290,24 +521,21 @@ class GaussianWishart(ExponentialFamily):
 
         p(x, \Lambda| \mu, \alpha, V, n)
 
-        p(x|\Lambda, \mu, \alpha) = \mathcal(N)(x | \mu, \alpha^{-1} Lambda^{-1})
+        p(x|\Lambda, \mu, \alpha) = \mathcal{N}(x | \mu, \alpha^{-1} \Lambda^{-1})
 
-        p(\Lambda|V, n) = \mathcal(W)(\Lambda | n, V)
+        p(\Lambda|V, n) = \mathcal{W}(\Lambda | n, V)
 
-    The posterior approximation :math:`q(x, \Lambda)` has the same Gaussian-Wishart form.
+    The posterior approximation :math:`q(x, \Lambda)` has the same
+    Gaussian-Wishart form. The node can be used as the parent of
+    :class:`GaussianFromGaussianWishart` nodes.
     """
     
     _moments = GaussianWishartMoments()
-    _parent_moments = (GaussianGammaMoments(),
-                       GammaMoments(),
-                       WishartMoments(),
-                       WishartPriorMoments())
     _distribution = GaussianWishartDistribution()
     
 
     @classmethod
-    @ensureparents
-    def _constructor(cls, mu, alpha, V, n, plates_lambda=None, plates_x=None, **kwargs):
+    def _constructor(cls, mu, alpha, V, n, **kwargs):
         """
         Constructs distribution and moments objects.
 
@@ -319,10 +547,21 @@ class GaussianWishart(ExponentialFamily):
         `n` is the degrees of freedom
         """
 
+        mu = cls._ensure_moments(mu, GaussianMoments(1))
         D = mu.dims[0][0]
 
+        # The moments of the degrees of freedom depend on the dimensionality
+        parent_moments = (GaussianMoments(1),
+                          GammaMoments(),
+                          WishartMoments(),
+                          WishartPriorMoments(D))
+
+        alpha = cls._ensure_moments(alpha, parent_moments[1])
+        V = cls._ensure_moments(V, parent_moments[2])
+        n = cls._ensure_moments(n, parent_moments[3])
+
         # Check shapes
-        if mu.dims != ( (D,), (D,D), (), () ):
+        if mu.dims != ( (D,), (D,D) ):
             raise ValueError("Mean vector has wrong shape")
 
         if alpha.dims != ( (), () ):
@@ -336,8 +575,11 @@ class GaussianWishart(ExponentialFamily):
 
         dims = ( (D,), (), (D,D), () )
 
-        return (dims,
+        parents = [mu, alpha, V, n]
+
+        return (parents,
                 kwargs,
+                dims,
                 cls._total_plates(kwargs.get('plates'),
                                   cls._distribution.plates_from_parent(0, mu.plates),
                                   cls._distribution.plates_from_parent(1, alpha.plates),
@@ -345,18 +587,167 @@ class GaussianWishart(ExponentialFamily):
                                   cls._distribution.plates_from_parent(3, n.plates)),
                 cls._distribution, 
                 cls._moments, 
-                cls._parent_moments)
+                parent_moments)
+
 
-    
     def random(self):
         """
         Draw a random sample from the distribution.
         """
-        raise NotImplementedError()
+        (mu, alpha, U, n) = self._distribution._compute_parameters(self.phi)
+        D = self.dims[0][0]
+        # Sample the precision matrix using the Bartlett decomposition of
+        # Wishart(n, inv(V))
+        n = np.broadcast_to(n, self.plates)
+        A = np.tril(np.random.normal(0, 1, self.plates + (D,D)), -1)
+        A += np.einsum('...i,ij->...ij',
+                       np.sqrt(np.random.chisquare(n[...,np.newaxis]
+                                                   - np.arange(D))),
+                       np.identity(D))
+        # V = U'*U, thus inv(V) = inv(U)*inv(U)'
+        B = np.einsum('...ik,...kj->...ij', np.linalg.inv(U), A)
+        Lambda = np.einsum('...ik,...jk->...ij', B, B)
+        # Sample the vector: mu + inv(L)*z where alpha*Lambda = L'*L
+        L = utils.m_chol(utils.add_trailing_axes(alpha, 2) * Lambda)
+        z = np.random.normal(0, 1, self.get_shape(0))
+        x = mu + utils.m_solve_triangular(L, z, lower=False)
+        return (x, Lambda)
 
     
     def show(self):
         """
         Print the distribution using standard parameterization.
         """
-        raise NotImplementedError()
+        (mu, alpha, U, n) = self._distribution._compute_parameters(self.phi)
+        print("%s ~ Gaussian-Wishart(mu, alpha, V, n)" % self.name)
+        print("  mu =")
+        print(mu)
+        print("  alpha =")
+        print(alpha)
+        print("  V =")
+        print(-2*self.phi[2] - 
+              utils.add_trailing_axes(alpha, 2) * utils.m_outer(mu, mu))
+        print("  n =")
+        print(n)
+
+
+class GaussianFromGaussianGammaDistribution(GaussianDistribution):
+    """
+    Class for the VMP formulas of Gaussian variables with a Gaussian-gamma
+    parent.
+    """
+
+
+    def compute_message_to_parent(self, parent, index, u, u_mu_tau):
+        if index == 0:
+            D = np.shape(u[0])[-1]
+            return [u[0],
+                    -0.5 * np.identity(D),
+                    -0.5 * np.einsum('...ii->...', u[1]),
+                    0.5 * D]
+        else:
+            raise ValueError("Index out of bounds")
+
+    def compute_phi_from_parents(self, u_mu_tau, mask=True):
+        D = np.shape(u_mu_tau[0])[-1]
+        return [u_mu_tau[0],
+                -0.5 * utils.add_trailing_axes(u_mu_tau[2], 2) * np.identity(D)]
+
+    def compute_cgf_from_parents(self, u_mu_tau):
+        D = np.shape(u_mu_tau[0])[-1]
+        return (-0.5 * np.einsum('...ii->...', u_mu_tau[1])
+                + 0.5 * D * u_mu_tau[3])
+
+
+class GaussianFromGaussianWishartDistribution(GaussianDistribution):
+    """
+    Class for the VMP formulas of Gaussian variables with a Gaussian-Wishart
+    parent.
+    """
+
+
+    def compute_message_to_parent(self, parent, index, u, u_mu_Lambda):
+        if index == 0:
+            return [u[0],
+                    -0.5,
+                    -0.5 * u[1],
+                    0.5]
+        else:
+            raise ValueError("Index out of bounds")
+
+    def compute_phi_from_parents(self, u_mu_Lambda, mask=True):
+        return [u_mu_Lambda[0],
+                -0.5 * u_mu_Lambda[2]]
+
+    def compute_cgf_from_parents(self, u_mu_Lambda):
+        return -0.5 * u_mu_Lambda[1] + 0.5 * u_mu_Lambda[3]
+
+
+class GaussianFromGaussianGamma(Gaussian):
+    r"""
+    Node for Gaussian variables with isotropic precision given by a
+    Gaussian-gamma parent.
+
+    .. math::
+
+        y \sim \mathcal{N}(x, \tau^{-1} I), \quad (x, \tau) \sim
+        \mathcal{NG}(\mu, \Lambda, a, b)
+    """
+
+    _distribution = GaussianFromGaussianGammaDistribution()
+    _parent_moments = (GaussianGammaISOMoments(),)
+
+
+    @classmethod
+    @ensureparents
+    def _constructor(cls, mu_tau, **kwargs):
+        """
+        Constructs distribution and moments objects.
+        """
+        D = mu_tau.dims[0][0]
+        if mu_tau.dims != ( (D,), (D,D), (), () ):
+            raise ValueError("Parent has wrong dimensionality")
+        dims = ( (D,), (D,D) )
+        return ([mu_tau],
+                kwargs,
+                dims, 
+                cls._total_plates(kwargs.get('plates'),
+                                  cls._distribution.plates_from_parent(0, mu_tau.plates)),
+                cls._distribution, 
+                cls._moments, 
+                cls._parent_moments)
+
+
+class GaussianFromGaussianWishart(Gaussian):
+    r"""
+    Node for Gaussian variables with precision given by a Gaussian-Wishart
+    parent.
+
+    .. math::
+
+        y \sim \mathcal{N}(x, \Lambda^{-1}), \quad (x, \Lambda) \sim
+        \mathcal{NW}(\mu, \alpha, V, n)
+    """
+
+    _distribution = GaussianFromGaussianWishartDistribution()
+    _parent_moments = (GaussianWishartMoments(),)
+
+
+    @classmethod
+    @ensureparents
+    def _constructor(cls, mu_Lambda, **kwargs):
+        """
+        Constructs distribution and moments objects.
+        """
+        D = mu_Lambda.dims[0][0]
+        if mu_Lambda.dims != ( (D,), (), (D,D), () ):
+            raise ValueError("Parent has wrong dimensionality")
+        dims = ( (D,), (D,D) )
+        return ([mu_Lambda],
+                kwargs,
+                dims, 
+                cls._total_plates(kwargs.get('plates'),
+                                  cls._distribution.plates_from_parent(0, mu_Lambda.plates)),
+                cls._distribution, 
+                cls._moments, 
+                cls._parent_moments)
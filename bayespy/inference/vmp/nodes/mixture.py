@@ -23,6 +23,7 @@
 
 import warnings
 import numpy as np
+import scipy.sparse as sp
 
 from bayespy.utils import utils
 
@@ -31,17 +32,57 @@ from .expfamily import ExponentialFamily, \
                        useconstructor
                        
 from .categorical import Categorical, \
-                         CategoricalMoments
+                         CategoricalMoments, \
+                         _check_categories, \
+                         _categorical_counts, \
+                         _categorical_gather
 
 class MixtureDistribution(ExponentialFamilyDistribution):
 
     def __init__(self, distribution, cluster_plate, n_clusters, ndims, 
-                 ndims_parents):
+                 ndims_parents, top_k=None, threshold=None, max_memory=None):
         self.distribution = distribution
         self.cluster_plate = cluster_plate
         self.ndims = ndims
         self.ndims_parents = ndims_parents
         self.K = n_clusters
+        self.top_k = top_k
+        self.threshold = threshold
+        self.max_memory = max_memory
+
+    def is_truncated(self):
+        """
+        Check whether the responsibilities are truncated in the messages to
+        the cluster parameters.
+        """
+        return self.top_k is not None or self.threshold is not None
+
+    def truncate_responsibilities(self, p):
+        """
+        Select the responsibilities used in the messages to the cluster
+        parameters.
+
+        Keeps at most `top_k` largest responsibilities that are at least
+        `threshold` for each element, but always the largest one. The retained
+        responsibilities are rescaled to have the original sum.
+
+        Shape(p)      = [N,K]
+
+        Returns the element indices, the cluster indices and the retained
+        responsibilities of the non-zero pairs.
+        """
+        keep = np.ones(np.shape(p), dtype=bool)
+        if self.top_k is not None and self.top_k < self.K:
+            ind = np.argpartition(-p, self.top_k-1, axis=-1)[:,self.top_k:]
+            np.put_along_axis(keep, ind, False, axis=-1)
+        if self.threshold is not None:
+            keep &= (p >= self.threshold)
+        np.put_along_axis(keep, np.argmax(p, axis=-1)[:,None], True, axis=-1)
+        w = np.where(keep, p, 0)
+        total = np.sum(w, axis=-1, keepdims=True)
+        w *= np.sum(p, axis=-1, keepdims=True) / np.where(total > 0, total, 1)
+        (n, k) = np.nonzero(w)
+        return (n, k, w[n,k])
 
     def compute_message_to_parent(self, parent, index, u, *u_parents):
 
@@ -303,20 +344,378 @@ class MixtureDistribution(ExponentialFamilyDistribution):
 
 class Mixture(ExponentialFamily):
 
-
     @useconstructor
     def __init__(self, *args, cluster_plate=-1, **kwargs):
-        self.cluster_plate = cluster_plate
+        """
+        Create mixture node.
+
+        The messages to the cluster parameters weigh the messages of all the
+        clusters with the responsibilities, which is expensive for a large
+        number of clusters. Optionally, the responsibilities can be truncated
+        in these messages: `top_k` keeps only the given number of the most
+        probable clusters for each element and `threshold` drops the
+        responsibilities smaller than the given value. The messages are then
+        accumulated over the retained pairs of elements and clusters only.
+        The message to the cluster assignments and the lower bound are not
+        affected.
+
+        The messages to the cluster parameters for all elements and clusters
+        may also be too large to fit in memory, for instance, for Gaussian
+        mixtures with full covariance matrices. If `max_memory` (in bytes) is
+        given, these messages are computed in chunks of the first plate axis
+        and summed to the plates of the parent chunk by chunk, so that the
+        temporary arrays of each chunk are approximately within the budget.
+        """
+        self.cluster_plate = self._distribution.cluster_plate
         super().__init__(*args, **kwargs)
+
+    def _compress_observations(self, x, *args, mask=True):
+        """
+        Keep fully observed values of a categorical mixture as integer indices.
+
+        The messages to the cluster parameters are computed by weighting the
+        counts of the indices with the responsibilities, thus arrays of shape
+        (...,K,...,D) are not formed.
+        """
+        if (not isinstance(self._moments, CategoricalMoments)
+            or not np.all(mask)
+            or np.shape(x) != self.plates):
+            return None
+        return _check_categories(x, self.dims[0][0])
+
+    def _compressed_moments(self):
+        return self._moments.compute_fixed_moments(self._observations)
+
+    def _compute_categorical_logpdf(self, u_parents):
+        """
+        Compute the log-probabilities of the observed categories for each
+        cluster.
+
+        Shape(result) = [Nn,..,N0,K]
+        """
+        distribution = self._distribution.distribution
+        phi = distribution.compute_phi_from_parents(*(u_parents[1:]))[0]
+        g = distribution.compute_cgf_from_parents(*(u_parents[1:]))
+        # Move the cluster axis to the last plate axis:
+        # Shape(phi)    = [Nn,..,N0,K,D]
+        cluster_axis = self.cluster_plate - 1
+        if np.ndim(phi) >= abs(cluster_axis):
+            phi = utils.moveaxis(phi, cluster_axis, -2)
+        else:
+            phi = phi[...,np.newaxis,:]
+        L = _categorical_gather(phi, self._observations[...,np.newaxis])
+        if np.ndim(g) >= abs(self.cluster_plate):
+            L = L + utils.moveaxis(g, self.cluster_plate, -1)
+        else:
+            L = L + np.asanyarray(g)[...,np.newaxis]
+        return L
+
+    def _get_message_and_mask_to_parent(self, index):
+        if self._observations is not None and index == 0:
+            u_parents = self._message_from_parents(exclude=index)
+            m = [self._compute_categorical_logpdf([None] + u_parents[1:])]
+            mask = self._distribution.compute_mask_to_parent(index, self.mask)
+            return (m, mask)
+        return super()._get_message_and_mask_to_parent(index)
+
+    def _truncated_message_to_parent(self, index):
+        """
+        Compute the message to a cluster parameter using the truncated
+        responsibilities.
+
+        The moments of the retained pairs of elements and clusters are
+        gathered before computing the messages, thus arrays of shape
+        [Nn,..,K,..,N0,Dd,..,D0] are not formed. Returns None if the parent
+        has other plates than the cluster plate.
+        """
+        distribution = self._distribution
+        parent = self.parents[index]
+        K = distribution.K
+
+        # Plates of the mixed distribution
+        plates = list(self.plates)
+        plates.insert(len(plates) + self.cluster_plate + 1, K)
+        plates = tuple(plates)
+        cluster_axis = len(plates) + self.cluster_plate
+        plates_parent = tuple(K if j == cluster_axis else 1
+                              for j in range(len(plates)))
+        if (len(parent.plates) > len(plates)
+            or parent.plates != plates_parent[len(plates)-len(parent.plates):]
+            or (distribution.distribution.plates_to_parent(index-1, plates)
+                != plates)):
+            return None
+
+        # Retained responsibilities of the masked elements
+        # Shape(p)      = [N,K]
+        p = self.parents[0].get_moments()[0]
+        p = np.reshape(np.broadcast_to(p, self.plates + (K,)), (-1, K))
+        mask = np.reshape(np.broadcast_to(self.mask, self.plates), (-1, 1))
+        (n, k, w) = distribution.truncate_responsibilities(mask * p)
+        ind = list(np.unravel_index(n, self.plates)) if self.plates else []
+        ind.insert(cluster_axis, k)
+
+        # Gather the moments of the retained pairs:
+        # Shape(u)      = [nnz,Dd,..,D0]
+        def gather(u, ndim):
+            u = utils.atleast_nd(u, ndim)
+            shape = np.shape(u)[:np.ndim(u)-ndim]
+            if len(shape) == 0:
+                return u[np.newaxis]
+            return u[tuple(ind_j if size > 1 else np.zeros_like(k)
+                           for (ind_j, size) in zip(ind[len(ind)-len(shape):],
+                                                    shape))]
+        u_self = [gather(np.expand_dims(u, axis=self.cluster_plate-ndim), ndim)
+                  for (u, ndim) in zip(self.get_moments(), self.ndims)]
+        u_parents = self._message_from_parents(exclude=index)
+        u_parents = [None if u_j is None else
+                     [gather(u_ji, len(dims_ji)) 
+                      for (u_ji, dims_ji) in zip(u_j, self.parents[j].dims)]
+                     for (j, u_j) in enumerate(u_parents[1:], start=1)]
+
+        # Message from the mixed distribution for the retained pairs
+        # Shape(m)      = [nnz,Dd,..,D0]
+        m = distribution.distribution.compute_message_to_parent(
+            parent,
+            index-1,
+            u_self,
+            *u_parents)
+
+        # Sum the messages weighted by the responsibilities for each cluster
+        for i in range(len(m)):
+            if m[i] is None:
+                continue
+            D = len(parent.dims[i])
+            m_i = np.asanyarray(m[i])
+            m_i = np.reshape(m_i, (1,)*(1+D-np.ndim(m_i)) + np.shape(m_i))
+            if np.shape(m_i)[0] == 1:
+                # The message does not depend on the elements, thus only the
+                # sums of the responsibilities are needed
+                weights = np.bincount(k, weights=w, minlength=K)
+                m_i = utils.add_trailing_axes(weights, D) * m_i
+            else:
+                W = sp.csr_matrix((w, (k, np.arange(len(k)))),
+                                  shape=(K, len(k)))
+                m_i = W.dot(np.reshape(m_i, (len(k), -1)))
+            m[i] = np.reshape(m_i, parent.get_shape(i))
+
+        return m
+
+    def _fused_message_to_parent(self, index):
+        """
+        Compute the message to a cluster parameter from the weighted moments
+        of the clusters.
+
+        The message of an exponential family distribution to a parent is an
+        affine function of the moments of the variable. Thus, the sum of the
+        messages weighted by the responsibilities of cluster k equals the
+        message for the weighted mean of the moments multiplied by the total
+        weight of the cluster. The weighted moments are summed over the plates
+        with einsum and only arrays of shape [K,..,Dd,..,D0] are formed.
+        Returns None if some parent of the mixed distribution has other plates
+        than the cluster plate.
+        """
+        distribution = self._distribution
+        parent = self.parents[index]
+        K = distribution.K
+
+        # Plates of the mixed distribution
+        plates = list(self.plates)
+        plates.insert(len(plates) + self.cluster_plate + 1, K)
+        plates = tuple(plates)
+        cluster_axis = len(plates) + self.cluster_plate
+        plates_parent = tuple(K if j == cluster_axis else 1
+                              for j in range(len(plates)))
+        for j in range(1, len(self.parents)):
+            if (not utils.is_shape_subset(self.parents[j].plates, 
+                                          plates_parent)
+                or (distribution.distribution.plates_to_parent(j-1, plates)
+                    != plates)):
+                return None
+
+        # Weights of the elements for the clusters
+        # Shape(w)      = [Nn,..,N0,K]
+        p = self.parents[0].get_moments()[0]
+        mask = np.asanyarray(self.mask)
+        w = p * mask[...,np.newaxis]
+        plates_w = np.shape(w)[:-1]
+
+        # Total weights of the clusters
+        # Shape(n)      = [K]
+        n = (self._plate_multiplier(self.plates, plates_w)
+             * np.sum(np.reshape(w, (-1,K)), axis=0))
+
+        # Weighted mean moments of the clusters:
+        # Shape(u)      = [K,1,..,1,Dd,..,D0]
+        plates_cluster = (K,) + (1,)*(-self.cluster_plate-1)
+        u = list()
+        for (u_i, ndim) in zip(self.get_moments(), self.ndims):
+            u_i = np.expand_dims(u_i, axis=-ndim-1)
+            w_i = utils.add_trailing_axes(w, ndim)
+            axis = tuple(range(-max(np.ndim(u_i), np.ndim(w_i)), -ndim-1))
+            r = self._plate_multiplier(self.plates, 
+                                       plates_w, 
+                                       np.shape(u_i)[:-ndim-1])
+            u_i = r * utils.sum_multiply(w_i, u_i, axis=axis)
+            u_i /= utils.add_trailing_axes(np.where(n > 0, n, 1), ndim)
+            u.append(np.reshape(u_i, plates_cluster + np.shape(u_i)[1:]))
+
+        # Message from the mixed distribution for the mean moments
+        u_parents = self._message_from_parents(exclude=index)
+        m = distribution.distribution.compute_message_to_parent(
+            parent,
+            index-1,
+            u,
+            *(u_parents[1:]))
+
+        # Multiply by the total weights and sum to the plates of the parent
+        n = np.reshape(n, plates_cluster)
+        for i in range(len(m)):
+            if m[i] is None:
+                continue
+            D = len(parent.dims[i])
+            m[i] = utils.add_trailing_axes(n, D) * m[i]
+            shape_parent = parent.get_shape(i)
+            shape_msg = utils.broadcasted_shape(np.shape(m[i]), shape_parent)
+            axes = utils.axes_to_collapse(shape_msg, shape_parent)
+            m[i] = utils.sum_multiply(m[i], axis=axes, keepdims=True)
+            m[i] = utils.squeeze_to_dim(m[i], len(shape_parent))
+
+        return m
+
+    def _chunked_message_to_parent(self, index):
+        """
+        Compute the message to a cluster parameter in chunks of the first
+        plate axis.
+
+        Returns None if the message fits in the memory budget or it can not
+        be split into chunks.
+        """
+        distribution = self._distribution
+        parent = self.parents[index]
+        if len(self.plates) == 0 or self.plates[0] == 1:
+            return None
+
+        # Plates of the mixed distribution
+        plates = list(self.plates)
+        plates.insert(len(plates) + self.cluster_plate + 1, distribution.K)
+        plates = tuple(plates)
+        if distribution.distribution.plates_to_parent(index-1, plates) != plates:
+            return None
+
+        # The size of the largest message before summing over the plates
+        size = max(np.prod(plates + parent.dims[i]) 
+                   for i in range(len(parent.dims)))
+        nbytes = 8 * size
+        if nbytes <= distribution.max_memory:
+            return None
+        N = self.plates[0]
+        step = max(1, int(N * distribution.max_memory / nbytes))
+
+        # Chunks are taken from the first plate axis of this node. The parents
+        # of the mixed distribution have plates with the cluster axis.
+        ndim = len(self.plates)
+        ndim_mixture = ndim if self.cluster_plate == -ndim-1 else ndim + 1
+        u = self.get_moments()
+        u_parents = self._message_from_parents(exclude=index)
+        m = None
+        for start in range(0, N, step):
+            chunk = slice(start, min(start+step, N))
+            u_chunk = [utils.take_chunk(u_i, chunk, ndim+ndim_i)
+                       for (u_i, ndim_i) in zip(u, self.ndims)]
+            u_parents_chunk = [[utils.take_chunk(u_parents[0][0], 
+                                                 chunk, 
+                                                 ndim+1)]]
+            for (j, u_j) in enumerate(u_parents[1:], start=1):
+                if u_j is None:
+                    u_parents_chunk.append(None)
+                else:
+                    u_parents_chunk.append(
+                        [utils.take_chunk(u_ji, 
+                                          chunk, 
+                                          ndim_mixture+len(dims_ji))
+                         for (u_ji, dims_ji) in zip(u_j, 
+                                                    self.parents[j].dims)])
+            m_chunk = distribution.compute_message_to_parent(
+                parent,
+                index,
+                u_chunk,
+                *u_parents_chunk)
+            mask_chunk = distribution.compute_mask_to_parent(
+                index,
+                utils.take_chunk(self.mask, chunk, ndim))
+            plates_chunk = (chunk.stop-chunk.start,) + self.plates[1:]
+            m_chunk = self._compact_message_to_parent(
+                index,
+                m_chunk,
+                mask_chunk,
+                plates=distribution.plates_to_parent(index, plates_chunk))
+            if m is None:
+                m = m_chunk
+            else:
+                m = [m_i + m_chunk_i if m_i is not None else None
+                     for (m_i, m_chunk_i) in zip(m, m_chunk)]
+
+        return m
+
+    def _message_to_parent(self, index):
+        if index >= 1 and self._observations is None:
+            if self._distribution.is_truncated():
+                m = self._truncated_message_to_parent(index)
+                if m is not None:
+                    return m
+            m = self._fused_message_to_parent(index)
+            if m is not None:
+                return m
+            if self._distribution.max_memory is not None:
+                m = self._chunked_message_to_parent(index)
+                if m is not None:
+                    return m
+        return super()._message_to_parent(index)
+
+    def _compressed_message_to_parent(self, index):
+        if index == 0:
+            return None
+
+        # Count the observed categories weighted by the responsibilities:
+        # Shape(p)      = [Nn,..,N0,K]
+        # Shape(result) = [Nn,..,K,..,N0,D]
+        p = self.parents[0].get_moments()[0]
+        D = self.dims[0][0]
+        plates_parent = self.parents[index].plates
+        plates = self._plates_to_parent(index)
+        plates_parent = (1,)*(len(plates)-len(plates_parent)) + plates_parent
+        # The plates of the parent without the cluster axis
+        plates_counts = list(plates_parent)
+        K = plates_counts.pop(self.cluster_plate)
+        if K == 1:
+            m = _categorical_counts(self._observations, D, plates_counts)
+            m = np.expand_dims(m, self.cluster_plate-1)
+        else:
+            m = np.stack([_categorical_counts(self._observations, 
+                                              D, 
+                                              plates_counts,
+                                              weights=p[...,k])
+                          for k in range(K)],
+                         axis=self.cluster_plate-1)
+        return [np.reshape(m, self.parents[index].plates + (D,))]
+
+    def _compressed_lower_bound(self):
+        u_parents = self._message_from_parents()
+        L = self._compute_categorical_logpdf(u_parents)
+        return np.sum(u_parents[0][0] * L)
         
 
     @classmethod
-    def _constructor(cls, z, node_class, *args, cluster_plate=-1, **kwargs):
+    def _constructor(cls, z, node_class, *args, cluster_plate=-1, top_k=None,
+                     threshold=None, max_memory=None, **kwargs):
         """
         Constructs distribution and moments objects.
         """
         if cluster_plate >= 0:
             raise ValueError("Cluster plate axis must be negative")
+        if top_k is not None and top_k < 1:
+            raise ValueError("The number of retained clusters must be "
+                             "positive")
         
         # Get the stuff for the mixed distribution
         (parents, _, dims, mixture_plates, distribution, moments, parent_moments) = \
@@ -350,10 +749,13 @@ class Mixture(ExponentialFamily):
                                            cluster_plate,
                                            K,
                                            ndims,
-                                           ndims_parents)
+                                           ndims_parents,
+                                           top_k=top_k,
+                                           threshold=threshold,
+                                           max_memory=max_memory)
 
         # Add cluster assignments to parents
-        parent_moments = (CategoricalMoments(K),) + parent_moments
+        parent_moments = (CategoricalMoments(K),) + tuple(parent_moments)
 
         parents = [z] + list(parents)
 
@@ -25,7 +25,10 @@
 Module for the multinomial distribution node.
 """
 
+import warnings
+
 import numpy as np
+import scipy.sparse as sp
 from scipy import special
 
 from .expfamily import ExponentialFamily
@@ -51,6 +54,8 @@ class MultinomialMoments(Moments):
         """
 
         # Check that counts are valid
+        if sp.issparse(x):
+            x = x.toarray()
         x = np.asanyarray(x)
         if not utils.isinteger(x):
             raise ValueError("Counts must be integer")
@@ -195,6 +200,50 @@ class Multinomial(ExponentialFamily):
                 cls._parent_moments)
 
     
+    def _compress_observations(self, x, mask=True):
+        """
+        Keep fully observed sparse counts as a sparse matrix.
+
+        The sparse matrix has one row for each plate. The message to the
+        parent and the lower bound are computed from the non-zero counts only,
+        because zero counts contribute nothing to them.
+        """
+        if not sp.issparse(x) or not np.all(mask):
+            return None
+        x = sp.csr_matrix(x)
+        if np.shape(x) != self.plates + self.dims[0]:
+            raise ValueError("Sparse counts must have shape %s"
+                             % (self.plates + self.dims[0],))
+        if not utils.isinteger(x.data):
+            raise ValueError("Counts must be integers")
+        if np.any(x.data < 0):
+            raise ValueError("Counts must be non-negative")
+        N = np.broadcast_to(self._distribution.N, self.plates)
+        if np.any(np.ravel(x.sum(axis=-1)) != N):
+            raise ValueError("Counts must sum to the number of trials")
+        return x
+
+    def _compressed_moments(self):
+        warnings.warn("Forming the dense moments of sparse counts of shape %s"
+                      % (np.shape(self._observations),),
+                      sp.SparseEfficiencyWarning)
+        return [self._observations.toarray()]
+
+    def _compressed_message_to_parent(self, index):
+        parent = self.parents[index]
+        return [utils.sum_to_shape(self._observations,
+                                   parent.plates + parent.dims[0])]
+
+    def _compressed_lower_bound(self):
+        x = self._observations.tocoo()
+        u_parents = self._message_from_parents()
+        logp = self._distribution.compute_phi_from_parents(*u_parents)[0]
+        logp = np.broadcast_to(logp, np.shape(x))
+        N = np.broadcast_to(self._distribution.N, self.plates)
+        return (np.sum(special.gammaln(N+1))
+                - np.sum(special.gammaln(x.data+1))
+                + np.sum(x.data * logp[x.row,x.col]))
+
     def random(self):
         """
         Draw a random sample from the distribution.
@@ -434,6 +434,19 @@ class Node():
 
         # Compute the message and mask
         (m, mask) = self._get_message_and_mask_to_parent(index)
+        return self._compact_message_to_parent(index, m, mask)
+
+    def _compact_message_to_parent(self, index, m, mask, plates=None):
+        """
+        Apply the mask to the message and sum over the plates of the parent.
+
+        `plates` are the plates of this node with respect to the parent, by
+        default the plates given by _plates_to_parent. A node may compute its
+        message in parts, for instance, in chunks of its plates.
+        """
+        if plates is None:
+            plates = self._plates_to_parent(index)
+
         mask = utils.squeeze(mask)
 
         # Plates in the mask
@@ -461,7 +474,7 @@ class Node():
                 # plates).  Such a plate is meant to be broadcasted but because
                 # the parent has singular plate axis, it won't broadcast (and
                 # sum over it), so we need to multiply it.
-                plates_self = self._plates_to_parent(index)
+                plates_self = plates
                 try:
                     r = self._plate_multiplier(plates_self, 
                                                plates_m,
@@ -755,6 +768,11 @@ class Slice(Deterministic):
 
         self.slices = slices
 
+        # Parent-shaped arrays for the messages. Basic slicing always touches
+        # the same elements of the parent, so the arrays are allocated once
+        # and only the sliced elements are overwritten for each message.
+        self._message_buffers = {}
+
         super().__init__(X,
                          dims=X.dims,
                          **kwargs)
@@ -792,9 +810,13 @@ class Slice(Deterministic):
         return tuple(plates)
 
     @staticmethod
-    def __reverse_indexing(slices, m_child, plates, dims):
+    def __reverse_indexing(slices, m_child, plates, dims, buffers=None):
         """
         A helpful function for performing reverse indexing/slicing
+
+        If a dictionary `buffers` is given, the parent-shaped array is taken
+        from it (or stored to it) by its shape instead of allocating a new
+        array of zeros.
         """
 
         j = -1 # plate index for parent
@@ -840,7 +862,13 @@ class Slice(Deterministic):
                 i -= 1
 
         # Set the elements of the message
-        m_parent = np.zeros(msg_plates + dims)
+        if buffers is None:
+            m_parent = np.zeros(msg_plates + dims)
+        else:
+            m_parent = buffers.get(msg_plates + dims)
+            if m_parent is None:
+                m_parent = np.zeros(msg_plates + dims)
+                buffers[msg_plates + dims] = m_parent
         if np.ndim(m_parent) == 0 and np.ndim(m_child) == 0:
             m_parent = m_child
         elif np.ndim(m_parent) == 0:
@@ -879,11 +907,17 @@ class Slice(Deterministic):
         msg = [self.__reverse_indexing(self.slices, 
                                        m_child,
                                        parent.plates, 
-                                       dims)
-               for (m_child, dims) in zip(m, parent.dims)]
+                                       dims,
+                                       self._message_buffers.setdefault(i, {}))
+               for (i, (m_child, dims)) in enumerate(zip(m, parent.dims))]
 
         # Apply reverse indexing for the mask
-        mask = self._compute_mask_to_parent(0, self.mask)
+        mask = self.__reverse_indexing(self.slices,
+                                       self.mask,
+                                       parent.plates,
+                                       (),
+                                       self._message_buffers.setdefault('mask',
+                                                                        {}))
 
         return (msg, mask)
 
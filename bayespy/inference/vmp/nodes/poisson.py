@@ -25,7 +25,10 @@
 Module for the Poisson distribution node.
 """
 
+import warnings
+
 import numpy as np
+import scipy.sparse as sp
 from scipy import special
 
 from .expfamily import ExponentialFamily
@@ -117,6 +120,8 @@ class PoissonDistribution(ExponentialFamilyDistribution):
         """
 
         # Check the validity of x
+        if sp.issparse(x):
+            x = x.toarray()
         x = np.asanyarray(x)
         if not utils.isinteger(x):
             raise ValueError("Values must be integers")
@@ -150,6 +155,50 @@ class Poisson(ExponentialFamily):
         """
         super().__init__(l, **kwargs)
 
+
+    def _compress_observations(self, x, mask=True):
+        """
+        Keep fully observed sparse counts as a sparse matrix.
+
+        The zero counts contribute only through the rate terms, which are
+        summed analytically, so the message to the parent and the lower bound
+        are computed from the non-zero counts.
+        """
+        if not sp.issparse(x) or not np.all(mask):
+            return None
+        x = sp.csr_matrix(x)
+        if np.shape(x) != self.plates:
+            raise ValueError("Sparse counts must have shape %s"
+                             % (self.plates,))
+        if not utils.isinteger(x.data):
+            raise ValueError("Values must be integers")
+        if np.any(x.data < 0):
+            raise ValueError("Values must be positive")
+        return x
+
+    def _compressed_moments(self):
+        warnings.warn("Forming the dense moments of sparse counts of shape %s"
+                      % (np.shape(self._observations),),
+                      sp.SparseEfficiencyWarning)
+        return [self._observations.toarray()]
+
+    def _compressed_message_to_parent(self, index):
+        parent = self.parents[index]
+        # Each parent rate is shared by this many plates
+        r = np.prod(self.plates) / np.prod(parent.plates)
+        m0 = -r * np.ones(parent.plates)
+        m1 = utils.sum_to_shape(self._observations, parent.plates)
+        return [m0, m1]
+
+    def _compressed_lower_bound(self):
+        x = self._observations.tocoo()
+        u_parents = self._message_from_parents()
+        (l, logl) = u_parents[0]
+        logl = np.broadcast_to(logl, np.shape(x))
+        return (-np.sum(l) * np.prod(self.plates) / np.size(l)
+                - np.sum(special.gammaln(x.data+1))
+                + np.sum(x.data * logl[x.row,x.col]))
+
         
     def random(self):
         """
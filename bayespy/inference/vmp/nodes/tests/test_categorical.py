@@ -27,6 +27,7 @@ Unit tests for `categorical` module.
 
 import warnings
 
+import h5py
 import numpy as np
 import scipy
 
@@ -188,6 +189,41 @@ class TestCategorical(TestCase):
         pass
 
     
+    def test_message_to_parent(self):
+        """
+        Test the message from observed categorical nodes to the parent
+        """
+
+        D = 4
+        x = np.random.randint(D, size=(5,3))
+        onehot = np.identity(D)[x]
+
+        # Counts are summed over the plates that the parent does not have
+        for plates in [(), (3,), (5,1), (5,3)]:
+            p = Dirichlet(np.random.rand(D)+0.5, plates=plates)
+            X = Categorical(p, plates=(5,3))
+            X.observe(x)
+            m = X._message_to_parent(0)
+            self.assertAllClose(m[0], 
+                                utils.sum_to_shape(onehot, plates+(D,)))
+
+            # Lower bound uses the log-probabilities of the observations
+            logp = p._message_to_child()[0] * np.ones((5,3,D))
+            self.assertAllClose(X.lower_bound_contribution(),
+                                np.sum(logp * onehot))
+
+        # Partially observed nodes use the one-hot arrays
+        p = Dirichlet(np.random.rand(D)+0.5)
+        X = Categorical(p, plates=(5,3))
+        mask = np.random.rand(5,3) < 0.5
+        X.observe(x, mask=mask)
+        m = X._message_to_parent(0)
+        self.assertAllClose(m[0], 
+                            np.sum(onehot[mask], axis=0))
+
+        pass
+
+
     def test_constant(self):
         """
         Test constant categorical nodes
@@ -237,3 +273,38 @@ class TestCategorical(TestCase):
                                  [0, 0, 1]])
         
         pass
+
+
+    def test_save(self):
+        """
+        Test saving and loading observed categorical nodes
+        """
+
+        x = np.random.randint(3, size=(4,5))
+        X = Categorical([0.7,0.2,0.1], plates=(4,5))
+        X.observe(x)
+        h5f = h5py.File('test_save.h5', 'w', driver='core', backing_store=False)
+        X.save(h5f)
+
+        # The observations are restored
+        Y = Categorical([0.7,0.2,0.1], plates=(4,5))
+        Y.load(h5f)
+        self.assertAllClose(Y.get_moments()[0],
+                            X.get_moments()[0])
+        self.assertAllClose(Y.lower_bound_contribution(),
+                            X.lower_bound_contribution())
+        Y.unobserve()
+        self.assertAllClose(Y.u[0],
+                            X.get_moments()[0])
+
+        # The observations are removed
+        h5f.close()
+        h5f = h5py.File('test_save.h5', 'w', driver='core', backing_store=False)
+        Y.save(h5f)
+        X.load(h5f)
+        self.assertEqual(X._observations, None)
+        self.assertAllClose(X.get_moments()[0],
+                            Y.get_moments()[0])
+        h5f.close()
+
+        pass
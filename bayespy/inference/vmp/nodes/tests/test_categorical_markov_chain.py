@@ -28,10 +28,15 @@ Unit tests for bayespy.inference.vmp.nodes.categorical_markov_chain module.
 import warnings
 
 import numpy as np
+import scipy.sparse as sp
+import scipy.special as special
 from bayespy.utils import utils
 
 from bayespy.inference.vmp.nodes import CategoricalMarkovChain, \
-                                        Dirichlet
+                                        Dirichlet, \
+                                        Gaussian, \
+                                        Mixture, \
+                                        Wishart
 
 class TestCategoricalMarkovChain(utils.TestCase):
 
@@ -166,3 +171,188 @@ class TestCategoricalMarkovChain(utils.TestCase):
 
 
         pass
+
+    def test_homogeneous(self):
+        """
+        Test CategoricalMarkovChain with homogeneous transitions
+        """
+
+        p0 = np.random.dirichlet([1, 1, 1])
+        P = Dirichlet(np.random.rand(3)+0.5,
+                      plates=(3,))
+        Z = CategoricalMarkovChain(p0, P, states=5)
+        Z_h = CategoricalMarkovChain(p0, P, states=5, homogeneous=True)
+        self.assertEqual(((3,),(3,3),(5,3)), Z_h.dims)
+        u = Z._message_to_child()
+        u_h = Z_h._message_to_child()
+        self.assertAllClose(u_h[0], u[0])
+        self.assertAllClose(u_h[1], np.sum(u[1], axis=-3))
+        self.assertAllClose(u_h[2][0], u[0])
+        self.assertAllClose(u_h[2][1:], np.sum(u[1], axis=-2))
+        self.assertAllClose(Z_h.g, Z.g)
+
+        # Message to the transition probabilities
+        m = Z._message_to_parent(1)
+        m_h = Z_h._message_to_parent(1)
+        self.assertAllClose(m_h[0], m[0])
+
+        # Time-varying transitions are not homogeneous
+        P = np.random.dirichlet([1, 1, 1], size=(4,3))
+        self.assertRaises(ValueError,
+                          CategoricalMarkovChain,
+                          p0, 
+                          P,
+                          homogeneous=True)
+
+        pass
+
+    def test_sparse_transitions(self):
+        """
+        Test CategoricalMarkovChain with a sparsity pattern for transitions
+        """
+
+        # Left-to-right model
+        pattern = np.array([[1, 1, 0],
+                            [0, 1, 1],
+                            [0, 0, 1]], dtype=bool)
+        p0 = np.random.dirichlet([1, 1, 1])
+        P = np.random.dirichlet([1, 1, 1], size=(3,)) * pattern
+        P /= np.sum(P, axis=-1, keepdims=True)
+        Z = CategoricalMarkovChain(p0, P, states=6)
+        Z_s = CategoricalMarkovChain(p0, 
+                                     P,
+                                     states=6,
+                                     homogeneous=True,
+                                     pattern=sp.csr_matrix(pattern))
+        u = Z._message_to_child()
+        u_s = Z_s._message_to_child()
+        self.assertAllClose(u_s[0], u[0])
+        self.assertAllClose(u_s[1], np.sum(u[1], axis=-3))
+        self.assertAllClose(u_s[2][1:], np.sum(u[1], axis=-2))
+        self.assertAllClose(Z_s.g, Z.g, atol=1e-10)
+
+        # The posterior of the transition probabilities is zero outside the
+        # pattern
+        A = Dirichlet(np.ones(3), plates=(3,), pattern=pattern)
+        Z_s = CategoricalMarkovChain(p0, 
+                                     A,
+                                     states=6,
+                                     homogeneous=True,
+                                     pattern=pattern)
+        Y = Mixture(Z_s, 
+                    Gaussian, 
+                    Gaussian(np.zeros(1), np.identity(1), plates=(3,)),
+                    Wishart(1, np.identity(1), plates=(3,)))
+        Y.observe(np.random.randn(6,1))
+        Z_s.update()
+        A.update()
+        zz = Z_s._message_to_child()[1]
+        self.assertAllClose(zz[~pattern], np.zeros(np.sum(~pattern)))
+        self.assertTrue(np.all(A.u[0][~pattern] == -np.inf))
+        self.assertAllClose(A.phi[0][pattern], 1 + zz[pattern])
+        # The bound of the restricted Dirichlet distributions
+        alpha = np.where(pattern, A.phi[0], 0)
+        logp = np.where(pattern, A.u[0], 0)
+        gammaln = lambda x: np.where(pattern, special.gammaln(x), 0)
+        L = np.sum(special.gammaln(np.sum(pattern, axis=-1))
+                   - special.gammaln(np.sum(alpha, axis=-1))
+                   + np.sum(gammaln(alpha), axis=-1)
+                   + np.sum(np.where(pattern, 1-alpha, 0) * logp, axis=-1))
+        self.assertAllClose(A.lower_bound_contribution(), L)
+        # The transitions outside the pattern have zero probability
+        Z_s.update()
+        self.assertTrue(np.isfinite(Z_s.lower_bound_contribution()))
+        self.assertAllClose(Z_s._message_to_child()[1][~pattern],
+                            np.zeros(np.sum(~pattern)))
+
+        # The support of the Dirichlet transition probabilities must be the
+        # pattern
+        self.assertRaises(ValueError,
+                          CategoricalMarkovChain,
+                          p0, 
+                          Dirichlet(np.ones(3), plates=(3,)),
+                          states=6,
+                          homogeneous=True,
+                          pattern=pattern)
+        self.assertRaises(ValueError,
+                          CategoricalMarkovChain,
+                          p0, 
+                          Dirichlet(np.ones(3), plates=(3,), pattern=pattern.T),
+                          states=6,
+                          homogeneous=True,
+                          pattern=pattern)
+
+        # Sparsity pattern requires homogeneous transitions
+        self.assertRaises(ValueError,
+                          CategoricalMarkovChain,
+                          p0, 
+                          P,
+                          states=6,
+                          pattern=pattern)
+
+        # Wrong shape
+        self.assertRaises(ValueError,
+                          CategoricalMarkovChain,
+                          p0, 
+                          P,
+                          states=6,
+                          homogeneous=True,
+                          pattern=np.ones((2,2)))
+
+        pass
+
+    def test_packed(self):
+        """
+        Test CategoricalMarkovChain with packed chains of varying lengths
+        """
+
+        p0 = np.random.dirichlet([1, 1, 1])
+        P = Dirichlet(np.random.rand(3)+0.5,
+                      plates=(3,))
+        mu = Gaussian(np.zeros(1), np.identity(1), plates=(3,))
+        Lambda = Wishart(1, np.identity(1), plates=(3,))
+        lengths = [3, 1, 5]
+        y = np.random.randn(9,1)
+
+        # Separate chains
+        g = 0
+        u = []
+        m = 0
+        for (start, length) in zip([0, 3, 4], lengths):
+            Z = CategoricalMarkovChain(p0, P, states=length, homogeneous=True)
+            Y = Mixture(Z, Gaussian, mu, Lambda)
+            Y.observe(y[start:start+length])
+            Z.update()
+            g = g + Z.g
+            u.append(Z.u)
+            m = m + Z._message_to_parent(1)[0]
+
+        # Packed chains
+        Z = CategoricalMarkovChain(p0, P, homogeneous=True, lengths=lengths)
+        self.assertEqual(((3,),(3,3),(9,3)), Z.dims)
+        Y = Mixture(Z, Gaussian, mu, Lambda)
+        Y.observe(y)
+        Z.update()
+        self.assertAllClose(Z.u[0], sum(u_s[0] for u_s in u))
+        self.assertAllClose(Z.u[1], sum(u_s[1] for u_s in u))
+        self.assertAllClose(Z.u[2], np.concatenate([u_s[2] for u_s in u]))
+        self.assertAllClose(Z.g, g)
+        self.assertAllClose(Z._message_to_parent(1)[0], m)
+
+        # Packing requires homogeneous transitions
+        self.assertRaises(ValueError,
+                          CategoricalMarkovChain,
+                          p0, 
+                          P,
+                          lengths=lengths)
+
+        # Inconsistent number of states
+        self.assertRaises(ValueError,
+                          CategoricalMarkovChain,
+                          p0, 
+                          P,
+                          states=8,
+                          homogeneous=True,
+                          lengths=lengths)
+
+        pass
@@ -240,6 +240,17 @@ class TestTile(unittest.TestCase):
               dims=[()],
               plates_parent=(3,2),
               plates_children=(3,4))
+        # Check broadcasted (zero stride) message for tiled plate
+        check(2,
+              (np.broadcast_to([[1,],
+                                [2,],
+                                [3,]], (3,4)),),
+              ([[2,],
+                [4,],
+                [6,]],),
+              dims=[()],
+              plates_parent=(3,2),
+              plates_children=(3,4))
         # Check non-zero dimensional variables
         check(2,
               ([[1,2],
@@ -95,6 +95,53 @@ class TestDirichlet(TestCase):
         pass
 
 
+    def test_pattern(self):
+        """
+        Test Dirichlet nodes with a restricted support.
+        """
+
+        pattern = np.array([[1, 1, 0],
+                            [0, 1, 1]], dtype=bool)
+        alpha = np.array([2, 3, 4])
+        p = Dirichlet(alpha, plates=(2,), pattern=pattern)
+        u = p._message_to_child()
+        for (i, support) in enumerate(pattern):
+            self.assertAllClose(u[0][i][support],
+                                special.psi(alpha[support])
+                                - special.psi(np.sum(alpha[support])))
+            self.assertTrue(np.all(u[0][i][~support] == -np.inf))
+        # The posterior equals the prior in the support
+        self.assertAllClose(p.lower_bound_contribution(), 0)
+        # Random samples are zero outside the support
+        self.assertTrue(np.all(p.random()[~pattern] == 0))
+
+        # Pattern does not broadcast to the plates
+        self.assertRaises(ValueError,
+                          Dirichlet,
+                          alpha,
+                          plates=(3,),
+                          pattern=pattern)
+
+        # Empty support
+        self.assertRaises(ValueError,
+                          Dirichlet,
+                          alpha,
+                          pattern=[False, False, False])
+
+        # Non-positive concentration parameters are not structural zeros
+        self.assertRaises(ValueError,
+                          Dirichlet,
+                          [0, 3, 1])
+        self.assertRaises(ValueError,
+                          Dirichlet,
+                          [0, 3, 1],
+                          pattern=[True, True, False])
+        p = Dirichlet([0, 3, 1], pattern=[False, True, True])
+        self.assertTrue(np.all(p._message_to_child()[0][0] == -np.inf))
+
+        pass
+
+
     def test_constant(self):
         """
         Test the constant moments of Dirichlet nodes.
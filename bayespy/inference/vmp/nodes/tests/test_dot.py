@@ -33,7 +33,7 @@ import scipy
 
 from numpy import testing
 
-from ..dot import Dot, SumMultiply
+from ..dot import Dot, SumMultiply, SparseDot
 from ..gaussian import Gaussian, GaussianARD
 
 from ...vmp import VB
@@ -845,3 +845,138 @@ def check_performance(scale=1e2):
     # (bad implementation will run out of memory)
 
     pass
+
+
+class TestSumMultiplyPaths(TestCase):
+
+    def test_cached_paths(self):
+        """
+        Test that the contraction paths are planned once per shape signature
+        """
+
+        X = GaussianARD(np.random.randn(4,1,1,3), 1, shape=(3,))
+        Y = GaussianARD(np.random.randn(1,5,1,3), 1, shape=(3,))
+        Z = GaussianARD(np.random.randn(1,1,6,3), 1, shape=(3,))
+        F = SumMultiply('i,i,i', X, Y, Z)
+        u = F.get_moments()
+        (x, y, z) = (node.get_moments() for node in (X, Y, Z))
+        self.assertAllClose(u[0], np.einsum('...i,...i,...i', x[0], y[0], z[0]))
+        self.assertAllClose(u[1], np.einsum('...ij,...ij,...ij', 
+                                            x[1], y[1], z[1]))
+        self.assertEqual(len(F._einsum_paths), 2)
+
+        # Reuse the plans
+        F.get_moments()
+        self.assertEqual(len(F._einsum_paths), 2)
+
+        # Messages are planned for their own shapes
+        V = GaussianARD(F, 1)
+        V.observe(np.random.randn(4,5,6))
+        m = F._message_to_parent(0)
+        m_V = V._message_to_parent(0)
+        self.assertAllClose(m[0], 
+                            np.einsum('abci,abci,abc->ai', 
+                                      y[0], z[0], m_V[0])[:,None,None,:])
+        self.assertEqual(len(F._einsum_paths), 4)
+
+        pass
+
+
+class TestSumMultiplyMatrixProducts(TestCase):
+
+    def test_inner_product(self):
+        """
+        Test the inner product of two vectors over disjoint plates
+        """
+
+        D = 3
+        for (plates_X, plates_W) in [((4,1), (1,5)),
+                                     ((1,5), (4,1)),
+                                     ((2,1,4), (3,1)),
+                                     ((4,), (3,1))]:
+            X = GaussianARD(np.random.randn(*(plates_X+(D,))), 2, shape=(D,))
+            W = GaussianARD(np.random.randn(*(plates_W+(D,))), 3, shape=(D,))
+            F = SumMultiply('i,i', X, W)
+            self.assertIsNotNone(F._gemm_plates())
+            # Compare to the general einsum implementation
+            F_einsum = SumMultiply('i,i,i', X, W, np.ones(D))
+            self.assertIsNone(F_einsum._gemm_plates())
+            y = np.random.randn(*F.plates)
+            mask = np.random.rand(*F.plates) > 0.3
+            Y = GaussianARD(F, 2)
+            Y.observe(y, mask=mask)
+            Y_einsum = GaussianARD(F_einsum, 2)
+            Y_einsum.observe(y, mask=mask)
+            u = F.get_moments()
+            u_einsum = F_einsum.get_moments()
+            for ind in range(2):
+                self.assertAllClose(u[ind], u_einsum[ind])
+            for index in range(2):
+                m = F._message_to_parent(index)
+                m_einsum = F_einsum._message_to_parent(index)
+                for ind in range(2):
+                    self.assertAllClose(m[ind], 
+                                        m_einsum[ind]*np.ones(np.shape(m[ind])))
+
+        # Overlapping plates use einsum
+        X = GaussianARD(0, 1, plates=(4,5), shape=(D,))
+        W = GaussianARD(0, 1, plates=(1,5), shape=(D,))
+        self.assertIsNone(SumMultiply('i,i', X, W)._gemm_plates())
+
+        pass
+
+
+class TestSparseDot(TestCase):
+
+    def test_sparse_dot(self):
+        """
+        Test the inner products of given pairs of Gaussian vectors
+        """
+
+        (N, M, D) = (5, 4, 3)
+        mu_X = np.random.randn(N,D)
+        mu_W = np.random.randn(M,D)
+        Lambda = 2*np.identity(D)
+        y = np.random.randn(N,M)
+        rows = np.array([0, 0, 1, 3, 4, 4, 4])
+        cols = np.array([1, 3, 0, 2, 0, 1, 2])
+        mask = np.zeros((N,M), dtype=bool)
+        mask[rows,cols] = True
+
+        # Dense computation using the full plate grid
+        X = Gaussian(mu_X[:,None,:], Lambda)
+        W = Gaussian(mu_W, Lambda)
+        F = SumMultiply('i,i', X, W)
+        Y = GaussianARD(F, 3)
+        Y.observe(y, mask=mask)
+        u = F.get_moments()
+        m_X = F._message_to_parent(0)
+        m_W = F._message_to_parent(1)
+
+        # Sparse computation
+        X = Gaussian(mu_X, Lambda)
+        W = Gaussian(mu_W, Lambda)
+        F = SparseDot(X, W, rows, cols)
+        self.assertEqual(F.plates, (len(rows),))
+        Y = GaussianARD(F, 3)
+        Y.observe(y[rows,cols])
+        u_sparse = F.get_moments()
+        self.assertAllClose(u_sparse[0], u[0][rows,cols])
+        self.assertAllClose(u_sparse[1], u[1][rows,cols])
+        m = F._message_to_parent(0)
+        self.assertAllClose(m[0], m_X[0][:,0])
+        self.assertAllClose(m[1], m_X[1][:,0])
+        m = F._message_to_parent(1)
+        self.assertAllClose(m[0], m_W[0])
+        self.assertAllClose(m[1], m_W[1])
+
+        # Masks are scattered to the parents
+        self.assertAllClose(X.mask, np.any(mask, axis=1))
+        self.assertAllClose(W.mask, np.any(mask, axis=0))
+
+        # Invalid indices
+        self.assertRaises(ValueError, SparseDot, X, W, rows, cols[:-1])
+        self.assertRaises(ValueError, SparseDot, X, W, rows+1, cols)
+        self.assertRaises(ValueError, SparseDot, X, W, rows, cols+0.5)
+
+        pass
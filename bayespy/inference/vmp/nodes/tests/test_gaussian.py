@@ -137,6 +137,33 @@ class TestGaussianFunctions(TestCase):
 
         pass
 
+    def test_compute_shared_moments_and_cgf(self):
+        """
+        Test the Gaussian moments for a precision matrix shared by plates.
+        """
+        D = 3
+        Lambda = random.covariance(D)
+        Cov = np.linalg.inv(Lambda)
+        phi0 = np.random.randn(4,5,D)
+        phi1 = -0.5 * Lambda[None,None,:,:]
+        ((u0, u1), g) = gaussian.compute_shared_moments_and_cgf(phi0, phi1)
+        mu = np.einsum('ij,...j->...i', Cov, phi0)
+        self.assertAllClose(u0, mu)
+        self.assertAllClose(u1, linalg.outer(mu, mu) + Cov)
+        self.assertAllClose(g,
+                            -0.5 * np.einsum('...i,...i', mu, phi0)
+                            + 0.5 * np.linalg.slogdet(Lambda)[1])
+
+        # Plate axes of the precision matrix are kept
+        phi0 = np.random.randn(D)
+        phi1 = -0.5 * Lambda[None,None,:,:]
+        ((u0, u1), g) = gaussian.compute_shared_moments_and_cgf(phi0, phi1)
+        self.assertEqual(np.shape(u0), (1,1,D))
+        self.assertEqual(np.shape(u1), (1,1,D,D))
+        self.assertEqual(np.shape(g), (1,1))
+
+        pass
+
     
 class TestGaussianARD(TestCase):
 
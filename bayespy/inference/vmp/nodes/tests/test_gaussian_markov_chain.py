@@ -472,6 +472,100 @@ class TestGaussianMarkovChain(TestCase):
         #
         self.assertTrue(np.allclose(Xh_vb, Xh))
         self.assertTrue(np.allclose(CovXh_vb, CovXh))
+
+    def test_cyclic_solver(self):
+        """
+        Test that cyclic reduction gives the same posterior as the recursions.
+        """
+
+        N = 21
+        D = 2
+        A = np.random.randn(N-1,D,D)
+        v = np.random.rand(D)
+        Y = np.random.randn(N,D)
+
+        u = []
+        g = []
+        for solver in ['sequential', 'cyclic']:
+            X = GaussianMarkovChain(np.zeros(D), np.identity(D), A, v, n=N,
+                                    solver=solver)
+            Z = Gaussian(X, np.identity(D), plates=(N,))
+            Z.observe(Y)
+            X.update()
+            u.append(X.u)
+            g.append(X.g)
+
+        for (u0, u1) in zip(*u):
+            self.assertAllClose(u0, u1)
+        self.assertAllClose(g[0], g[1])
+
+        # Invalid solver
+        self.assertRaises(ValueError,
+                          GaussianMarkovChain,
+                          np.zeros(D), np.identity(D), A, v, n=N,
+                          solver='foo')
+
+    def test_packed(self):
+        """
+        Test GaussianMarkovChain with packed chains of varying lengths.
+        """
+
+        D = 2
+        lengths = [4, 1, 6, 2]
+        N = sum(lengths)
+        mu = np.random.randn(D)
+        Lambda = np.identity(D)
+        A = GaussianARD(np.random.randn(1,D,D), 1, shape=(D,))
+        v = Gamma(1+np.random.rand(1,D), 1+np.random.rand(1,D))
+        Y = np.random.randn(N,D)
+
+        # Separate chains
+        u = [[], [], []]
+        g = 0
+        L = 0
+        m_A = [0, 0]
+        m_v = [0, 0]
+        for (start, length) in zip(np.cumsum(lengths)-lengths, lengths):
+            X = GaussianMarkovChain(mu, Lambda, A, v, n=length)
+            Z = Gaussian(X, np.identity(D), plates=(length,))
+            Z.observe(Y[start:start+length])
+            X.update()
+            u[0].append(X.u[0])
+            u[1].append(X.u[1])
+            u[2].append(X.u[2])
+            u[2].append(np.zeros((1,D,D)))
+            g = g + X.g
+            L = L + X.lower_bound_contribution()
+            # Sum the messages (a chain of length one has no transitions)
+            if length > 1:
+                m_A = [m0 + m1 for (m0, m1) in zip(m_A, 
+                                                   X._message_to_parent(2))]
+                m_v = [m0 + m1 for (m0, m1) in zip(m_v, 
+                                                   X._message_to_parent(3))]
+        u = [np.concatenate(u_i) for u_i in u]
+        u[2] = u[2][:-1]
+
+        # Packed chains
+        for solver in ['sequential', 'cyclic']:
+            X = GaussianMarkovChain(mu, Lambda, A, v, lengths=lengths,
+                                    solver=solver)
+            self.assertEqual(((N,D), (N,D,D), (N-1,D,D)), X.dims)
+            Z = Gaussian(X, np.identity(D), plates=(N,))
+            Z.observe(Y)
+            X.update()
+            for (u0, u1) in zip(X.u, u):
+                self.assertAllClose(u0, u1)
+            self.assertAllClose(X.g, g)
+            self.assertAllClose(X.lower_bound_contribution(), L)
+            for (m0, m1) in zip(X._message_to_parent(2), m_A):
+                self.assertAllClose(m0, m1)
+            for (m0, m1) in zip(X._message_to_parent(3), m_v):
+                self.assertAllClose(*np.broadcast_arrays(m0, m1))
+
+        # Inconsistent number of time instances
+        self.assertRaises(ValueError,
+                          GaussianMarkovChain,
+                          mu, Lambda, A, v, n=N+1, lengths=lengths)
         
 
 class TestVaryingGaussianMarkovChain(TestCase):
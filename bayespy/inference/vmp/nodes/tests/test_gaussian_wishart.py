@@ -0,0 +1,140 @@
+######################################################################
+# Copyright (C) 2014 Jaakko Luttinen
+#
+# This file is licensed under Version 3.0 of the GNU General Public
+# License. See LICENSE for a text of the license.
+######################################################################
+
+######################################################################
+# This file is part of BayesPy.
+#
+# BayesPy is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# BayesPy is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with BayesPy.  If not, see <http://www.gnu.org/licenses/>.
+######################################################################
+
+"""
+Unit tests for `gaussian_wishart` module.
+"""
+
+import numpy as np
+from scipy import special
+
+from bayespy.nodes import (GaussianGammaISO,
+                           GaussianWishart,
+                           GaussianFromGaussianGamma,
+                           GaussianFromGaussianWishart)
+
+from bayespy.utils.utils import TestCase
+
+
+class TestGaussianGammaISO(TestCase):
+    """
+    Unit tests for GaussianGammaISO node
+    """
+
+    
+    def test_posterior(self):
+        """
+        Test the exact posterior of a Gaussian-gamma node
+        """
+
+        D = 2
+        N = 20
+        mu0 = np.random.randn(D)
+        Lambda0 = 2 * np.identity(D)
+        a0 = 3
+        b0 = 2
+        y = np.random.randn(N, D)
+
+        X = GaussianGammaISO(mu0, Lambda0, a0, b0)
+        Y = GaussianFromGaussianGamma(X, plates=(N,))
+        Y.observe(y)
+        X.update()
+
+        # Conjugate posterior
+        Lambda = Lambda0 + N * np.identity(D)
+        mu = np.linalg.solve(Lambda, np.dot(Lambda0, mu0) + np.sum(y, axis=0))
+        a = a0 + 0.5*N*D
+        b = b0 + 0.5 * (np.sum(y**2)
+                        + np.dot(mu0, np.dot(Lambda0, mu0))
+                        - np.dot(mu, np.dot(Lambda, mu)))
+        u = X.get_moments()
+        self.assertAllClose(u[0], a/b*mu)
+        self.assertAllClose(u[1], a/b*np.outer(mu, mu) + np.linalg.inv(Lambda))
+        self.assertAllClose(u[2], a/b)
+        self.assertAllClose(u[3], special.digamma(a) - np.log(b))
+
+        # The lower bound is the marginal likelihood
+        L = X.lower_bound_contribution() + Y.lower_bound_contribution()
+        self.assertAllClose(L,
+                            - 0.5*N*D*np.log(2*np.pi)
+                            + 0.5*np.linalg.slogdet(Lambda0)[1]
+                            - 0.5*np.linalg.slogdet(Lambda)[1]
+                            + a0*np.log(b0) - a*np.log(b)
+                            + special.gammaln(a) - special.gammaln(a0))
+
+        pass
+
+
+class TestGaussianWishart(TestCase):
+    """
+    Unit tests for GaussianWishart node
+    """
+
+    
+    def test_posterior(self):
+        """
+        Test the exact posterior of a Gaussian-Wishart node
+        """
+
+        D = 2
+        N = 20
+        mu0 = np.random.randn(D)
+        alpha0 = 1.5
+        V0 = np.array([[2.0, 0.3],
+                       [0.3, 1.0]])
+        n0 = 4
+        y = np.random.randn(N, D)
+
+        X = GaussianWishart(mu0, alpha0, V0, n0)
+        Y = GaussianFromGaussianWishart(X, plates=(N,))
+        Y.observe(y)
+        X.update()
+
+        # Conjugate posterior
+        alpha = alpha0 + N
+        mu = (alpha0*mu0 + np.sum(y, axis=0)) / alpha
+        n = n0 + N
+        V = (V0 + np.dot(y.T, y)
+             + alpha0*np.outer(mu0, mu0) - alpha*np.outer(mu, mu))
+        Lambda = n * np.linalg.inv(V)
+        u = X.get_moments()
+        self.assertAllClose(u[0], np.dot(Lambda, mu))
+        self.assertAllClose(u[1], np.dot(mu, np.dot(Lambda, mu)) + D/alpha)
+        self.assertAllClose(u[2], Lambda)
+        self.assertAllClose(u[3],
+                            special.digamma(0.5*n) 
+                            + special.digamma(0.5*(n-1))
+                            + D*np.log(2) 
+                            - np.linalg.slogdet(V)[1])
+
+        # The lower bound is the marginal likelihood
+        L = X.lower_bound_contribution() + Y.lower_bound_contribution()
+        self.assertAllClose(L,
+                            - 0.5*N*D*np.log(2*np.pi)
+                            + 0.5*D*np.log(alpha0/alpha)
+                            + 0.5*n0*(np.linalg.slogdet(V0)[1] - D*np.log(2))
+                            - 0.5*n*(np.linalg.slogdet(V)[1] - D*np.log(2))
+                            + special.multigammaln(0.5*n, D)
+                            - special.multigammaln(0.5*n0, D))
+
+        pass
@@ -30,10 +30,14 @@ import warnings
 import numpy as np
 
 from bayespy.nodes import (GaussianARD,
+                           Gaussian,
                            Gamma,
+                           Wishart,
                            Mixture,
                            Categorical,
-                           Multinomial)
+                           Dirichlet,
+                           Multinomial,
+                           Poisson)
 
 from bayespy.utils import random
 from bayespy.utils import linalg
@@ -247,6 +251,218 @@ class TestMixture(TestCase):
         pass
 
 
+    def test_categorical(self):
+        """
+        Test mixture of observed categorical variables
+        """
+
+        (N, K, D) = (6, 3, 4)
+        theta = Dirichlet(np.random.rand(D)+0.5, plates=(K,))
+        p = np.random.dirichlet(np.ones(K), size=(2,N))
+        z = Categorical(p)
+        x = np.random.randint(D, size=(2,N))
+        X = Mixture(z, Categorical, theta)
+        X.observe(x)
+        logtheta = theta._message_to_child()[0]
+
+        # Message to the cluster assignments
+        m = X._message_to_parent(0)
+        self.assertAllClose(m[0], 
+                            np.moveaxis(logtheta[:,x], 0, -1))
+
+        # Message to the cluster parameters
+        m = X._message_to_parent(1)
+        self.assertAllClose(m[0],
+                            np.einsum('nk,nd->kd', 
+                                      np.reshape(p, (-1,K)),
+                                      np.identity(D)[np.ravel(x)]))
+
+        # Lower bound
+        self.assertAllClose(X.lower_bound_contribution(),
+                            np.sum(p * np.moveaxis(logtheta[:,x], 0, -1)))
+
+        # Moments are formed for the children
+        u = X._message_to_child()
+        self.assertAllClose(u[0], np.identity(D)[x])
+
+        pass
+
+
+    def test_truncated(self):
+        """
+        Test truncated responsibilities in the messages to cluster parameters
+        """
+
+        (N, K, D) = (10, 4, 3)
+        p = np.random.dirichlet(0.5*np.ones(K), size=(2,N))
+        mask = np.random.rand(2,N) > 0.3
+        y = np.random.randn(2,N,D)
+
+        def messages(p, **kwargs):
+            mu = Gaussian(np.zeros(D), np.identity(D), plates=(K,))
+            Lambda = Wishart(D, np.identity(D), plates=(K,))
+            X = Mixture(Categorical(p), Gaussian, mu, Lambda, **kwargs)
+            X.observe(y, mask=mask)
+            return (X._message_to_parent(1), X._message_to_parent(2))
+
+        def check(p, **kwargs):
+            for (m_trunc, m) in zip(messages(p, **kwargs), messages(p)):
+                for (m_trunc_i, m_i) in zip(m_trunc, m):
+                    self.assertAllClose(m_trunc_i, m_i)
+
+        def check_truncated(q, **kwargs):
+            q = q / np.sum(q, axis=-1, keepdims=True)
+            for (m_trunc, m) in zip(messages(p, **kwargs), messages(q)):
+                for (m_trunc_i, m_i) in zip(m_trunc, m):
+                    self.assertAllClose(m_trunc_i, m_i)
+
+        # No effective truncation
+        check(p, top_k=K)
+        check(p, threshold=0)
+
+        # Keep the most probable cluster only
+        check_truncated(p == np.amax(p, axis=-1, keepdims=True), top_k=1)
+
+        # Keep two most probable clusters
+        q = np.where(p >= np.sort(p, axis=-1)[...,-2:-1], p, 0)
+        check_truncated(q, top_k=2)
+
+        # Drop small responsibilities
+        q = np.where(p >= 0.2, p, 0)
+        q = np.where(p == np.amax(p, axis=-1, keepdims=True), p, q)
+        check_truncated(q, threshold=0.2)
+
+        # The moments are gathered for the retained pairs only
+        mu = Gaussian(np.zeros(D), np.identity(D), plates=(K,))
+        Lambda = Wishart(D, np.identity(D), plates=(K,))
+        X = Mixture(Categorical(p), Gaussian, mu, Lambda, top_k=2)
+        X.observe(y, mask=mask)
+        shapes = []
+        compute = X._distribution.distribution.compute_message_to_parent
+        def compute_message_to_parent(parent, index, *u):
+            shapes.extend(np.shape(u_ij) 
+                          for u_i in u if u_i is not None
+                          for u_ij in u_i)
+            return compute(parent, index, *u)
+        X._distribution.distribution.compute_message_to_parent = \
+            compute_message_to_parent
+        X._message_to_parent(1)
+        X._message_to_parent(2)
+        nnz = 2 * np.count_nonzero(mask)
+        self.assertTrue(len(shapes) > 0)
+        for shape in shapes:
+            self.assertIn(shape[0], (1, nnz))
+            self.assertLessEqual(np.prod(shape), nnz*D*D)
+
+        # Mixed distribution with element plates in the other parents
+        alpha = Gamma(1+np.random.rand(2,N,1), 1)
+        def messages(p, **kwargs):
+            mu = GaussianARD(0, 1, plates=(K,))
+            X = Mixture(Categorical(p), GaussianARD, mu, alpha, **kwargs)
+            X.observe(y[...,0], mask=mask)
+            return (X._message_to_parent(1),)
+        check(p, top_k=K)
+        check_truncated(p == np.amax(p, axis=-1, keepdims=True), top_k=1)
+
+        # Invalid number of clusters
+        self.assertRaises(ValueError,
+                          Mixture,
+                          Categorical(p),
+                          GaussianARD,
+                          GaussianARD(0, 1, plates=(K,)),
+                          1,
+                          top_k=0)
+
+        pass
+
+
+    def test_fused(self):
+        """
+        Test messages to cluster parameters from the weighted moments
+        """
+
+        (N, K, D) = (8, 3, 2)
+        p = np.random.dirichlet(np.ones(K), size=(N,))
+        mask = np.random.rand(2,N) > 0.3
+        y = np.random.randn(2,N,D)
+        w = p * mask[...,None]
+        mu = np.random.randn(K,D)
+        Lambda = np.random.randn(K,D,D)
+        Lambda = np.einsum('kij,klj->kil', Lambda, Lambda) + np.identity(D)
+
+        # Message to the means
+        X = Mixture(Categorical(p), 
+                    Gaussian, 
+                    Gaussian(np.zeros(D), np.identity(D), plates=(K,)),
+                    Lambda,
+                    plates=(2,N))
+        X.observe(y, mask=mask)
+        m = X._message_to_parent(1)
+        self.assertAllClose(m[0],
+                            np.einsum('mnk,kij,mnj->ki', w, Lambda, y))
+        self.assertAllClose(m[1],
+                            -0.5 * np.einsum('mnk,kij->kij', w, Lambda))
+
+        # Message to the precision matrices
+        X = Mixture(Categorical(p), 
+                    Gaussian, 
+                    mu,
+                    Wishart(D, np.identity(D), plates=(K,)),
+                    plates=(2,N))
+        X.observe(y, mask=mask)
+        m = X._message_to_parent(2)
+        e = y[...,None,:] - mu
+        self.assertAllClose(m[0],
+                            -0.5 * np.einsum('mnk,mnki,mnkj->kij', w, e, e))
+        self.assertAllClose(m[1],
+                            0.5 * np.einsum('mnk->k', w))
+
+        # Message to the rates of Poisson variables
+        x = np.random.poisson(5, size=(2,N))
+        X = Mixture(Categorical(p), 
+                    Poisson, 
+                    Gamma(1, 1, plates=(K,)),
+                    plates=(2,N))
+        X.observe(x, mask=mask)
+        m = X._message_to_parent(1)
+        self.assertAllClose(m[0], -np.einsum('mnk->k', w))
+        self.assertAllClose(m[1], np.einsum('mnk,mn->k', w, x))
+
+        pass
+
+
+    def test_chunked(self):
+        """
+        Test messages to cluster parameters computed in chunks
+        """
+
+        (N, M, K, D) = (13, 2, 3, 2)
+        p = np.random.dirichlet(np.ones(K), size=(N,M))
+        mask = np.random.rand(N,M) > 0.3
+        y = np.random.randn(N,M,D)
+
+        def messages(cluster_plate, **kwargs):
+            plates = (K,M) if cluster_plate == -2 else (M,K)
+            mu = Gaussian(np.zeros(D), np.identity(D), plates=plates)
+            Lambda = Wishart(D, np.identity(D), plates=(K,1,1)[:-cluster_plate])
+            X = Mixture(Categorical(p), Gaussian, mu, Lambda,
+                        cluster_plate=cluster_plate, **kwargs)
+            X.observe(y, mask=mask)
+            return (X._message_to_parent(0),
+                    X._message_to_parent(1), 
+                    X._message_to_parent(2))
+
+        for cluster_plate in [-1, -2]:
+            m = messages(cluster_plate)
+            for max_memory in [1, 500, 1e9]:
+                m_chunked = messages(cluster_plate, max_memory=max_memory)
+                for (m_i, m_chunked_i) in zip(m, m_chunked):
+                    for (m_ij, m_chunked_ij) in zip(m_i, m_chunked_i):
+                        self.assertAllClose(m_chunked_ij, m_ij)
+
+        pass
+
+
     def test_nans(self):
         """
         Test multinomial mixture
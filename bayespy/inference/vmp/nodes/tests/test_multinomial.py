@@ -25,8 +25,10 @@
 Unit tests for `multinomial` module.
 """
 
+import h5py
 import numpy as np
 import scipy
+import scipy.sparse
 
 from bayespy.nodes import (Multinomial,
                            Dirichlet,
@@ -190,3 +192,56 @@ class TestMultinomial(TestCase):
 
         pass
 
+
+    def test_sparse(self):
+        """
+        Test sparse count observations of multinomial nodes.
+        """
+
+        M = 20
+        D = 15
+        x = np.zeros((M,D), dtype=int)
+        x[np.arange(M),np.random.randint(D, size=M)] = 3
+        x[np.arange(M),np.random.randint(D, size=M)] += 2
+
+        for plates in [(D,), (M,D), (1,D)]:
+            P = Dirichlet(np.random.rand(*plates) + 1, plates=plates[:-1])
+            X = Multinomial(5, P, plates=(M,))
+            Y = Multinomial(5, P, plates=(M,))
+            X.observe(x)
+            Y.observe(scipy.sparse.csr_matrix(x))
+            with self.assertWarns(scipy.sparse.SparseEfficiencyWarning):
+                self.assertAllClose(Y.get_moments()[0], x)
+            self.assertAllClose(Y._message_to_parent(0)[0],
+                                X._message_to_parent(0)[0])
+            self.assertAllClose(Y.lower_bound_contribution(),
+                                X.lower_bound_contribution())
+
+        # Save and load the sparse counts
+        P = Dirichlet(np.ones(D))
+        X = Multinomial(5, P, plates=(M,))
+        Y = Multinomial(5, P, plates=(M,))
+        X.observe(scipy.sparse.csr_matrix(x))
+        h5f = h5py.File('test_sparse.h5', 'w', driver='core', backing_store=False)
+        X.save(h5f)
+        Y.load(h5f)
+        self.assertTrue(scipy.sparse.issparse(Y._observations))
+        self.assertAllClose(Y._observations.toarray(), x)
+        self.assertAllClose(Y.lower_bound_contribution(),
+                            X.lower_bound_contribution())
+        h5f.close()
+
+        # Invalid counts
+        P = Dirichlet(np.ones(D))
+        X = Multinomial(5, P, plates=(M,))
+        self.assertRaises(ValueError,
+                          X.observe,
+                          scipy.sparse.csr_matrix(x[:,:-1]))
+        self.assertRaises(ValueError,
+                          X.observe,
+                          scipy.sparse.csr_matrix(2*x))
+        self.assertRaises(ValueError,
+                          X.observe,
+                          scipy.sparse.csr_matrix(x/5))
+
+        pass
@@ -852,4 +852,19 @@ class TestSlice(utils.TestCase):
         # Found bug: message requires reshaping after reverse indexing
         
 
+        # Repeated messages with changing messages from the child
+        V = ParentNode(plates=(10,2),
+                 dims=((),))
+        X = V[2:8:3]
+        Y = ChildNode(X, None, True, dims=((),))
+        X._update_mask()
+        for m in [ [np.random.randn(2,2)],
+                   [np.random.randn(2,1)],
+                   [np.random.randn(2,2)] ]:
+            Y.m = m
+            msg = [ np.zeros((10,) + np.shape(m[0])[1:]) ]
+            msg[0][2:8:3] = m[0]
+            self.assertMessage(X._message_to_parent(0),
+                               msg)
+
         pass
@@ -27,6 +27,7 @@ Unit tests for `poisson` module.
 
 import numpy as np
 import scipy
+import scipy.sparse
 
 from bayespy.nodes import Poisson
 from bayespy.nodes import Gamma
@@ -114,3 +115,40 @@ class TestPoisson(TestCase):
                             r*np.ones((2,3)))
 
         pass
+
+
+    def test_sparse(self):
+        """
+        Test sparse count observations of Poisson nodes.
+        """
+
+        M = 30
+        D = 10
+        x = scipy.sparse.random(M, D, density=0.1, format='csr')
+        x.data = np.random.randint(1, 10, size=x.nnz)
+
+        for plates in [(), (D,), (M,1), (M,D)]:
+            alpha = Gamma(np.random.rand(*plates)+1, 2, plates=plates)
+            X = Poisson(alpha, plates=(M,D))
+            Y = Poisson(alpha, plates=(M,D))
+            X.observe(x.toarray())
+            Y.observe(x)
+            with self.assertWarns(scipy.sparse.SparseEfficiencyWarning):
+                self.assertAllClose(Y.get_moments()[0], x.toarray())
+            (m0, m1) = X._message_to_parent(0)
+            (n0, n1) = Y._message_to_parent(0)
+            self.assertAllClose(n0*np.ones(plates), m0*np.ones(plates))
+            self.assertAllClose(n1, m1)
+            self.assertAllClose(Y.lower_bound_contribution(),
+                                X.lower_bound_contribution())
+
+        # Invalid values
+        X = Poisson(Gamma(1, 1), plates=(M,D))
+        self.assertRaises(ValueError,
+                          X.observe,
+                          x[:,:-1])
+        self.assertRaises(ValueError,
+                          X.observe,
+                          -x)
+
+        pass
@@ -25,6 +25,8 @@
 Unit tests for `transformations` module.
 """
 
+import threading
+
 import numpy as np
 
 from bayespy.inference.vmp.nodes.gaussian import GaussianARD
@@ -42,6 +44,12 @@ from bayespy.utils import optimize
 from ..transformations import RotateGaussianARD
 from ..transformations import RotateGaussianMarkovChain
 from ..transformations import RotateVaryingMarkovChain
+from ..transformations import RotateMultiple
+from ..transformations import RotationOptimizer
+from ..transformations import _LowRankRotation
+from ..transformations import _GivensRotation
+from ..transformations import _map_blocks
+from ..transformations import _parallel_blocks
 
 from bayespy.utils.utils import TestCase
 
@@ -305,6 +313,134 @@ class TestRotateGaussianARD(TestCase):
         
         pass
 
+    def test_setup_in_chunks(self):
+        """
+        Test the setup of Gaussian ARD arrays in chunks of plates.
+        """
+
+        np.random.seed(42)
+
+        def test(shape, plates, axis=-1, alpha_plates=None, mu_plates=()):
+            if alpha_plates is None:
+                alpha_plates = shape
+            alpha = Gamma(2, 2, plates=alpha_plates)
+            alpha.initialize_from_random()
+            mu = GaussianARD(3, 1, shape=shape, plates=mu_plates)
+            mu.initialize_from_random()
+            X = GaussianARD(mu, alpha, shape=shape, plates=plates)
+            X.initialize_from_random()
+            rotX = RotateGaussianARD(X, alpha, axis=axis)
+            rotX.setup()
+            for num_threads in [1, 2]:
+                rotX_chunks = RotateGaussianARD(X, alpha, axis=axis,
+                                                max_memory=1000)
+                try:
+                    linalg.set_num_threads(num_threads)
+                    rotX_chunks.setup()
+                finally:
+                    linalg.set_num_threads(1)
+                self.assertAllClose(rotX_chunks.XX, rotX.XX)
+                self.assertAllClose(rotX_chunks.mumu, rotX.mumu)
+                self.assertAllClose(rotX_chunks.Xmu, rotX.Xmu)
+                R = np.random.randn(shape[axis], shape[axis])
+                self.assertAllClose(rotX_chunks.bound(R)[0],
+                                    rotX.bound(R)[0])
+
+        test((3,), (100,))
+        test((3,), (100,), mu_plates=(100,))
+        test((3,), (20,30), alpha_plates=(20,1,1))
+        test((3,4), (50,), axis=-2, alpha_plates=(4,))
+        test((3,), (10,1,40), alpha_plates=(1,1,3), mu_plates=(1,1,40))
+
+    def test_block_diagonal_bound(self):
+        """
+        Test the bound of the speed-up rotation for block-diagonal rotations.
+        """
+
+        # Use seed for deterministic testing
+        np.random.seed(42)
+
+        def test(shape, plates, block_sizes,
+                 axis=-1,
+                 alpha_plates=None,
+                 plate_axis=None,
+                 precompute=False):
+
+            # Construct the model
+            D = shape[axis]
+            if alpha_plates is not None:
+                alpha = Gamma(3, 5, plates=alpha_plates)
+                alpha.initialize_from_random()
+            else:
+                alpha = 2
+            X = GaussianARD(3, alpha, shape=shape, plates=plates)
+            X.initialize_from_random()
+            Y = GaussianARD(X, 1)
+            Y.observe(np.random.randn(*(Y.get_shape(0))))
+            X.update()
+            if alpha_plates is not None:
+                alpha.update()
+                rotX = RotateGaussianARD(X, alpha, 
+                                         axis=axis,
+                                         precompute=precompute)
+            else:
+                rotX = RotateGaussianARD(X, 
+                                         axis=axis,
+                                         precompute=precompute)
+
+            # Block-diagonal rotation
+            R = np.zeros((D, D))
+            mask = np.zeros((D, D), dtype=bool)
+            offset = 0
+            for d in block_sizes:
+                R[offset:offset+d,offset:offset+d] = np.random.randn(d, d)
+                mask[offset:offset+d,offset:offset+d] = True
+                offset += d
+            if plate_axis is not None:
+                C = plates[plate_axis]
+                Q = np.random.randn(C, C)
+            else:
+                Q = None
+
+            # Compare to the bound of the full rotation
+            rotX.setup(plate_axis=plate_axis)
+            full = rotX._compute_bound(R, Q=Q, gradient=True)
+            rotX.setup(plate_axis=plate_axis, block_sizes=block_sizes)
+            block = rotX._compute_bound(R, Q=Q, gradient=True)
+            self.assertAllClose(block[0], full[0])
+            self.assertAllClose(block[1][mask], full[1][mask])
+            if rotX.blocks is not None:
+                self.assertAllClose(block[1][~mask], np.zeros(np.sum(~mask)))
+            if plate_axis is not None:
+                self.assertAllClose(block[2], full[2])
+
+            # Give the log-determinants of the diagonal blocks
+            if rotX.blocks is not None:
+                logdet = np.array([np.linalg.slogdet(R[ind,ind])[1] 
+                                   for (ind, _) in rotX.blocks])
+                bound = rotX._compute_bound(R, 
+                                            logdet=logdet,
+                                            inv=np.linalg.inv(R),
+                                            Q=Q)
+                self.assertAllClose(bound, full[0])
+
+            return
+
+        test((4,), (), [2,2])
+        test((2,3,4), (), [1,3], axis=-1)
+        test((2,3,4), (), [1,1,1], axis=-2)
+        test((2,3,4), (5,6), [2,1], axis=-2)
+        test((4,), (5,), [1,2,1], alpha_plates=(4,))
+        test((4,), (5,), [3,1], alpha_plates=(5,4))
+        # Shared precision is not separable, use the full bound
+        test((4,), (5,), [2,2], alpha_plates=(5,1))
+        test((3,), (5,4), [2,1], alpha_plates=(3,), plate_axis=-2)
+        test((3,), (5,4), [2,1], alpha_plates=(4,3), plate_axis=-1,
+             precompute=True)
+        test((3,), (5,4), [1,2], plate_axis=-2, precompute=True)
+
+        pass
+
     def test_cost_gradient(self):
         """
         Test gradient of the rotation cost function for Gaussian ARD arrays.
@@ -900,6 +1036,75 @@ class TestRotateGaussianMarkovChain(TestCase):
 
         pass
 
+    def test_block_diagonal_bound(self):
+        """
+        Test the bound of the speed-up rotation for Markov chain for
+        block-diagonal rotations.
+        """
+
+        # Use seed for deterministic testing
+        np.random.seed(42)
+
+        def check(D, N, block_sizes, mu=None, Lambda=None, A=None):
+            if mu is None:
+                mu = np.zeros(D)
+            if Lambda is None:
+                Lambda = np.identity(D)
+            if A is None:
+                A = GaussianARD(3, 5,
+                                shape=(D,),
+                                plates=(D,))
+            V = np.identity(D) + np.ones((D,D))
+
+            # Construct model
+            X = GaussianMarkovChain(mu,
+                                    Lambda,
+                                    A,
+                                    np.ones(D),
+                                    n=N+1,
+                                    initialize=False)
+            Y = Gaussian(X,
+                         V,
+                         initialize=False)
+            Y.observe(np.random.randn(*(Y.get_shape(0))))
+            X.update()
+            A.update()
+
+            # Block-diagonal rotation
+            R = np.zeros((D, D))
+            mask = np.zeros((D, D), dtype=bool)
+            offset = 0
+            for d in block_sizes:
+                R[offset:offset+d,offset:offset+d] = np.random.randn(d, d)
+                mask[offset:offset+d,offset:offset+d] = True
+                offset += d
+
+            # Compare to the bound of the full rotation
+            rotX = RotateGaussianMarkovChain(X, RotateGaussianARD(A, axis=-1))
+            rotX.setup()
+            (bound, dR_bound) = rotX.bound(R)
+            rotX.setup(block_sizes=block_sizes)
+            (block_bound, block_dR_bound) = rotX.bound(R)
+            self.assertAllClose(block_bound, bound)
+            self.assertAllClose(block_dR_bound[mask], dR_bound[mask])
+
+            return
+
+        check(3, 4, [2,1])
+        check(4, 4, [1,1,2],
+              mu=GaussianARD(2, 4,
+                             shape=(4,),
+                             plates=(5,)),
+              Lambda=Wishart(4, random.covariance(4),
+                             plates=(5,)))
+        check(3, 4, [1,2],
+              Lambda=Wishart(3, random.covariance(3)),
+              A=GaussianARD(2, 4,
+                            shape=(3,),
+                            plates=(4,3)))
+
+        pass
+
     def _run_checks(self, check):
         
         # Basic test
@@ -1203,3 +1408,251 @@ class TestRotateVaryingMarkovChain(TestCase):
 
         pass
 
+
+class TestRotateMultiple(TestCase):
+
+    def _model(self, D=3):
+        alpha = Gamma(2, 2, plates=(D,))
+        alpha.initialize_from_random()
+        X1 = GaussianARD(0, alpha, shape=(D,), plates=(10,))
+        X1.initialize_from_random()
+        X2 = GaussianARD(0, alpha, shape=(D,), plates=(4,2))
+        X2.initialize_from_random()
+        return (alpha, X1, X2)
+
+    def test_bound(self):
+        """
+        Test the combined bound of multiple rotators.
+        """
+
+        np.random.seed(42)
+        D = 3
+        (alpha, X1, X2) = self._model(D)
+        rot1 = RotateGaussianARD(X1)
+        rot2 = RotateGaussianARD(X2)
+        rot = RotateMultiple(rot1, rot2)
+        rot.setup()
+
+        self.assertEqual(rot.nodes(), [X1, X2])
+
+        R = np.random.randn(D, D)
+        (b1, db1) = rot1.bound(R)
+        (b2, db2) = rot2.bound(R)
+        for num_threads in [1, 2]:
+            try:
+                linalg.set_num_threads(num_threads)
+                with _parallel_blocks():
+                    (b, db) = rot.bound(R)
+            finally:
+                linalg.set_num_threads(1)
+            self.assertAllClose(b, b1+b2)
+            self.assertAllClose(db, db1+db2)
+
+        terms = rot.get_bound_terms(R)
+        self.assertEqual(set(terms.keys()), set([X1, X2]))
+
+    def test_map_blocks(self):
+        """
+        Test that nested block computations do not create more threads.
+        """
+
+        def inner(block):
+            return threading.current_thread()
+
+        def outer(block):
+            return (threading.current_thread(), 
+                    _map_blocks(inner, [1, 2, 3]))
+
+        try:
+            linalg.set_num_threads(2)
+            with _parallel_blocks():
+                results = _map_blocks(outer, [1, 2, 3, 4])
+            # Without the pool, the blocks are computed in this thread
+            self.assertEqual(_map_blocks(inner, [1, 2]),
+                             2*[threading.current_thread()])
+        finally:
+            linalg.set_num_threads(1)
+        threads = set()
+        for (thread, inner_threads) in results:
+            self.assertEqual(inner_threads, 3*[thread])
+            threads.add(thread)
+        self.assertLessEqual(len(threads), 2)
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_rotate_in_parallel(self):
+        """
+        Test the rotation of independent blocks using multiple threads.
+        """
+
+        np.random.seed(42)
+        D = 3
+        (alpha, X1, X2) = self._model(D)
+        W = GaussianARD(0, 1, shape=(D,), plates=(5,))
+        W.initialize_from_random()
+        
+        def lower_bound():
+            return (alpha.lower_bound_contribution()
+                    + X1.lower_bound_contribution()
+                    + X2.lower_bound_contribution()
+                    + W.lower_bound_contribution())
+
+        optimizer = RotationOptimizer(RotateMultiple(RotateGaussianARD(X1,
+                                                                       alpha),
+                                                     RotateGaussianARD(X2)),
+                                      RotateGaussianARD(W),
+                                      D)
+        L0 = lower_bound()
+        try:
+            linalg.set_num_threads(2)
+            optimizer.rotate(maxiter=5)
+        finally:
+            linalg.set_num_threads(1)
+        self.assertGreaterEqual(lower_bound(), L0 - 1e-8)
+
+
+class TestRotationOptimizer(TestCase):
+
+    def _model(self, D=4):
+        alpha = Gamma(1e-2, 1e-2, plates=(D,))
+        W = GaussianARD(0, alpha, shape=(D,), plates=(6,1))
+        X = GaussianARD(0, 1, shape=(D,), plates=(1,20))
+        Y = GaussianARD(SumMultiply('d,d', W, X), 10)
+        Y.observe(np.random.randn(6,20))
+        W.initialize_from_random()
+        X.initialize_from_random()
+        for node in [W, X, alpha]:
+            node.update()
+        return (Y, W, X, alpha)
+
+    def _check_rotation(self, rotation, r):
+        """
+        Check the matrix, the inverse and the gradient of a rotation family.
+        """
+
+        R = rotation.to_matrix(r)
+        (invR, logdetR) = rotation.invert(r)
+        self.assertAllClose(invR, np.linalg.inv(R))
+        self.assertAllClose(logdetR, np.linalg.slogdet(R)[1])
+
+        # Finite-difference gradient of tr(dR'*R(r))
+        dR = np.random.randn(*np.shape(R))
+        dr = rotation.gradient(r, dR)
+        eps = 1e-6
+        for n in range(np.size(r)):
+            e = np.zeros(np.size(r))
+            e[n] = eps
+            df = (np.sum(dR * rotation.to_matrix(r+e)) 
+                  - np.sum(dR * rotation.to_matrix(r-e))) / (2*eps)
+            self.assertAllClose(dr[n], df, atol=1e-6)
+
+    def test_low_rank_rotation(self):
+        """
+        Test the optimization of diagonal plus low-rank rotations.
+        """
+
+        np.random.seed(42)
+        D = 4
+
+        for rank in [1, 2]:
+            # The initial low-rank part does not use the random state
+            state = np.random.get_state()
+            rotation = _LowRankRotation(D, rank)
+            self.assertAllClose(np.random.get_state()[1], state[1])
+            self.assertAllClose(np.dot(rotation.V0.T, rotation.V0),
+                                np.identity(rank),
+                                atol=1e-10)
+            self.assertAllClose(rotation.to_matrix(rotation.initial()),
+                                np.identity(D))
+            r = rotation.initial() + 0.3*np.random.randn(D+2*D*rank)
+            self._check_rotation(rotation, r)
+
+        (Y, W, X, alpha) = self._model(D)
+        def lower_bound():
+            return sum(node.lower_bound_contribution()
+                       for node in [Y, W, X, alpha])
+        optimizer = RotationOptimizer(RotateGaussianARD(W, alpha),
+                                      RotateGaussianARD(X),
+                                      D,
+                                      rank=1)
+        L0 = lower_bound()
+        optimizer.rotate(maxiter=10, check_bound=True)
+        self.assertGreaterEqual(lower_bound(), L0 - 1e-8)
+
+        self.assertRaises(ValueError, _LowRankRotation, D, 0)
+        self.assertRaises(ValueError,
+                          RotationOptimizer,
+                          RotateGaussianARD(W, alpha),
+                          RotateGaussianARD(X),
+                          D,
+                          rank=1,
+                          block_sizes=[2,2])
+
+    def test_givens_rotation(self):
+        """
+        Test the optimization of scaled sequences of Givens rotations.
+        """
+
+        np.random.seed(42)
+        D = 4
+        givens = [(0,1), (2,3), (1,2), (0,3), (0,1)]
+
+        rotation = _GivensRotation(D, givens)
+        self.assertAllClose(rotation.to_matrix(rotation.initial()),
+                            np.identity(D))
+        r = np.concatenate([1 + 0.3*np.random.randn(D),
+                            np.random.randn(len(givens))])
+        self._check_rotation(rotation, r)
+
+        (Y, W, X, alpha) = self._model(D)
+        def lower_bound():
+            return sum(node.lower_bound_contribution()
+                       for node in [Y, W, X, alpha])
+        optimizer = RotationOptimizer(RotateGaussianARD(W, alpha),
+                                      RotateGaussianARD(X),
+                                      D,
+                                      givens=givens)
+        L0 = lower_bound()
+        optimizer.rotate(maxiter=10, check_bound=True)
+        self.assertGreaterEqual(lower_bound(), L0 - 1e-8)
+
+        self.assertRaises(ValueError, _GivensRotation, D, [(1,1)])
+        self.assertRaises(ValueError, _GivensRotation, D, [(0,D)])
+
+    def test_block_diagonal_rotation(self):
+        """
+        Test the optimization of block-diagonal rotations.
+        """
+
+        np.random.seed(42)
+        D = 4
+        (Y, W, X, alpha) = self._model(D)
+        def lower_bound():
+            return sum(node.lower_bound_contribution()
+                       for node in [Y, W, X, alpha])
+
+        for block_sizes in [[2,2], [1,1,1,1], [1,3]]:
+            optimizer = RotationOptimizer(RotateGaussianARD(W, alpha),
+                                          RotateGaussianARD(X),
+                                          D,
+                                          block_sizes=block_sizes)
+            L0 = lower_bound()
+            x0 = np.reshape(X.get_moments()[0], (-1,D))
+            optimizer.rotate(maxiter=10, check_bound=True)
+            self.assertGreaterEqual(lower_bound(), L0 - 1e-8)
+
+            # The rotation of X is block-diagonal
+            x1 = np.reshape(X.get_moments()[0], (-1,D))
+            R = np.linalg.lstsq(x0, x1, rcond=None)[0].T
+            mask = np.zeros((D,D), dtype=bool)
+            offset = 0
+            for d in block_sizes:
+                mask[offset:offset+d,offset:offset+d] = True
+                offset += d
+            self.assertAllClose(R[~mask], np.zeros(np.sum(~mask)), atol=1e-8)
+
+        self.assertRaises(ValueError,
+                          RotationOptimizer,
+                          RotateGaussianARD(W, alpha),
+                          RotateGaussianARD(X),
+                          D,
+                          block_sizes=[2,1])
@@ -0,0 +1,81 @@
+######################################################################
+# Copyright (C) 2014 Jaakko Luttinen
+#
+# This file is licensed under Version 3.0 of the GNU General Public
+# License. See LICENSE for a text of the license.
+######################################################################
+
+######################################################################
+# This file is part of BayesPy.
+#
+# BayesPy is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# BayesPy is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with BayesPy.  If not, see <http://www.gnu.org/licenses/>.
+######################################################################
+
+"""
+Unit tests for `vmp` module.
+"""
+
+import numpy as np
+
+from bayespy.nodes import (GaussianARD,
+                           Gamma,
+                           Mixture,
+                           Categorical,
+                           Dirichlet)
+
+from ..vmp import VB
+
+from bayespy.utils.utils import TestCase
+
+class TestVB(TestCase):
+
+    def _mixture_model(self):
+        np.random.seed(1)
+        K = 3
+        y = np.concatenate([np.random.randn(60) - 2,
+                            np.random.randn(60) + 0.5,
+                            0.5*np.random.randn(30) + 3])
+        pi = Dirichlet(np.ones(K))
+        z = Categorical(pi, plates=(len(y),))
+        mu = GaussianARD(0, 1e-3, plates=(K,), shape=())
+        tau = Gamma(1e-2, 1e-2, plates=(K,))
+        Y = Mixture(z, GaussianARD, mu, tau)
+        Y.observe(y)
+        z.initialize_from_random()
+        return VB(Y, mu, tau, z, pi)
+
+    def test_update_accelerated(self):
+        """
+        Test the accelerated VB updates.
+        """
+
+        # Standard updates
+        Q = self._mixture_model()
+        Q.update(repeat=60)
+        L = Q.L[-1]
+
+        # Each accelerated iteration uses three standard iterations
+        Q = self._mixture_model()
+        Q.update_accelerated(repeat=20)
+        self.assertEqual(len(Q.L), 20)
+        
+        # The lower bound never decreases and the acceleration finds at least
+        # as good bound
+        self.assertTrue(np.all(np.diff(Q.L) > -1e-6))
+        self.assertGreaterEqual(Q.L[-1], L - 1e-6)
+
+        # The accelerated iterations converge to the same solution
+        Q.update(repeat=5)
+        self.assertAllClose(Q.L[-1], Q.L[-6])
+
+        pass
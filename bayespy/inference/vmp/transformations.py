@@ -22,8 +22,14 @@
 ######################################################################
 
 import numpy as np
+import copy
 import warnings
+import threading
 import scipy
+import scipy.linalg
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 from bayespy import utils
 from bayespy.utils.linalg import dot, tracedot
@@ -32,18 +38,323 @@ from .nodes import gaussian
 
 from .nodes.categorical import CategoricalMoments
 
+# The thread pool of the ongoing rotation in this thread.  The worker threads
+# do not have it, thus nested block computations run sequentially in them.
+_context = threading.local()
+
+@contextmanager
+def _parallel_blocks():
+    """
+    Use one thread pool for the block computations within the context.
+
+    The pool has as many threads as allowed by
+    `bayespy.utils.linalg.set_num_threads`.  This is useful because the
+    computations are dominated by NumPy and LAPACK calls which release the
+    GIL.
+    """
+    num_threads = utils.linalg.get_num_threads()
+    if num_threads <= 1 or getattr(_context, 'executor', None) is not None:
+        yield
+        return
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        _context.executor = executor
+        try:
+            yield
+        finally:
+            _context.executor = None
+
+def _map_blocks(func, blocks):
+    """
+    Apply a function to independent blocks.
+
+    The blocks are processed in the thread pool of `_parallel_blocks` if it
+    is used in this thread, otherwise sequentially.
+    """
+    executor = getattr(_context, 'executor', None)
+    if executor is None or len(blocks) <= 1:
+        return [func(block) for block in blocks]
+    return list(executor.map(func, blocks))
+
+def _block_slices(block_sizes):
+    """
+    Index ranges of the diagonal blocks of the given sizes.
+    """
+    offsets = np.cumsum([0] + list(block_sizes))
+    return [slice(offsets[k], offsets[k+1]) for k in range(len(block_sizes))]
+
+def _block_dot(R, M, blocks=None):
+    """
+    Compute R*M for a block-diagonal R from its diagonal blocks.
+
+    M may have plates.
+    """
+    if blocks is None:
+        return np.matmul(R, M)
+    RM = np.empty(utils.utils.broadcasted_shape(np.shape(R), np.shape(M)))
+    for ind in blocks:
+        RM[...,ind,:] = np.matmul(R[...,ind,ind], M[...,ind,:])
+    return RM
+
+def _diagonal_blocks_dot(A, B, blocks=None):
+    """
+    Compute the diagonal blocks of A*B, the other elements are zero.
+
+    The traces with a block-diagonal matrix and the gradients with respect to
+    a block-diagonal matrix need only the diagonal blocks.
+    """
+    if blocks is None:
+        return np.matmul(A, B)
+    AB = np.zeros(utils.utils.broadcasted_shape(np.shape(A), np.shape(B)))
+    for ind in blocks:
+        AB[...,ind,ind] = np.matmul(A[...,ind,:], B[...,:,ind])
+    return AB
+
+def _gradient_of_inverse(invR, dB, blocks=None):
+    """
+    Compute the gradient with respect to R of a bound evaluated at inv(R)'.
+
+    Apply the chain rule:
+    d b(invR.T) 
+    = tr(db.T * d(invR.T)) 
+    = tr(db * d(invR))
+    = -tr(db * invR * (dR) * invR) 
+    = -tr(invR * db * invR * dR)
+
+    For a block-diagonal R, invR is block-diagonal too, thus only the diagonal
+    blocks of db affect the gradient with respect to the diagonal blocks of R.
+    """
+    if blocks is None or len(blocks) == 1:
+        return -dot(invR.T, dB.T, invR.T)
+    dR = np.zeros(np.shape(dB))
+    for ind in blocks:
+        dR[ind,ind] = -dot(invR[ind,ind].T, dB[ind,ind].T, invR[ind,ind].T)
+    return dR
+
+class _BlockDiagonalRotation():
+    """
+    Block-diagonal rotation with the given sizes of the diagonal blocks.
+
+    The parameters are the elements of the diagonal blocks.  The inverse and
+    the log-determinant are computed from one LU factorization for each block.
+    For more than one block, the log-determinants of the diagonal blocks are
+    returned as an array, so the rotators need not factorize the blocks
+    again.
+    """
+
+    def __init__(self, D, block_sizes):
+        if np.sum(block_sizes) != D or np.any(np.asarray(block_sizes) < 1):
+            raise ValueError("The sizes of the rotation blocks must be "
+                             "positive and sum to the dimensionality")
+        self.D = D
+        self.block_sizes = list(block_sizes)
+        self.blocks = _block_slices(block_sizes)
+        self.param_blocks = _block_slices([d**2 for d in block_sizes])
+
+    def initial(self):
+        return self.gradient(None, np.identity(self.D))
+
+    def to_matrix(self, r):
+        if len(self.blocks) == 1:
+            return np.reshape(r, (self.D,self.D))
+        R = np.zeros((self.D,self.D))
+        for (ind, param_ind) in zip(self.blocks, self.param_blocks):
+            R[ind,ind] = np.reshape(r[param_ind], (ind.stop-ind.start,)*2)
+        return R
+
+    def invert(self, r):
+        invR = np.zeros((self.D,self.D))
+        logdetR = np.zeros(len(self.blocks))
+        for (k, (ind, param_ind)) in enumerate(zip(self.blocks, 
+                                                  self.param_blocks)):
+            d = ind.stop - ind.start
+            (LU, piv) = scipy.linalg.lu_factor(np.reshape(r[param_ind], (d,d)))
+            invR[ind,ind] = scipy.linalg.lu_solve((LU, piv), np.identity(d))
+            logdetR[k] = np.sum(np.log(np.abs(np.diag(LU))))
+        if len(self.blocks) == 1:
+            return (invR, logdetR[0])
+        return (invR, logdetR)
+
+    def gradient(self, r, dR):
+        """
+        Take the gradient with respect to the parameters from the diagonal
+        blocks.
+        """
+        if len(self.blocks) == 1:
+            return np.ravel(dR)
+        return np.concatenate([np.ravel(dR[ind,ind]) for ind in self.blocks])
+
+class _LowRankRotation():
+    """
+    Diagonal scaling plus a low-rank part: R = diag(s) + U*V'.
+
+    The inverse and the log-determinant are computed with the Woodbury
+    identity and the matrix determinant lemma, thus only k x k matrices are
+    factorized for rank k.  The inverse is still formed as a dense matrix for
+    the bounds of the blocks.
+    """
+
+    blocks = None
+
+    def __init__(self, D, rank):
+        if rank < 1 or rank > D:
+            raise ValueError("The rank must be between one and the "
+                             "dimensionality")
+        self.D = D
+        self.rank = rank
+        # The gradient with respect to U is zero if V is zero, thus start from
+        # a non-zero V and zero U, that is, from the identity rotation.  The
+        # columns of V are the lowest frequency vectors of the orthonormal
+        # cosine basis, which spread over all the dimensions.
+        d = np.arange(D)[:,None]
+        j = np.arange(rank)[None,:]
+        self.V0 = np.cos(np.pi * (d + 0.5) * j / D) * np.sqrt(2 / D)
+        self.V0[:,0] = 1 / np.sqrt(D)
+
+    def _split(self, r):
+        (D, k) = (self.D, self.rank)
+        return (r[:D], 
+                np.reshape(r[D:D+D*k], (D,k)), 
+                np.reshape(r[D+D*k:], (D,k)))
+
+    def initial(self):
+        return np.concatenate([np.ones(self.D), 
+                               np.zeros(self.D*self.rank),
+                               np.ravel(self.V0)])
+
+    def to_matrix(self, r):
+        (s, U, V) = self._split(r)
+        return np.diag(s) + dot(U, V.T)
+
+    def invert(self, r):
+        (s, U, V) = self._split(r)
+        invS_U = U / s[:,None]
+        K = np.identity(self.rank) + dot(V.T, invS_U)
+        logdetR = np.sum(np.log(np.abs(s))) + np.linalg.slogdet(K)[1]
+        invR = np.diag(1/s) - dot(invS_U, np.linalg.solve(K, V.T / s))
+        return (invR, logdetR)
+
+    def gradient(self, r, dR):
+        (s, U, V) = self._split(r)
+        return np.concatenate([np.diag(dR), 
+                               np.ravel(dot(dR, V)),
+                               np.ravel(dot(dR.T, U))])
+
+class _GivensRotation():
+    """
+    Diagonal scaling of a sequence of Givens rotations: R = diag(s)*G_1*...*G_m
+
+    G_j rotates the plane of the j-th pair of indices by angle theta_j.  The
+    rotations are orthogonal, thus the inverse is G_m'*...*G_1'*diag(1/s) and
+    the log-determinant is sum(log|s|).  The gradient with respect to the
+    angles is computed in one sweep over the rotations.
+    """
+
+    blocks = None
+
+    def __init__(self, D, givens):
+        givens = [(int(i), int(j)) for (i, j) in givens]
+        if any(i == j or min(i, j) < 0 or max(i, j) >= D 
+               for (i, j) in givens):
+            raise ValueError("The Givens rotations must be given as pairs of "
+                             "distinct indices smaller than the "
+                             "dimensionality")
+        self.D = D
+        self.givens = givens
+
+    def initial(self):
+        return np.concatenate([np.ones(self.D), np.zeros(len(self.givens))])
+
+    def _product(self, theta):
+        G = np.identity(self.D)
+        for ((i, j), t) in zip(self.givens, theta):
+            _rotate_columns(G, i, j, t)
+        return G
+
+    def to_matrix(self, r):
+        return r[:self.D,None] * self._product(r[self.D:])
+
+    def invert(self, r):
+        s = r[:self.D]
+        return (self._product(r[self.D:]).T / s, np.sum(np.log(np.abs(s))))
+
+    def gradient(self, r, dR):
+        s = r[:self.D]
+        theta = r[self.D:]
+        G = self._product(theta)
+        ds = np.sum(dR * G, axis=1)
+        # M_j = (diag(s)*G_1*...*G_{j-1})' * dR * (G_{j+1}*...*G_m)'
+        M = s[:,None] * dR
+        for ((i, j), t) in reversed(list(zip(self.givens[1:], theta[1:]))):
+            _rotate_columns(M, i, j, -t)
+        dtheta = np.zeros(len(self.givens))
+        for (n, ((i, j), t)) in enumerate(zip(self.givens, theta)):
+            (c, sn) = (np.cos(t), np.sin(t))
+            dtheta[n] = (-sn * (M[i,i] + M[j,j]) 
+                         - c * M[i,j] 
+                         + c * M[j,i])
+            if n + 1 < len(self.givens):
+                _rotate_columns(M.T, i, j, t)
+                ((i, j), t) = (self.givens[n+1], theta[n+1])
+                _rotate_columns(M, i, j, t)
+        return np.concatenate([ds, dtheta])
+
+def _rotate_columns(A, i, j, theta):
+    """
+    Multiply A by the Givens rotation of the plane (i,j) from the right in
+    place.
+    """
+    (c, s) = (np.cos(theta), np.sin(theta))
+    (a_i, a_j) = (A[:,i].copy(), A[:,j].copy())
+    A[:,i] = c*a_i + s*a_j
+    A[:,j] = -s*a_i + c*a_j
+
 class RotationOptimizer():
 
-    def __init__(self, block1, block2, D):
+    def __init__(self, block1, block2, D, block_sizes=None, rank=None,
+                 givens=None):
+        """
+        The rotation is a full D x D matrix by default.  For high-dimensional
+        latent spaces, the rotation can be restricted to a structured family,
+        which reduces the number of optimized parameters.  At most one of the
+        following can be given:
+
+        `block_sizes` restricts the rotation to be block-diagonal with the
+        given sizes of the diagonal blocks (e.g., a list of ones gives a
+        diagonal scaling).  The sizes are given to the `setup` methods of the
+        blocks, so they can compute the bound block by block.  Only this
+        family reduces the cost of each evaluation of the bound.
+
+        `rank` gives a diagonal scaling plus a low-rank part of the given rank.
+
+        `givens` is a list of pairs of indices.  The rotation is a diagonal
+        scaling of the sequence of Givens rotations of those planes.
+
+        The low-rank and Givens families give the blocks the dense rotation
+        matrix, its inverse and its log-determinant, thus the bounds cost as
+        much as for a full rotation.  The optimizer has fewer parameters,
+        though.
+        """
         self.block1 = block1
         self.block2 = block2
         self.D = D
+        if sum(x is not None for x in (block_sizes, rank, givens)) > 1:
+            raise ValueError("Only one structure can be given for the "
+                             "rotation")
+        if rank is not None:
+            self.rotation = _LowRankRotation(D, rank)
+        elif givens is not None:
+            self.rotation = _GivensRotation(D, givens)
+        elif block_sizes is not None:
+            self.rotation = _BlockDiagonalRotation(D, block_sizes)
+        else:
+            self.rotation = _BlockDiagonalRotation(D, [D])
 
     def rotate(self, 
                maxiter=10, 
                check_gradient=False,
                verbose=False,
-               check_bound=False):
+               check_bound=False,
+               method='L-BFGS-B'):
         """
         Optimize the rotation of two separate model blocks jointly.
 
@@ -54,38 +365,68 @@ class RotationOptimizer():
         First block is rotated with :math:`\mathbf{R}` and the second with
         :math:`\mathbf{R}^{-T}`.
 
-        Blocks must have methods: `bound(U,s,V)` and `rotate(R)`.
+        Blocks must have methods: `bound(U,s,V)` and `rotate(R)`.  The bounds
+        of the two blocks are evaluated in parallel if more threads have been
+        allowed by `bayespy.utils.linalg.set_num_threads`.
+
+        For block-diagonal rotations, the blocks are set up with
+        `setup(block_sizes=...)`.  Then, the bounds may be computed block by
+        block and only the diagonal blocks of the gradients need to be
+        computed.  The log-determinant is given to the bounds as an array of
+        the log-determinants of the diagonal blocks.
+
+        The R-independent statistics are computed once in the `setup` methods
+        of the blocks, thus each evaluation of the cost function is cheap and a
+        quasi-Newton method (`method`) is used for the optimization.
         """
+        with _parallel_blocks():
+            self._rotate(maxiter=maxiter,
+                         check_gradient=check_gradient,
+                         verbose=verbose,
+                         check_bound=check_bound,
+                         method=method)
 
-        I = np.identity(self.D)
-        piv = np.arange(self.D)
+    def _rotate(self, maxiter, check_gradient, verbose, check_bound, method):
+
+        rotation = self.rotation
+        to_matrix = rotation.to_matrix
+
+        # The inverse and the log-determinant of the latest evaluated
+        # rotation. The optimizer may evaluate the same point several times.
+        latest = {'r': None}
         
+        def invert(r):
+            """
+            Compute the inverse and the log-determinant of R.
+            """
+            if latest['r'] is None or not np.array_equal(r, latest['r']):
+                (latest['invR'], latest['logdetR']) = rotation.invert(r)
+                latest['r'] = np.copy(r)
+            return (latest['invR'], latest['logdetR'])
+
         def cost(r):
 
             # Make vector-r into matrix-R
-            R = np.reshape(r, (self.D,self.D))
+            R = to_matrix(r)
 
-            # Compute SVD
-            invR = np.linalg.inv(R)
-            logdetR = np.linalg.slogdet(R)[1]
+            # Compute the inverse and the log-determinant
+            (invR, logdetR) = invert(r)
 
-            # Compute lower bound terms
-            (b1,db1) = self.block1.bound(R, logdet=logdetR, inv=invR)
-            (b2,db2) = self.block2.bound(invR.T, logdet=-logdetR, inv=R.T)
+            # Compute lower bound terms. The blocks are independent given the
+            # rotation so they can be evaluated in parallel.
+            ((b1,db1), (b2,db2)) = _map_blocks(
+                lambda args: args[0].bound(args[1], logdet=args[2], inv=args[3]),
+                [(self.block1, R, logdetR, invR),
+                 (self.block2, invR.T, -logdetR, R.T)])
 
-            # Apply chain rule for the second gradient:
-            # d b(invR.T) 
-            # = tr(db.T * d(invR.T)) 
-            # = tr(db * d(invR))
-            # = -tr(db * invR * (dR) * invR) 
-            # = -tr(invR * db * invR * dR)
-            db2 = -dot(invR.T, db2.T, invR.T)
+            # Apply chain rule for the second gradient
+            db2 = _gradient_of_inverse(invR, db2, rotation.blocks)
 
             # Compute the cost function
             c = -(b1+b2)
             dc = -(db1+db2)
 
-            return (c, np.ravel(dc))
+            return (c, rotation.gradient(r, dc))
 
         def get_bound_terms(r, gradient=False):
             """
@@ -96,11 +437,10 @@ class RotationOptimizer():
                 raise NotImplementedError()
             
             # Make vector-r into matrix-R
-            R = np.reshape(r, (self.D,self.D))
+            R = to_matrix(r)
 
-            # Compute SVD
-            invR = np.linalg.inv(R)
-            logdetR = np.linalg.slogdet(R)[1]
+            # Compute the inverse and the log-determinant
+            (invR, logdetR) = invert(r)
 
             # Compute lower bound terms
             dict1 = self.block1.get_bound_terms(R, 
@@ -131,35 +471,43 @@ class RotationOptimizer():
             return D
 
 
-        self.block1.setup()
-        self.block2.setup()
+        # Block-diagonal rotations can be computed block by block
+        if rotation.blocks is not None and len(rotation.blocks) > 1:
+            self.block1.setup(block_sizes=rotation.block_sizes)
+            self.block2.setup(block_sizes=rotation.block_sizes)
+        else:
+            self.block1.setup()
+            self.block2.setup()
         
+        # Initial rotation is identity matrix
+        r0 = rotation.initial()
+
         if check_gradient:
-            R = np.random.randn(self.D, self.D)
-            err = utils.optimize.check_gradient(cost, np.ravel(R), 
-                                                verbose=verbose)
+            r = np.random.randn(np.size(r0))
+            err = utils.optimize.check_gradient(cost, r, verbose=verbose)
             if err > 1e-5:
                 warnings.warn("Rotation gradient has relative error %g" % err)
 
-        # Initial rotation is identity matrix
-        r0 = np.ravel(np.identity(self.D))
-
         (cost_begin, _) = cost(r0)
         if check_bound:
             bound_terms_begin = get_bound_terms(r0)
             true_bound_terms_begin = get_true_bound_terms()
 
         # Run optimization
-        r = utils.optimize.minimize(cost, r0, maxiter=maxiter, verbose=verbose)
+        r = utils.optimize.minimize(cost, 
+                                    r0, 
+                                    maxiter=maxiter, 
+                                    verbose=verbose,
+                                    method=method)
 
         (cost_end, _) = cost(r)
         if check_bound:
             bound_terms_end = get_bound_terms(r)
 
         # Apply the optimal rotation
-        R = np.reshape(r, (self.D,self.D))
-        invR = np.linalg.inv(R)
-        logdetR = np.linalg.slogdet(R)[1]
+        R = to_matrix(r)
+        (invR, logdetR) = invert(r)
+        logdetR = np.sum(logdetR)
         self.block1.rotate(R, inv=invR, logdet=logdetR)
         self.block2.rotate(invR.T, inv=R.T, logdet=-logdetR)
 
@@ -215,9 +563,12 @@ class RotateGaussian():
     def rotate(self, R, inv=None, logdet=None):
         self.X.rotate(R, inv=inv, logdet=logdet)
 
-    def setup(self):
+    def setup(self, block_sizes=None):
         """
         This method should be called just before optimization.
+
+        The bound is computed for the full rotation matrix also for
+        block-diagonal rotations.
         """
         
         mask = self.X.mask[...,np.newaxis,np.newaxis]
@@ -255,7 +606,7 @@ class RotateGaussian():
         XX_R = dot(R, self.XX, R.T)
 
         inv_R = inv
-        logdet_R = logdet
+        logdet_R = np.sum(logdet)
 
         # Compute entropy H(X)
         logH_X = utils.random.gaussian_entropy(-2*self.N*logdet_R, 
@@ -371,7 +722,7 @@ class RotateGaussianARD():
     Requirements:
     * X and alpha do not contain any observed values
     """
-    def __init__(self, X, *alpha, axis=-1, precompute=False):
+    def __init__(self, X, *alpha, axis=-1, precompute=False, max_memory=None):
         """
         Precompute tells whether to compute some moments once in the setup
         function instead of every time in the bound function.  However, they are
@@ -379,9 +730,17 @@ class RotateGaussianARD():
         too. Precomputation is probably beneficial only when there are large
         axes that are not rotated (by R nor Q) and they are not contained in the
         plates of alpha, and the dimensions for R and Q are quite small.
+
+        If `max_memory` (in bytes) is given, the second moments are summed to
+        the plates of alpha in chunks of a plate axis of X in the setup
+        function.  Thus, the memory usage does not grow with the number of
+        plates that are summed over.  The chunks are processed in parallel if
+        more threads have been allowed by `bayespy.utils.linalg.set_num_threads`.
+        Chunking is not used when rotating plates.
         """
         
         self.precompute = precompute
+        self.max_memory = max_memory
         
         if len(alpha) == 0:
             alpha = X.parents[1]
@@ -425,13 +784,23 @@ class RotateGaussianARD():
         if self.update_alpha:
             self.node_alpha.update()
 
-    def setup(self, plate_axis=None):
+    def setup(self, plate_axis=None, block_sizes=None):
         """
         This method should be called just before optimization.
 
         For efficiency, sum over axes that are not in mu, alpha nor rotation.
 
         If using Q, set rotate_plates to True.
+
+        If `block_sizes` is given, the rotation R is block-diagonal with the
+        given sizes of the diagonal blocks.  The bound is a sum over the
+        rotated dimensions, which a block-diagonal rotation does not couple.
+        Thus, the bound is computed block by block from the statistics of the
+        diagonal blocks only, and the gradient is computed for the diagonal
+        blocks of R, whose log-determinants are given to the bounds as an
+        array.  The plate rotation Q can still be a full matrix.  If the
+        rotated dimensions share the updated precision alpha, the bound is not
+        separable and it is computed for the full R.
         """
 
         # Store the original plate_axis parameter for later use in other methods
@@ -457,21 +826,6 @@ class RotateGaussianARD():
 
         (X, XX) = self.node_X.get_moments()
 
-        # Take diagonal of covariances to variances for axes that are not in R
-        # (and move those axes to be the last)
-        XX = covariance_to_variance(XX,
-                                    ndim=self.ndim,
-                                    covariance_axis=self.axis)
-        mumu = covariance_to_variance(mumu,
-                                      ndim=self.ndim, 
-                                      covariance_axis=self.axis)
-        
-        # Move axes of X and mu and compute their outer product
-        X = utils.utils.moveaxis(X, self.axis, -1)
-        mu = utils.utils.moveaxis(mu, self.axis, -1)
-        Xmu = utils.linalg.outer(X, mu, ndim=1)
-        D = np.shape(X)[-1]
-        
         # Move axes of alpha related variables
         def safe_move_axis(x):
             if np.ndim(x) >= -self.axis:
@@ -496,16 +850,17 @@ class RotateGaussianARD():
         plates_X = list(self.node_X.get_shape(0))
         plates_X.pop(self.axis)
 
-        def sum_to_alpha(V):
+        def sum_to_alpha(V, plates_from=plates_X):
             # TODO/FIXME: This could be improved so that it is not required to
             # explicitly repeat to alpha plates. Multiplying by ones was just a
             # simple bug fix.
             return sum_to_plates(V * np.ones(plates_alpha[:-1]+[1,1]),
                                  plates_alpha[:-1],
                                  ndim=2,
-                                 plates_from=plates_X)
+                                 plates_from=plates_from)
         
         if plate_axis is not None:
+            (X, XX, mu, mumu) = self._transform_moments(X, XX, mu, mumu)
             # Move plate axis just before the rotated dimensions (which are
             # last)
             def safe_move_plate_axis(x, ndim):
@@ -565,9 +920,11 @@ class RotateGaussianARD():
                     
         else:
             # Sum axes that are not in the plates of alpha
-            self.XX = sum_to_alpha(XX)
-            self.mumu = sum_to_alpha(mumu)
-            self.Xmu = sum_to_alpha(Xmu)
+            (self.XX, self.mumu, self.Xmu) = self._sum_moments(X, 
+                                                               XX, 
+                                                               mu, 
+                                                               mumu,
+                                                               sum_to_alpha)
             
         
         if self.update_alpha:
@@ -580,6 +937,181 @@ class RotateGaussianARD():
         self.plates_X = plates_X
         self.plates_alpha = plates_alpha
 
+        # Split the statistics into the diagonal blocks of the rotation. If
+        # the rotated dimensions share the updated precision, q(alpha)
+        # couples the blocks and the bound is computed for the full matrix.
+        if block_sizes is None or len(block_sizes) == 1:
+            self.blocks = None
+        elif self.update_alpha and plates_alpha[-1] == 1:
+            self.blocks = None
+        else:
+            # The block rotators are copies of this rotator, so they must not
+            # be split further
+            self.blocks = None
+            self.blocks = [(ind, self._take_block(ind))
+                           for ind in _block_slices(block_sizes)]
+
+    def _take_block(self, ind):
+        """
+        Make a rotator for a diagonal block of the rotation.
+
+        The rotator uses the statistics of the block, that is, the rotated
+        axes of the statistics are sliced.  The rotated axis is the last one
+        in the vectors, the two last ones in the matrices and the third last
+        and the last one in the precomputed plate rotation terms.
+        """
+        def take(x, *axes):
+            for ndim in axes:
+                x = utils.utils.take_chunk(x, ind, ndim)
+            return x
+        block = copy.copy(self)
+        for name in ('a', 'a0', 'b0', 'alpha', 'X', 'mu'):
+            if hasattr(self, name):
+                setattr(block, name, take(getattr(self, name), 1))
+        for name in ('XX', 'mumu', 'Xmu', 'CovX'):
+            if hasattr(self, name):
+                setattr(block, name, take(getattr(self, name), 1, 2))
+        for name in ('X_X', 'X_mu'):
+            if hasattr(self, name):
+                setattr(block, name, take(getattr(self, name), 1, 3))
+        block.plates_alpha = list(self.plates_alpha)
+        if block.plates_alpha[-1] > 1:
+            block.plates_alpha[-1] = ind.stop - ind.start
+        return block
+
+    def _compute_block_bounds(self, R, logdet=None, inv=None, Q=None, 
+                              gradient=False, terms=False):
+        """
+        Sum the bounds of the diagonal blocks of a block-diagonal R.
+
+        The log-determinant can be given as the log-determinants of the
+        diagonal blocks.  The gradient with respect to R is computed for the diagonal
+        blocks only.
+        """
+        results = []
+        for (k, (ind, block)) in enumerate(self.blocks):
+            R_b = R[ind,ind]
+            if inv is None:
+                (inv_b, logdet_b) = (None, None)
+            elif np.ndim(logdet) == 0:
+                # Only the total log-determinant is known
+                inv_b = inv[ind,ind]
+                logdet_b = np.linalg.slogdet(R_b)[1]
+            else:
+                inv_b = inv[ind,ind]
+                logdet_b = logdet[k]
+            results.append(block._compute_bound(R_b, 
+                                                logdet=logdet_b, 
+                                                inv=inv_b, 
+                                                Q=Q, 
+                                                gradient=gradient, 
+                                                terms=terms))
+
+        if not gradient:
+            if not terms:
+                return sum(results)
+            bound = {}
+            for result in results:
+                for (node, term) in result.items():
+                    bound[node] = bound.get(node, 0) + term
+            return bound
+
+        bound = sum(result[0] for result in results)
+        dR_bound = np.zeros(np.shape(R))
+        for ((ind, _), result) in zip(self.blocks, results):
+            dR_bound[ind,ind] = result[1]
+        if self.plate_axis is None:
+            return (bound, dR_bound)
+        dQ_bound = sum(result[2] for result in results)
+        return (bound, dR_bound, dQ_bound)
+
+    def _transform_moments(self, X, XX, mu, mumu):
+        """
+        Move the rotated axis to be the last and take the variances of the
+        other axes.
+        """
+        # Take diagonal of covariances to variances for axes that are not in R
+        # (and move those axes to be the last)
+        XX = covariance_to_variance(XX,
+                                    ndim=self.ndim,
+                                    covariance_axis=self.axis)
+        mumu = covariance_to_variance(mumu,
+                                      ndim=self.ndim, 
+                                      covariance_axis=self.axis)
+        
+        # Move axes of X and mu
+        X = utils.utils.moveaxis(X, self.axis, -1)
+        mu = utils.utils.moveaxis(mu, self.axis, -1)
+        return (X, XX, mu, mumu)
+
+    def _sum_moments(self, X, XX, mu, mumu, sum_to_alpha):
+        """
+        Compute the second moments summed to the plates of alpha.
+
+        If `max_memory` is given, the moments are processed in chunks of the
+        largest plate axis of X which is summed over.  Thus, the temporary
+        arrays are approximately within the budget regardless of the size of
+        that axis.
+        """
+
+        def compute(chunk=None, axis=None):
+            if chunk is None:
+                (X_i, XX_i, mu_i, mumu_i) = (X, XX, mu, mumu)
+                plates_i = plates_X
+            else:
+                ndim = len(plates) - axis + self.ndim
+                X_i = utils.utils.take_chunk(X, chunk, ndim)
+                XX_i = utils.utils.take_chunk(XX, chunk, ndim+self.ndim)
+                mu_i = utils.utils.take_chunk(mu, chunk, ndim)
+                mumu_i = utils.utils.take_chunk(mumu, chunk, ndim+self.ndim)
+                plates_i = list(plates_X)
+                plates_i[axis] = chunk.stop - chunk.start
+            (X_i, XX_i, mu_i, mumu_i) = self._transform_moments(X_i,
+                                                                XX_i,
+                                                                mu_i,
+                                                                mumu_i)
+            Xmu_i = utils.linalg.outer(X_i, mu_i, ndim=1)
+            return (sum_to_alpha(XX_i, plates_from=plates_i),
+                    sum_to_alpha(mumu_i, plates_from=plates_i),
+                    sum_to_alpha(Xmu_i, plates_from=plates_i))
+
+        plates = self.node_X.plates
+        shape = self.node_X.get_shape(0)
+        plates_X = list(shape)
+        plates_X.pop(self.axis)
+
+        # Plates of alpha aligned with the shape of X
+        plates_alpha = self.node_alpha.plates
+        plates_alpha = (len(shape)-len(plates_alpha))*(1,) + tuple(plates_alpha)
+
+        # Plate axes of X which are summed over
+        axes = [i for i in range(len(plates)) 
+                if plates[i] > 1 and plates_alpha[i] == 1]
+        if self.max_memory is None or len(axes) == 0:
+            return compute()
+
+        # The size of the transformed second moments and their products to
+        # the plates of alpha before summing
+        nbytes = 3 * 8 * np.prod(shape) * shape[self.axis]
+        max_memory = self.max_memory / utils.linalg.get_num_threads()
+        if nbytes <= max_memory:
+            return compute()
+        axis = max(axes, key=lambda i: plates[i])
+        N = plates[axis]
+        step = max(1, int(N * max_memory / nbytes))
+        chunks = [slice(start, min(start+step, N)) 
+                  for start in range(0, N, step)]
+        results = _map_blocks(lambda chunk: compute(chunk, axis), chunks)
+
+        # Accumulate the sums of the chunks
+        moments = None
+        for result in results:
+            if moments is None:
+                moments = list(result)
+            else:
+                for (m, r) in zip(moments, result):
+                    m += r
+        return tuple(moments)
 
     def _compute_bound(self, R, logdet=None, inv=None, Q=None, gradient=False, terms=False):
         """
@@ -590,6 +1122,14 @@ class RotateGaussianARD():
         p(alpha) = prod_d G(a_d,b_d)
         """
 
+        if self.blocks is not None:
+            return self._compute_block_bounds(R,
+                                              logdet=logdet,
+                                              inv=inv,
+                                              Q=Q,
+                                              gradient=gradient,
+                                              terms=terms)
+
         #
         # Transform the distributions and moments
         #
@@ -692,7 +1232,7 @@ class RotateGaussianARD():
             logdet_R = np.linalg.slogdet(R)[1]
             inv_R = np.linalg.inv(R)
         else:
-            logdet_R = logdet
+            logdet_R = np.sum(logdet)
             inv_R = inv
 
         # Compute entropy H(X)
@@ -1082,10 +1622,19 @@ class RotateGaussianMarkovChain():
         
         return (A_XpXn, A_XpXp_A, CovA_XpXp)
 
-    def setup(self):
+    def setup(self, block_sizes=None):
         """
         This method should be called just before optimization.
+
+        If `block_sizes` is given, the rotation R is block-diagonal with the
+        given sizes of the diagonal blocks and only the diagonal blocks of the
+        transformed moments are computed.
         """
+
+        if block_sizes is None or len(block_sizes) == 1:
+            self.blocks = None
+        else:
+            self.blocks = _block_slices(block_sizes)
         
         # Get moments of X
         (X, XnXn, XpXn) = self.X_node.get_moments()
@@ -1117,6 +1666,17 @@ class RotateGaussianMarkovChain():
                                           plates_from=self.X_node.plates,
                                           ndim=2)
 
+        # If the precision matrix is shared by the plates, sum the second
+        # moments of the initial states over the plates already here
+        if np.ndim(self.Lambda) == 2:
+            self.X0X0 = sum_to_plates(self.X0X0,
+                                      (),
+                                      plates_from=self.X_node.plates,
+                                      ndim=2)
+            self.plates_X0X0 = ()
+        else:
+            self.plates_X0X0 = self.X_node.plates
+
         #
         # Prepare the rotation for A
         #
@@ -1126,7 +1686,7 @@ class RotateGaussianMarkovChain():
          self.CovA_XpXp) = self._computations_for_A_and_X(XpXn, XpXp)
 
         
-        self.A_rotator.setup(plate_axis=-1)
+        self.A_rotator.setup(plate_axis=-1, block_sizes=block_sizes)
 
         # Innovation noise is assumed to be I
         #self.v = self.X_node.parents[3].get_moments()[0]
@@ -1155,16 +1715,23 @@ class RotateGaussianMarkovChain():
         if logdet is None:
             logdetR = np.linalg.slogdet(R)[1]
         else:
-            logdetR = logdet
+            logdetR = np.sum(logdet)
 
-        # Transform moments of X and A:
+        # Transform moments of X and A. The bound needs only traces with R
+        # and the gradient is needed only for the non-zero elements of R, thus
+        # only the diagonal blocks of the products are computed for a
+        # block-diagonal R.
+        blocks = self.blocks
         
-        Lambda_R_X0X0 = sum_to_plates(dot(self.Lambda, R, self.X0X0),
+        Lambda_R_X0X0 = _diagonal_blocks_dot(self.Lambda,
+                                             _block_dot(R, self.X0X0, blocks),
+                                             blocks)
+        Lambda_R_X0X0 = sum_to_plates(Lambda_R_X0X0,
                                       (),
-                                      plates_from=self.X_node.plates,
+                                      plates_from=self.plates_X0X0,
                                       ndim=2)
-        R_XnXn = dot(R, self.XnXn)
-        RA_XpXp_A = dot(R, self.A_XpXp_A)
+        R_XnXn = _diagonal_blocks_dot(R, self.XnXn, blocks)
+        RA_XpXp_A = _diagonal_blocks_dot(R, self.A_XpXp_A, blocks)
         sumr = np.sum(R, axis=0)
         R_CovA_XpXp = sumr * self.CovA_XpXp
 
@@ -1175,7 +1742,8 @@ class RotateGaussianMarkovChain():
 
         # Compute <log p(X)>
         yy = tracedot(R_XnXn, R.T) + tracedot(Lambda_R_X0X0, R.T)
-        yz = tracedot(dot(R,self.A_XpXn),R.T) + tracedot(self.Lambda_mu_X0, R.T)
+        yz = (tracedot(_diagonal_blocks_dot(R, self.A_XpXn, blocks), R.T)
+              + tracedot(self.Lambda_mu_X0, R.T))
         zz = tracedot(RA_XpXp_A, R.T) + np.einsum('...k,...k->...',
                                                   R_CovA_XpXp,
                                                   sumr)
@@ -1200,7 +1768,8 @@ class RotateGaussianMarkovChain():
 
         # Compute d<log p(X)>
         dyy = 2 * (R_XnXn + Lambda_R_X0X0)
-        dyz = dot(R, self.A_XpXn + self.A_XpXn.T) + self.Lambda_mu_X0
+        dyz = (_diagonal_blocks_dot(R, self.A_XpXn + self.A_XpXn.T, blocks)
+               + self.Lambda_mu_X0)
         dzz = 2 * (RA_XpXp_A + R_CovA_XpXp[None,:])
         dlogp_X = utils.random.gaussian_logpdf(dyy,
                                                dyz,
@@ -1236,7 +1805,7 @@ class RotateGaussianMarkovChain():
                                                                  inv=R.T,
                                                                  logdet=-logdet,
                                                                  Q=R)
-        dR_bound_A = -dot(inv.T, dR_bound_A.T, inv.T)
+        dR_bound_A = _gradient_of_inverse(inv, dR_bound_A, self.blocks)
 
         # Compute the bound
         bound = bound_X + bound_A
@@ -1447,6 +2016,11 @@ class RotateSwitchingMarkovChain(RotateGaussianMarkovChain):
 class RotateMultiple():
     """
     Performs the same rotation for multiple nodes and combines the cost effect.
+
+    The rotators are independent given the rotation, thus their bounds are
+    evaluated in the thread pool of the rotation if more threads have been
+    allowed by `bayespy.utils.linalg.set_num_threads`.  Within a worker thread
+    of the pool, the bounds are evaluated sequentially.
     """
 
     def __init__(self, *rotators):
@@ -1454,23 +2028,26 @@ class RotateMultiple():
 
     def nodes(self):
         return [node
-                for node in rotator.nodes()
-                for rotator in self.rotators]
+                for rotator in self.rotators
+                for node in rotator.nodes()]
 
     def rotate(self, R, inv=None, logdet=None):
         for rotator in self.rotators:
             rotator.rotate(R, inv=inv, logdet=logdet)
 
-    def setup(self):
+    def setup(self, block_sizes=None):
         for rotator in self.rotators:
-            rotator.setup()
+            rotator.setup(block_sizes=block_sizes)
     
     def bound(self, R, logdet=None, inv=None):
         bound = 0
         dbound = 0
         
-        for rotator in self.rotators:
-            (b, db) = rotator.bound(R, logdet=logdet, inv=inv)
+        results = _map_blocks(lambda rotator: rotator.bound(R, 
+                                                            logdet=logdet, 
+                                                            inv=inv),
+                              self.rotators)
+        for (b, db) in results:
             bound = bound + b
             dbound = dbound + db
 
@@ -1478,5 +2055,7 @@ class RotateMultiple():
 
     def get_bound_terms(self, R, logdet=None, inv=None):
         return {node: terms 
-                for (node, terms) in rotator.items()
-                for rotator in self.rotators}
+                for rotator in self.rotators
+                for (node, terms) in rotator.get_bound_terms(R, 
+                                                             logdet=logdet,
+                                                             inv=inv).items()}
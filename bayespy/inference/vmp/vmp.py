@@ -32,6 +32,7 @@ import tempfile
 from bayespy import utils
 
 from bayespy.inference.vmp.nodes.node import Node
+from bayespy.inference.vmp.nodes.expfamily import ExponentialFamily
 
 class VB():
 
@@ -71,6 +72,9 @@ class VB():
         self.callback = callback
         self.callback_output = None
 
+        # The maximum step length of the accelerated updates
+        self.step_max = 1
+
     def set_autosave(self, filename, iterations=None):
         self.autosave_filename = filename
         self.filename = filename
@@ -94,55 +98,164 @@ class VB():
             nodes = self.model
 
         for i in range(repeat):
-            t = time.clock()
+            t = time.time()
 
             # Update nodes
-            for node in nodes:
-                X = self[node]
-                if hasattr(X, 'update') and callable(X.update):
-                    X.update()
-                    if plot:
-                        self.plot(X)
-
-            # Call the custom function provided by the user
-            if callable(self.callback):
-                z = self.callback()
-                if z is not None:
-                    z = np.array(z)[...,np.newaxis]
-                    if self.callback_output is None:
-                        self.callback_output = z
-                    else:
-                        self.callback_output = np.concatenate((self.callback_output,z),
-                                                              axis=-1)
-
-            # Compute lower bound
-            L = self.loglikelihood_lowerbound()
-            print("Iteration %d: loglike=%e (%.3f seconds)" 
-                  % (self.iter+1, L, time.clock()-t))
-
-            # Check the progress of the iteration
-            if self.iter > 0:
-                # Check for errors
-                if self.L[self.iter-1] - L > 1e-6:
-                    L_diff = (self.L[self.iter-1] - L)
-                    warnings.warn("Lower bound decreased %e! Bug somewhere or "
-                                  "numerical inaccuracy?" % L_diff)
-
-                # Check for convergence
-                if L - self.L[self.iter-1] < 1e-12:
-                    print("Converged.")
-
-            self.L[self.iter] = L
-            self.iter += 1
-
-            # Auto-save, if requested
-            if (self.autosave_iterations > 0 
-                and np.mod(self.iter, self.autosave_iterations) == 0):
-
-                self.save(self.autosave_filename)
-                print('Auto-saved to %s' % self.autosave_filename)
+            self._update_nodes(nodes, plot=plot)
+
+            self._end_iteration_step(t)
+
+    def update_accelerated(self, *nodes, repeat=1, plot=False):
+        """
+        Update nodes using accelerated VB.
+
+        Each iteration extrapolates the natural parameters of the exponential
+        family nodes along the trajectory of two standard VB iterations using
+        the squared extrapolation method (SQUAREM, scheme S3) and stabilizes
+        the result by one more standard iteration.  If the extrapolation fails
+        (e.g., the parameters become invalid) or it does not improve the lower
+        bound, the result of the two standard iterations is used instead.
+        Thus, the lower bound never decreases but each iteration costs three
+        standard iterations.  The maximum step length is increased after
+        successful steps of the maximum length and decreased after failures.
+        """
+
+        # Append the cost arrays
+        self.L = np.append(self.L, utils.utils.nans(repeat))
+        for (node, l) in self.l.items():
+            self.l[node] = np.append(l, utils.utils.nans(repeat))
+
+        # By default, update all nodes
+        if len(nodes) == 0:
+            nodes = self.model
 
+        # Extrapolate the nodes which are (at least partly) unobserved
+        accelerated = [self[node] for node in nodes
+                       if isinstance(self[node], ExponentialFamily)
+                       and not np.all(self[node].observed)]
 
+        for i in range(repeat):
+            t = time.time()
+
+            # Two standard VB iterations
+            phi0 = self._get_phi(accelerated)
+            self._update_nodes(nodes, plot=plot)
+            phi1 = self._get_phi(accelerated)
+            self._update_nodes(nodes, plot=plot)
+            phi2 = self._get_phi(accelerated)
+            L2 = self.compute_lowerbound()
+
+            # The first and the second differences of the trajectory
+            r = [[phi1_i - phi0_i 
+                  for (phi0_i, phi1_i) in zip(phi0_node, phi1_node)]
+                 for (phi0_node, phi1_node) in zip(phi0, phi1)]
+            v = [[phi2_i - phi1_i - r_i
+                  for (phi1_i, phi2_i, r_i) in zip(phi1_node, 
+                                                   phi2_node, 
+                                                   r_node)]
+                 for (phi1_node, phi2_node, r_node) in zip(phi1, phi2, r)]
+            norm_r = np.sqrt(sum(np.sum(r_i**2) 
+                                 for r_node in r 
+                                 for r_i in r_node))
+            norm_v = np.sqrt(sum(np.sum(v_i**2) 
+                                 for v_node in v 
+                                 for v_i in v_node))
+
+            # Step length. A step of -1 would give the result of the two
+            # standard iterations. If the step is limited by the maximum step
+            # length, the maximum is increased after a success and decreased
+            # after a failure.
+            if norm_v > 0 and np.isfinite(norm_r) and np.isfinite(norm_v):
+                alpha = -norm_r / norm_v
+            else:
+                alpha = -1
+            limited = (alpha <= -self.step_max)
+            alpha = max(alpha, -self.step_max)
+
+            success = True
+            if alpha < -1:
+                phi = [[phi0_i - 2*alpha*r_i + alpha**2*v_i
+                        for (phi0_i, r_i, v_i) in zip(phi0_node, 
+                                                      r_node, 
+                                                      v_node)]
+                       for (phi0_node, r_node, v_node) in zip(phi0, r, v)]
+                # The extrapolated parameters may be invalid
+                try:
+                    with np.errstate(all='ignore'):
+                        self._set_phi(accelerated, phi)
+                        self._update_nodes(nodes, plot=plot)
+                        L = self.compute_lowerbound()
+                except (np.linalg.LinAlgError, ValueError):
+                    L = np.nan
+                if not L >= L2:
+                    # Fall back to the standard iterations
+                    self._set_phi(accelerated, phi2)
+                    success = False
+
+            if limited:
+                if success:
+                    self.step_max *= 4
+                else:
+                    self.step_max = max(1, self.step_max / 4)
+
+            self._end_iteration_step(t)
+
+    def _update_nodes(self, nodes, plot=False):
+        for node in nodes:
+            X = self[node]
+            if hasattr(X, 'update') and callable(X.update):
+                X.update()
+                if plot:
+                    self.plot(X)
+
+    @staticmethod
+    def _get_phi(nodes):
+        return [[np.copy(phi_i) for phi_i in node.phi] for node in nodes]
+
+    @staticmethod
+    def _set_phi(nodes, phi):
+        for (node, phi_node) in zip(nodes, phi):
+            node.phi = [np.copy(phi_i) for phi_i in phi_node]
+            node._update_moments_and_cgf()
+
+    def _end_iteration_step(self, t):
+        # Call the custom function provided by the user
+        if callable(self.callback):
+            z = self.callback()
+            if z is not None:
+                z = np.array(z)[...,np.newaxis]
+                if self.callback_output is None:
+                    self.callback_output = z
+                else:
+                    self.callback_output = np.concatenate((self.callback_output,z),
+                                                          axis=-1)
+
+        # Compute lower bound
+        L = self.loglikelihood_lowerbound()
+        print("Iteration %d: loglike=%e (%.3f seconds)" 
+              % (self.iter+1, L, time.time()-t))
+
+        # Check the progress of the iteration
+        if self.iter > 0:
+            # Check for errors
+            if self.L[self.iter-1] - L > 1e-6:
+                L_diff = (self.L[self.iter-1] - L)
+                warnings.warn("Lower bound decreased %e! Bug somewhere or "
+                              "numerical inaccuracy?" % L_diff)
+
+            # Check for convergence
+            if L - self.L[self.iter-1] < 1e-12:
+                print("Converged.")
+
+        self.L[self.iter] = L
+        self.iter += 1
+
+        # Auto-save, if requested
+        if (self.autosave_iterations > 0 
+            and np.mod(self.iter, self.autosave_iterations) == 0):
+
+            self.save(self.autosave_filename)
+            print('Auto-saved to %s' % self.autosave_filename)
 
     def compute_lowerbound(self):
         L = 0
@@ -27,6 +27,8 @@ General numerical functions and methods.
 """
 
 import itertools
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import scipy as sp
 #import scipy.linalg.decomp_cholesky as decomp
@@ -44,88 +46,175 @@ import scipy.sparse as sparse
 #from .utils import nested_iterator
 from . import utils
 
+# Number of threads used by the batched matrix kernels. The kernels call
+# NumPy's LAPACK routines which release the GIL, thus large collections of
+# matrices can be processed in parallel.
+_num_threads = 1
+_executor = None
+
+# The minimum number of matrices processed by one thread
+_min_chunk = 1000
+
+def set_num_threads(num_threads):
+    """
+    Set the number of threads used by the batched matrix kernels.
+
+    The plates (i.e., the collection of matrices) are split into chunks which
+    are processed in parallel.  By default, only one thread is used.
+    """
+    global _num_threads, _executor
+    num_threads = int(num_threads)
+    if num_threads < 1:
+        raise ValueError("The number of threads must be positive")
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+    _num_threads = num_threads
+
+def get_num_threads():
+    """
+    Get the number of threads used by the batched matrix kernels.
+    """
+    return _num_threads
+
+def _map_matrices(func, A):
+    """
+    Apply a batched function to a collection of square matrices.
+
+    The last two axes of A are considered as the matrix and `func` must
+    broadcast over the leading axes (e.g., `numpy.linalg.cholesky`).  If more
+    than one thread is allowed, the matrices are processed in chunks in
+    parallel.
+    """
+    global _executor
+    A = np.asanyarray(A)
+    shape = np.shape(A)
+    M = int(np.prod(shape[:-2]))
+    num_chunks = min(_num_threads, M // _min_chunk)
+    if num_chunks <= 1:
+        return func(A)
+
+    # Flatten the plates and process chunks of matrices in parallel
+    A = np.reshape(A, (M,) + shape[-2:])
+    out = np.empty(np.shape(A))
+    bounds = np.linspace(0, M, num_chunks+1).astype(int)
+    def process(n):
+        out[bounds[n]:bounds[n+1]] = func(A[bounds[n]:bounds[n+1]])
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=_num_threads)
+    list(_executor.map(process, range(num_chunks)))
+    return np.reshape(out, shape)
+
+def _solve_triangular(U, B, trans=False, lower=False):
+    """
+    Solve triangular systems U*X=B (or U'*X=B) for a collection of matrices.
+
+    The last two axes of U and B are considered as the matrices and the other
+    axes are broadcasted.  Only the upper (or lower) triangular part of U is
+    used.  No factorization is needed, thus the plates of B which are
+    broadcasted over a triangular matrix cost only the substitutions.
+
+    If there are fewer plates in U than rows, each triangular matrix is
+    solved in one LAPACK call with the broadcasted plates of B moved into the
+    right-hand-side columns.  Otherwise, the substitution is done row by row
+    for all the plates at once.
+    """
+    U = np.atleast_2d(U)
+    B = np.asanyarray(B)
+    D = np.shape(U)[-1]
+    plates_U = np.shape(U)[:-2]
+    plates = utils.broadcasted_shape(plates_U, np.shape(B)[:-2])
+    plates_U = (1,) * (len(plates) - len(plates_U)) + plates_U
+    B = np.broadcast_to(B, plates + np.shape(B)[-2:])
+    M = int(np.prod(plates_U))
+
+    if M < D:
+        # Move the plates over which U is broadcasted into the columns
+        axes_U = [i for i in range(len(plates)) if plates_U[i] != 1]
+        axes_B = [i for i in range(len(plates)) if plates_U[i] == 1]
+        n = len(plates)
+        B = np.transpose(B, axes_U + [n] + axes_B + [n+1])
+        shape = np.shape(B)
+        B = np.reshape(B, (M, D, -1))
+        U = np.reshape(U, (M, D, D))
+        X = np.empty(np.shape(B))
+        for m in range(M):
+            X[m] = linalg.solve_triangular(U[m], 
+                                           B[m], 
+                                           trans=(1 if trans else 0),
+                                           lower=lower,
+                                           check_finite=False)
+        X = np.reshape(X, shape)
+        return np.transpose(X, np.argsort(axes_U + [n] + axes_B + [n+1]))
+
+    # Substitute row by row, the solved rows are in X
+    if trans:
+        U = utils.T(U)
+        lower = not lower
+    X = np.empty(np.shape(B))
+    for i in (range(D) if lower else reversed(range(D))):
+        solved = slice(0, i) if lower else slice(i+1, D)
+        X[...,i,:] = ((B[...,i,:]
+                       - np.matmul(U[...,i:i+1,solved], X[...,solved,:])[...,0,:])
+                      / U[...,i,i,np.newaxis])
+    return X
+
+def _inv_triangular(U):
+    """
+    Invert upper triangular matrices for a collection of matrices.
+
+    The inverse is upper triangular too, thus the substitution is done only
+    for the upper triangular part.
+    """
+    U = np.atleast_2d(U)
+    D = np.shape(U)[-1]
+    if np.size(U) // (D*D) < D:
+        return _solve_triangular(U, np.identity(D))
+    X = np.zeros(np.shape(U))
+    for i in reversed(range(D)):
+        X[...,i,i] = 1 / U[...,i,i]
+        X[...,i,i+1:] = (-np.matmul(U[...,i:i+1,i+1:], 
+                                    X[...,i+1:,i+1:])[...,0,:]
+                         * X[...,i,i,np.newaxis])
+    return X
+
 def chol(C):
     if sparse.issparse(C):
         # Sparse Cholesky decomposition (returns a Factor object)
         return cholmod.cholesky(C)
     else:
         # Computes Cholesky decomposition for a collection of matrices.
-        # The last two axes of C are considered as the matrix.
+        # The last two axes of C are considered as the matrix. All the
+        # matrices are decomposed in one batched call. Return the upper
+        # triangular factor U, that is, C=U'*U.
         C = np.atleast_2d(C)
-        U = np.empty(np.shape(C))
-        for i in utils.nested_iterator(np.shape(U)[:-2]):
-            try:
-                U[i] = linalg.cho_factor(C[i])[0]
-            except np.linalg.linalg.LinAlgError:
-                print(C[i])
-                raise Exception("Matrix not positive definite")
-        return U
+        try:
+            L = _map_matrices(np.linalg.cholesky, C)
+        except np.linalg.LinAlgError:
+            raise np.linalg.LinAlgError("Matrix not positive definite")
+        return utils.T(L)
 
 def chol_solve(U, b, out=None, matrix=False):
     if isinstance(U, np.ndarray):
         if sparse.issparse(b):
             b = b.toarray()
 
-        if matrix:
-            if np.ndim(b) < 2:
-                raise ValueError("b is not a matrix")
-            b = np.swapaxes(b, -1, -2)
-            U = U[...,None,:,:]
-            
-            
-        # Allocate memory
-        U = np.atleast_2d(U)
-        B = np.atleast_1d(b)
-        sh_u = U.shape[:-2]
-        sh_b = B.shape[:-1]
-        l_u = len(sh_u)
-        l_b = len(sh_b)
-
-        # Check which axis are iterated over with B along with U
-        ind_b = [Ellipsis] * l_b
-        l_min = min(l_u, l_b)
-        jnd_b = tuple(i for i in range(-l_min,0) if sh_b[i]==sh_u[i])
-
-        if out == None:
-            # Shape of the result (broadcasting rules)
-            sh = utils.broadcasted_shape(sh_u, sh_b)
-            #out = np.zeros(np.shape(B))
-            out = np.zeros(sh + B.shape[-1:])
-        for i in utils.nested_iterator(np.shape(U)[:-2]):
-
-            # The goal is to run Cholesky solver once for all vectors of B
-            # for which the matrices of U are the same (according to the
-            # broadcasting rules). Thus, we collect all the axes of B for
-            # which U is singleton and form them as a 2-D matrix and then
-            # run the solver once.
-
-            # Select those axes of B for which U and B are not singleton
-            for j in jnd_b:
-                ind_b[j] = i[j]
-
-            # Collect all the axes for which U is singleton
-            b = B[tuple(ind_b) + (Ellipsis,)]
-
-            # Reshape it to a 2-D (or 1-D) array
-            orig_shape = b.shape
-            if b.ndim > 1:
-                b = b.reshape((-1, b.shape[-1]))
-
-            # Ellipsis to all preceeding axes and ellipsis for the last
-            # axis:
-            if len(ind_b) < len(sh):
-                ind_out = (Ellipsis,) + tuple(ind_b) + (Ellipsis,)
-            else:
-                ind_out = tuple(ind_b) + (Ellipsis,)
-
-            out[ind_out] = linalg.cho_solve((U[i], False),
-                                            b.T).T.reshape(orig_shape)
-
+        if matrix and np.ndim(b) < 2:
+            raise ValueError("b is not a matrix")
 
+        # Solve U'*z=b and U*x=z for all the plates at once using
+        # triangular solves instead of explicit inverses
         if matrix:
-            out = np.swapaxes(out, -1, -2)
-            
-        return out
+            x = _solve_triangular(U, _solve_triangular(U, b, trans=True))
+        else:
+            b = np.atleast_1d(b)[...,np.newaxis]
+            x = _solve_triangular(U, _solve_triangular(U, b, trans=True))
+            x = x[...,0]
+
+        if out is not None:
+            out[...] = x
+            return out
+        return x
 
     elif isinstance(U, cholmod.Factor):
         if matrix:
@@ -136,16 +225,34 @@ def chol_solve(U, b, out=None, matrix=False):
     else:
         raise ValueError("Unknown type of Cholesky factor")
 
+def chol_solve_shared(U, B):
+    """
+    Solve linear systems which all share the same Cholesky factor.
+
+    U is a single upper triangular Cholesky factor with shape (D,D) and B has
+    shape (...,D). All the vectors in B are solved with one multiple
+    right-hand-side call instead of iterating over the plates.
+    """
+    B = np.asanyarray(B)
+    U = np.reshape(U, np.shape(U)[-2:])
+    D = np.shape(U)[-1]
+    X = linalg.cho_solve((U, False), np.reshape(B, (-1, D)).T)
+    return np.reshape(X.T, np.shape(B))
+
+def has_shared_matrix(A):
+    """
+    Check whether all plates share the same matrix.
+
+    This is true if all the leading (plate) axes of the matrix array A have unit
+    length, that is, the matrix is broadcasted over the plates.
+    """
+    return np.size(A) == np.prod(np.shape(A)[-2:])
+
 def chol_inv(U):
     if isinstance(U, np.ndarray):
-        # Allocate memory
-        V = np.tile(np.identity(np.shape(U)[-1]), np.shape(U)[:-2]+(1,1))
-        for i in utils.nested_iterator(np.shape(U)[:-2]):
-            V[i] = linalg.cho_solve((U[i], False),
-                                    V[i],
-                                    overwrite_b=True) # This would need Fortran order
-
-        return V
+        # Compute inv(U'*U) = inv(U)*inv(U)' for all the plates at once
+        invU = _inv_triangular(U)
+        return np.matmul(invU, utils.T(invU))
     elif isinstance(U, cholmod.Factor):
         raise NotImplementedError
         ## if sparse.issparse(b):
@@ -178,55 +285,19 @@ def logdet_tri(R):
 def logdet_cov(C):
     return logdet_chol(chol(C))
 
-def solve_triangular(U, B, **kwargs):
-    # Allocate memory
-    U = np.atleast_2d(U)
-    B = np.atleast_1d(B)
-    sh_u = U.shape[:-2]
-    sh_b = B.shape[:-1]
-    l_u = len(sh_u)
-    l_b = len(sh_b)
-
-    # Check which axis are iterated over with B along with U
-    ind_b = [Ellipsis] * l_b
-    l_min = min(l_u, l_b)
-    jnd_b = tuple(i for i in range(-l_min,0) if sh_b[i]==sh_u[i])
-
-    # Shape of the result (broadcasting rules)
-    sh = utils.broadcasted_shape(sh_u, sh_b)
-    out = np.zeros(sh + B.shape[-1:])
-    for i in utils.nested_iterator(np.shape(U)[:-2]):
-
-        # The goal is to run triangular solver once for all vectors of
-        # B for which the matrices of U are the same (according to the
-        # broadcasting rules). Thus, we collect all the axes of B for
-        # which U is singleton and form them as a 2-D matrix and then
-        # run the solver once.
-        
-        # Select those axes of B for which U and B are not singleton
-        for j in jnd_b:
-            ind_b[j] = i[j]
-            
-        # Collect all the axes for which U is singleton
-        b = B[tuple(ind_b) + (Ellipsis,)]
-
-        # Reshape it to a 2-D (or 1-D) array
-        orig_shape = b.shape
-        if b.ndim > 1:
-            b = b.reshape((-1, b.shape[-1]))
-
-        # Ellipsis to all preceeding axes and ellipsis for the last
-        # axis:
-        if len(ind_b) < len(sh):
-            ind_out = (Ellipsis,) + tuple(ind_b) + (Ellipsis,)
-        else:
-            ind_out = tuple(ind_b) + (Ellipsis,)
+def solve_triangular(U, B, trans=0, lower=False):
+    """
+    Solve triangular systems for a collection of matrices.
 
-        out[ind_out] = linalg.solve_triangular(U[i],
-                                               b.T,
-                                               **kwargs).T.reshape(orig_shape)
-        
-    return out
+    The last two axes of U are considered as the matrix and the last axis of B
+    as the vector. Other axes are broadcasted.
+    """
+    B = np.atleast_1d(B)[...,np.newaxis]
+    X = _solve_triangular(U, 
+                          B, 
+                          trans=(trans in (1, 2, 'T', 'C')), 
+                          lower=lower)
+    return X[...,0]
     
 
     
@@ -330,7 +401,22 @@ def m_dot(A,b):
     # TODO: Use einsum!!
     #return np.sum(A*b[...,np.newaxis,:], axis=(-1,))
 
-def block_banded_solve(A, B, y):
+def _overwritable(X, shape, overwrite):
+    """
+    Return X if it can be used as an output array of the given shape.
+
+    Otherwise, allocate a new array.
+    """
+    if (overwrite 
+        and isinstance(X, np.ndarray)
+        and np.shape(X) == shape
+        and X.dtype == np.float64
+        and X.flags.writeable):
+        return X
+    return np.empty(shape)
+
+
+def block_banded_solve(A, B, y, overwrite=False, tol=None):
     """
     Invert symmetric, banded, positive-definite matrix.
 
@@ -351,6 +437,16 @@ def block_banded_solve(A, B, y):
 
     Assume each block has the same size.
 
+    If `overwrite` is True, the diagonal and super-diagonal blocks of the
+    inverse are computed in-place into A and B whenever their shapes and
+    types allow, so no additional memory is needed for them.
+
+    If `tol` is given, the recursions exploit time-invariant parts of the
+    chain: when consecutive blocks of A and B are equal and the forward
+    (or backward) recursion has converged within the relative tolerance
+    `tol`, the steady-state blocks are reused instead of computing a new
+    factorization at every step.
+
     Return:
     * inverse blocks
     * solution to the system
@@ -378,8 +474,10 @@ def block_banded_solve(A, B, y):
     plates_y = utils.broadcasted_shape(plates_VC,
                                        np.shape(y)[:-2])
                       
-    V = np.empty(plates_VC+(N,D,D))
-    C = np.empty(plates_VC+(N-1,D,D))
+    # Each block of A and B is read before the corresponding block of V and
+    # C is written, thus they can share the memory.
+    V = _overwritable(A, plates_VC+(N,D,D), overwrite)
+    C = _overwritable(B, plates_VC+(N-1,D,D), overwrite)
     x = np.empty(plates_y+(N,D))
 
     #
@@ -389,50 +487,232 @@ def block_banded_solve(A, B, y):
     # In the forward recursion, store the Cholesky factor in V. So you
     # don't need to recompute them in the backward recursion.
 
-    # TODO: This whole algorithm could be implemented as in-place operation.
-    # Might be a nice feature (optional?)
+    # Find the time-invariant parts of the chain: same_A[n] tells whether
+    # A[n+1]==A[n] and same_B[n] whether B[n+1]==B[n].
+    if tol is not None:
+        same_A = _equal_blocks(A[...,1:,:,:], A[...,:-1,:,:])
+        same_B = _equal_blocks(B[...,1:,:,:], B[...,:-1,:,:])
+
+    # copied[n] tells whether the forward step n was skipped because the
+    # recursion had converged, that is, C[n]=C[n-1] and V[n+1]=V[n].
+    copied = np.zeros(N, dtype=bool)
+    steady = False
 
     x[...,0,:] = y[...,0,:]
     V[...,0,:,:] = chol(A[...,0,:,:])
-    ldet = chol_logdet(V[...,0,:,:])
+    ldet_n = chol_logdet(V[...,0,:,:])
+    ldet = ldet_n
     for n in range(N-1):
+        if steady and same_B[n-1] and same_A[n]:
+            # Steady state: use the same gain and Cholesky factor
+            copied[n] = True
+            C[...,n,:,:] = C[...,n-1,:,:]
+            V[...,n+1,:,:] = V[...,n,:,:]
+        else:
+            # Compute the superdiagonal block of the inverse
+            Cn = chol_solve(V[...,n,:,:], 
+                            B[...,n,:,:],
+                            matrix=True)
+            # Compute the diagonal block
+            V[...,n+1,:,:] = (A[...,n+1,:,:] 
+                              - mmdot(utils.T(B[...,n,:,:]), Cn))
+            C[...,n,:,:] = Cn
+            # Ensure symmetry by 0.5*(V+V.T)
+            V[...,n+1,:,:] = 0.5 * (V[...,n+1,:,:] 
+                                    + utils.T(V[...,n+1,:,:]))
+            # Compute and store the Cholesky factor of the diagonal block
+            V[...,n+1,:,:] = chol(V[...,n+1,:,:])
+            # Compute the log-det term here, too
+            ldet_n = chol_logdet(V[...,n+1,:,:])
+            steady = (tol is not None 
+                      and _converged(V[...,n+1,:,:], V[...,n,:,:], tol))
+        ldet = ldet + ldet_n
         # Compute the solution of the system
+        # (C[n] = inv(V[n])*B[n], thus C[n]' = B[n]'*inv(V[n]))
         x[...,n+1,:] = (y[...,n+1,:] 
-                        - mvdot(utils.T(B[...,n,:,:]), 
-                                chol_solve(V[...,n,:,:], 
-                                           x[...,n,:])))
-        # Compute the superdiagonal block of the inverse
-        C[...,n,:,:] = chol_solve(V[...,n,:,:], 
-                                  B[...,n,:,:],
-                                  matrix=True)
-        # Compute the diagonal block
-        V[...,n+1,:,:] = (A[...,n+1,:,:] 
-                        - mmdot(utils.T(B[...,n,:,:]), C[...,n,:,:]))
-        # Ensure symmetry by 0.5*(V+V.T)
-        V[...,n+1,:,:] = 0.5 * (V[...,n+1,:,:] + utils.T(V[...,n+1,:,:]))
-        # Compute and store the Cholesky factor of the diagonal block
-        V[...,n+1,:,:] = chol(V[...,n+1,:,:])
-        # Compute the log-det term here, too
-        ldet += chol_logdet(V[...,n+1,:,:])
+                        - mvdot(utils.T(C[...,n,:,:]), x[...,n,:]))
 
     #
     # Backward recursion
     #
-    x[...,-1,:] = chol_solve(V[...,-1,:,:], x[...,-1,:])
-    V[...,-1,:,:] = chol_inv(V[...,-1,:,:])
+    invV = chol_inv(V[...,-1,:,:])
+    x[...,-1,:] = mvdot(invV, x[...,-1,:])
+    V[...,-1,:,:] = invV
+    steady = False
     for n in reversed(range(N-1)):
+        # The forward quantities of this step equal those of the next step
+        # if both steps were copied
+        same = copied[n] and copied[n+1]
+        if not copied[n]:
+            invV = chol_inv(V[...,n,:,:])
         # Compute the solution of the system
-        x[...,n,:] = chol_solve(V[...,n,:,:], 
-                                x[...,n,:] - mvdot(B[...,n,:,:], 
-                                                   x[...,n+1,:]))
+        # (C contains inv(V[n])*B[n] from the forward recursion)
+        x[...,n,:] = (mvdot(invV, x[...,n,:])
+                      - mvdot(C[...,n,:,:], x[...,n+1,:]))
+        if steady and same:
+            # Steady state: copy the blocks of the inverse
+            V[...,n,:,:] = V[...,n+1,:,:]
+            C[...,n,:,:] = C[...,n+1,:,:]
+            continue
         # Compute the diagonal block of the inverse
-        V[...,n,:,:] = (chol_inv(V[...,n,:,:]) 
+        V[...,n,:,:] = (invV 
                         + mmdot(C[...,n,:,:], 
                                 mmdot(V[...,n+1,:,:], 
                                 utils.T(C[...,n,:,:]))))
         C[...,n,:,:] = - mmdot(C[...,n,:,:], V[...,n+1,:,:])
         # Ensure symmetry by 0.5*(V+V.T)
         V[...,n,:,:] = 0.5 * (V[...,n,:,:] + utils.T(V[...,n,:,:]))
+        steady = (same
+                  and _converged(V[...,n,:,:], V[...,n+1,:,:], tol))
+
+    return (V, C, x, ldet)
+
+
+def _equal_blocks(X, Y):
+    """
+    Check which consecutive blocks are equal over all plates.
+    """
+    eq = np.all(X == Y, axis=(-1,-2))
+    return np.all(eq, axis=tuple(range(np.ndim(eq)-1)))
+
+
+def _converged(X, X0, tol):
+    """
+    Check whether X equals X0 up to a relative tolerance.
+    """
+    return np.max(np.abs(X - X0)) <= tol * np.max(np.abs(X0))
+
+
+def block_banded_cyclic_reduction(A, B, y, overwrite=False):
+    """
+    Invert symmetric, banded, positive-definite matrix by cyclic reduction.
+
+    Computes the same quantities as `block_banded_solve` but instead of
+    sequential forward and backward recursions over the N blocks, the
+    odd-indexed blocks are eliminated in one batched step, which yields
+    a block-tridiagonal Schur complement of half the size.  The reduced
+    system is solved recursively and the eliminated blocks are recovered
+    by batched back-substitution.  Thus, the depth of the recursion is
+    O(log N) and each level processes all its D x D blocks with a single
+    NumPy call (see `set_num_threads` for using multiple threads).
+
+    Shapes:
+    A: (...,   N, D, D)
+    B: (..., N-1, D, D)
+    y: (...,   N,    D)
+
+    If `overwrite` is True, the blocks of the inverse are stored in A and
+    B whenever their shapes and types allow.
+
+    Return:
+    * diagonal blocks of the inverse
+    * super-diagonal blocks of the inverse
+    * solution to the system
+    * log-determinant
+    """
+
+    # Number of time instance and dimensionality
+    N = np.shape(y)[-2]
+    D = np.shape(y)[-1]
+
+    # Check the shape of the diagonal blocks
+    if np.shape(A)[-3] != N:
+        raise ValueError("The number of diagonal blocks is incorrect")
+    if np.shape(A)[-2:] != (D,D):
+        raise ValueError("The diagonal blocks have wrong shape")
+
+    # Check the shape of the super-diagonal blocks
+    if np.shape(B)[-3] != N-1:
+        raise ValueError("The number of super-diagonal blocks is incorrect")
+    if np.shape(B)[-2:] != (D,D):
+        raise ValueError("The diagonal blocks have wrong shape")
+
+    plates_VC = utils.broadcasted_shape(np.shape(A)[:-3],
+                                        np.shape(B)[:-3])
+    plates_y = utils.broadcasted_shape(plates_VC,
+                                       np.shape(y)[:-2])
+    # Broadcast only when needed so that the arrays can be overwritten
+    if np.shape(A) != plates_VC + (N,D,D):
+        A = np.broadcast_to(A, plates_VC + (N,D,D))
+    if np.shape(B) != plates_VC + (N-1,D,D):
+        B = np.broadcast_to(B, plates_VC + (N-1,D,D))
+    if np.shape(y) != plates_y + (N,D):
+        y = np.broadcast_to(y, plates_y + (N,D))
+
+    return _cyclic_reduction(A, B, y, overwrite)
+
+
+def _cyclic_reduction(A, B, y, overwrite):
+    """
+    Recursive step of `block_banded_cyclic_reduction`.
+
+    The plates of A and B must be equal and the plates of y must contain
+    them.
+    """
+
+    N = np.shape(A)[-3]
+    D = np.shape(A)[-1]
+
+    if N == 1:
+        return block_banded_solve(A, B, y, overwrite=overwrite)
+
+    # Each odd block 2k+1 is coupled to the even block 2k through B[2k] and
+    # to the even block 2k+2 through B[2k+1].  If N is even, the last odd
+    # block has no right neighbour, thus there are N_odd odd blocks but
+    # only N_right of them have both neighbours.
+    N_odd = N // 2
+    N_right = (N-1) // 2
+    B_left = B[...,0::2,:,:]
+    B_right = B[...,1::2,:,:]
+
+    # Eliminate the odd blocks
+    U = chol(A[...,1::2,:,:])
+    invA_odd = chol_inv(U)
+    P = np.matmul(invA_odd, utils.T(B_left))
+    Q = np.matmul(invA_odd[...,:N_right,:,:], B_right)
+    z = chol_solve(U, y[...,1::2,:])
+    ldet = np.sum(chol_logdet(U), axis=-1)
+
+    # Form the block-tridiagonal Schur complement of the even blocks
+    A_schur = np.array(A[...,0::2,:,:])
+    A_schur[...,:N_odd,:,:] -= np.matmul(B_left, P)
+    A_schur[...,1:,:,:] -= np.matmul(utils.T(B_right), Q)
+    A_schur = 0.5 * (A_schur + utils.T(A_schur))
+    B_schur = -np.matmul(B_left[...,:N_right,:,:], Q)
+    y_schur = np.array(y[...,0::2,:])
+    y_schur[...,:N_odd,:] -= mvdot(B_left, z)
+    y_schur[...,1:,:] -= mvdot(utils.T(B_right), z[...,:N_right,:])
+
+    # Solve the reduced system. Its arrays are temporary so they can be
+    # overwritten.
+    (V_even, C_even, x_even, ldet_even) = _cyclic_reduction(A_schur,
+                                                            B_schur,
+                                                            y_schur,
+                                                            True)
+    ldet = ldet + ldet_even
+
+    # Back-substitute the odd blocks
+    PV = np.matmul(P, V_even[...,:N_odd,:,:])
+    PV[...,:N_right,:,:] += np.matmul(Q, utils.T(C_even))
+    QV = (np.matmul(P[...,:N_right,:,:], C_even) 
+          + np.matmul(Q, V_even[...,1:,:,:]))
+    V_odd = invA_odd + np.matmul(PV, utils.T(P))
+    V_odd[...,:N_right,:,:] += np.matmul(QV, utils.T(Q))
+    V_odd = 0.5 * (V_odd + utils.T(V_odd))
+
+    x_odd = z - mvdot(P, x_even[...,:N_odd,:])
+    x_odd[...,:N_right,:] -= mvdot(Q, x_even[...,1:,:])
+
+    # Interleave the blocks. A and B are not needed anymore, so the results
+    # can be written in them.
+    V = _overwritable(A, np.shape(A), overwrite)
+    C = _overwritable(B, np.shape(B), overwrite)
+    x = np.empty(np.shape(y))
+    V[...,0::2,:,:] = V_even
+    V[...,1::2,:,:] = V_odd
+    C[...,0::2,:,:] = -utils.T(PV)
+    C[...,1::2,:,:] = -QV
+    x[...,0::2,:] = x_even
+    x[...,1::2,:] = x_odd
 
     return (V, C, x, ldet)
-    
@@ -24,16 +24,18 @@
 import numpy as np
 from scipy import optimize
 
-def minimize(f, x0, maxiter=None, verbose=False):
+def minimize(f, x0, maxiter=None, verbose=False, method='CG'):
     """
     Simple wrapper for SciPy's optimize.
 
-    The given function must return a tuple: (value, gradient).
+    The given function must return a tuple: (value, gradient). The method can
+    be any gradient-based method of scipy.optimize.minimize, for instance,
+    'CG' or 'L-BFGS-B'.
     """
     options = {'disp': verbose}
     if maxiter is not None:
         options['maxiter'] = maxiter
-    opt = optimize.minimize(f, x0, jac=True, method='CG', options=options)
+    opt = optimize.minimize(f, x0, jac=True, method=method, options=options)
     return opt.x
 
 def check_gradient(f, x0, verbose=True):
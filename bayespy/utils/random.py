@@ -26,6 +26,7 @@ General functions random sampling and distributions.
 """
 
 import numpy as np
+import scipy.sparse as sp
 
 from . import linalg
 from . import utils
@@ -317,6 +318,13 @@ def alpha_beta_recursion(logp0, logP):
 
     logp0 = log P(z_0) + log P(y_0|z_0)
     logP[...,n,:,:] = log P(z_{n+1}|z_n) + log P(y_{n+1}|z_{n+1})
+
+    The recursions are computed with scaled probabilities instead of
+    log-probabilities: the transition matrices are scaled so that their
+    largest element is one and the messages are normalized at each step.  The
+    scales are accumulated to the normalization constant.  If the scaled
+    probabilities underflow, the recursions are computed again in
+    log-space.
     """
 
     logp0 = utils.atleast_nd(logp0, 1)
@@ -331,6 +339,76 @@ def alpha_beta_recursion(logp0, logP):
                          % (np.shape(logP)[-2:],
                             (D,D)))
 
+    # Scale the transition matrices
+    logm = np.amax(logP, axis=(-1,-2), keepdims=True)
+    logm[~np.isfinite(logm)] = 0
+    P = np.exp(logP - logm)
+
+    # Normalization of the initial state
+    logZ = utils.logsumexp(logp0, axis=-1)
+
+    #
+    # Run the recursion algorithm
+    #
+
+    # Allocate memory. alpha[...,n,:,:] contains P(z_n|y_0,...,y_n) as a row
+    # vector and beta[...,n,:,:] contains P(y_{n+2},...|z_{n+1}) as a column
+    # vector, scaled by the normalizers of the forward recursion.
+    alpha = np.empty(plates+(N+1,1,D))
+    beta = np.ones(plates+(N,D,1))
+    scale = np.empty(plates+(N,1,1))
+
+    # Forward recursion
+    alpha[...,0,0,:] = np.exp(logp0 - logZ[...,None])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for n in range(N):
+            # Sum over z_n to get P(z_{n+1}|y_0,...,y_{n+1}) unnormalized
+            a = np.matmul(alpha[...,n,:,:], P[...,n,:,:])
+            scale[...,n,:,:] = np.sum(a, axis=-1, keepdims=True)
+            alpha[...,n+1,:,:] = a / scale[...,n,:,:]
+
+    if not np.all(scale > 0) or not np.all(np.isfinite(scale)):
+        return _alpha_beta_recursion_logspace(logp0, logP, plates)
+
+    # Backward recursion
+    for n in reversed(range(N-1)):
+        beta[...,n,:,:] = (np.matmul(P[...,n+1,:,:], beta[...,n+1,:,:])
+                           / scale[...,n+1,:,:])
+
+    logZ = (logZ 
+            + np.sum(np.log(scale[...,0,0]), axis=-1)
+            + np.sum(logm[...,0,0], axis=-1))
+
+    # Compute the pairwise posterior probabilities in the memory of P if
+    # possible
+    if np.shape(P) == plates+(N,D,D):
+        zz = P
+        zz *= np.swapaxes(alpha[...,:-1,:,:], -1, -2)
+        zz *= np.swapaxes(beta, -1, -2)
+    else:
+        zz = (P
+              * np.swapaxes(alpha[...,:-1,:,:], -1, -2)
+              * np.swapaxes(beta, -1, -2))
+
+    # Normalize again to remove numerical inaccuracies
+    zz /= np.sum(zz, axis=(-1,-2), keepdims=True)
+
+    z0 = np.sum(zz[...,0,:,:], axis=-1)
+
+    return (z0, zz, -logZ)
+
+
+def _alpha_beta_recursion_logspace(logp0, logP, plates):
+    """
+    Compute alpha-beta recursion for Markov chain in log-space.
+
+    This is slower than the recursion with scaled probabilities but it does
+    not underflow.
+    """
+
+    D = np.shape(logp0)[-1]
+    N = np.shape(logP)[-3]
+
     #
     # Run the recursion algorithm
     #
@@ -372,3 +450,353 @@ def alpha_beta_recursion(logp0, logP):
     z0 = np.sum(zz[...,0,:,:], axis=-1)
 
     return (z0, zz, g)
+
+
+def _scaled_transitions(logP, pattern):
+    """
+    Scale the transition log-probabilities for the alpha-beta recursions.
+
+    Return the scaled transition probabilities, the logarithm of the scale,
+    functions for multiplying the last axis of an array by P and P' from the
+    right, and the indices of the allowed transitions (None for dense
+    matrices).
+    """
+
+    D = np.shape(logP)[-1]
+
+    if pattern is not None:
+        if sp.issparse(pattern):
+            (rows, cols) = pattern.nonzero()
+        else:
+            (rows, cols) = np.nonzero(pattern)
+        if np.ndim(logP) > 2:
+            # The transitions differ between the plates, thus use dense
+            # matrices with zero probability for the other transitions
+            mask = np.zeros((D,D), dtype=bool)
+            mask[rows,cols] = True
+            logP = np.where(mask, logP, -np.inf)
+            pattern = None
+
+    if pattern is None:
+        logm = np.amax(logP, axis=(-1,-2), keepdims=True)
+        logm[~np.isfinite(logm)] = 0
+        P = np.exp(logP - logm)
+        logm = logm[...,0,0]
+        if np.ndim(P) == 2:
+            multiply_P = lambda x: np.dot(x, P)
+            multiply_PT = lambda x: np.dot(x, P.T)
+        else:
+            multiply_P = lambda x: np.matmul(x[...,None,:], P)[...,0,:]
+            multiply_PT = lambda x: np.matmul(P, x[...,:,None])[...,0]
+        return (P, logm, multiply_P, multiply_PT, None, None)
+
+    logP = logP[rows,cols]
+    logm = np.amax(logP) if np.size(logP) > 0 else 0
+    if not np.isfinite(logm):
+        logm = 0
+    P = np.exp(logP - logm)
+    P_sparse = sp.csr_matrix((P, (rows, cols)), shape=(D,D))
+    PT_sparse = P_sparse.T.tocsr()
+    # Sparse matrix products for the last axis of x
+    multiply_P = lambda x: np.reshape(
+        (PT_sparse * np.reshape(x, (-1,D)).T).T,
+        np.shape(x))
+    multiply_PT = lambda x: np.reshape(
+        (P_sparse * np.reshape(x, (-1,D)).T).T,
+        np.shape(x))
+    return (P, logm, multiply_P, multiply_PT, rows, cols)
+
+
+def _sum_pairwise(P, alpha, qbeta, rows, cols):
+    """
+    Sum the pairwise posterior probabilities over the steps.
+
+    alpha[...,n,:] and qbeta[...,n,:] are the scaled forward and backward
+    terms of the two states of the n-th transition. For sparse transitions
+    (the indices `rows` and `cols` are given), the sums are computed only for
+    the allowed transitions and the steps are processed in chunks in order to
+    bound the size of the temporary arrays.
+    """
+    if rows is None:
+        return P * np.matmul(np.swapaxes(alpha, -1, -2), qbeta)
+
+    plates = utils.broadcasted_shape(np.shape(alpha)[:-2],
+                                     np.shape(qbeta)[:-2])
+    (N, D) = np.shape(alpha)[-2:]
+    nnz = len(rows)
+    chunk = max(1, 2**20 // max(1, nnz*int(np.prod(plates))))
+    s = np.zeros(plates+(nnz,))
+    for n in range(0, N, chunk):
+        s += np.einsum('...ni,...ni->...i',
+                       alpha[...,n:n+chunk,rows],
+                       qbeta[...,n:n+chunk,cols])
+    zz = np.zeros(plates+(D,D))
+    zz[...,rows,cols] = P * s
+    return zz
+
+
+def alpha_beta_recursion_homogeneous(logp0, logP, logq, pattern=None):
+    """
+    Compute alpha-beta recursion for Markov chain with fixed transitions.
+
+    The state transition log-probabilities are the same for every step and
+    the terms that depend on the time instance are given separately:
+
+    logp0 = log P(z_0) + log P(y_0|z_0)
+    logP = log P(z_{n+1}|z_n)
+    logq[...,n,:] = log P(y_{n+1}|z_{n+1})
+
+    Shapes:
+    logp0: (...,K)
+    logP:  (...,K,K)
+    logq:  (...,N-1,K)
+
+    Instead of the pairwise posterior probabilities for each step, only
+    their sum over the steps is returned. Thus, no array of shape
+    (...,N-1,K,K) is created.
+
+    Optional `pattern` is a boolean (K,K) array or a sparse matrix of the
+    allowed state transitions, the other transitions have zero probability.
+    If `logP` has no plates, the recursions use sparse matrices and thus
+    the cost is proportional to the number of allowed transitions instead
+    of K*K.
+
+    Return:
+    * posterior probabilities of z_0, shape (...,K)
+    * sum of the pairwise posterior probabilities, shape (...,K,K)
+    * posterior probabilities of z_1,...,z_{N-1}, shape (...,N-1,K)
+    * cumulant-generating function
+    """
+
+    logp0 = utils.atleast_nd(logp0, 1)
+    logP = utils.atleast_nd(logP, 2)
+    logq = utils.atleast_nd(logq, 2)
+
+    D = np.shape(logp0)[-1]
+    N = np.shape(logq)[-2]
+    plates = utils.broadcasted_shape(np.shape(logp0)[:-1],
+                                     np.shape(logP)[:-2],
+                                     np.shape(logq)[:-2])
+
+    if np.shape(logP)[-2:] != (D,D) or np.shape(logq)[-1] != D:
+        raise ValueError("Dimension mismatch")
+
+    # Scale the transition matrix and the emission terms
+    (P, logm, multiply_P, multiply_PT, rows, cols) = _scaled_transitions(
+        logP,
+        pattern)
+    logmq = np.amax(logq, axis=-1, keepdims=True)
+    logmq[~np.isfinite(logmq)] = 0
+    q = np.exp(logq - logmq)
+
+    # Normalization of the initial state
+    logZ = utils.logsumexp(logp0, axis=-1)
+
+    # Allocate memory. alpha[...,n,:] contains P(z_n|y_0,...,y_n) and
+    # beta[...,n,:] contains P(y_{n+1},...|z_n) scaled by the normalizers of
+    # the forward recursion.
+    alpha = np.empty(plates+(N+1,D))
+    beta = np.ones(plates+(N+1,D))
+    scale = np.empty(plates+(N,1))
+
+    # Forward recursion
+    alpha[...,0,:] = np.exp(logp0 - logZ[...,None])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for n in range(N):
+            a = multiply_P(alpha[...,n,:]) * q[...,n,:]
+            scale[...,n,:] = np.sum(a, axis=-1, keepdims=True)
+            alpha[...,n+1,:] = a / scale[...,n,:]
+
+    if not np.all(scale > 0) or not np.all(np.isfinite(scale)):
+        # The scaled probabilities underflow, use the general log-space
+        # algorithm
+        if rows is not None:
+            logP_dense = -np.inf * np.ones((D,D))
+            logP_dense[rows,cols] = logP[rows,cols]
+            logP = logP_dense
+        logP_full = logP[...,None,:,:] + logq[...,:,None,:]
+        (z0, zz, g) = alpha_beta_recursion(logp0, logP_full)
+        return (z0, 
+                np.sum(zz, axis=-3), 
+                np.sum(zz, axis=-2), 
+                g)
+
+    # Backward recursion. Store q*beta/scale for computing the pairwise
+    # statistics.
+    qbeta = np.empty(plates+(N,D))
+    for n in reversed(range(N)):
+        qbeta[...,n,:] = q[...,n,:] * beta[...,n+1,:] / scale[...,n,:]
+        beta[...,n,:] = multiply_PT(qbeta[...,n,:])
+
+    logZ = (logZ 
+            + np.sum(np.log(scale[...,0]), axis=-1)
+            + N * logm
+            + np.sum(logmq[...,0], axis=-1))
+
+    # Posterior marginals
+    z = alpha * beta
+    z /= np.sum(z, axis=-1, keepdims=True)
+
+    # Sum of the pairwise posterior probabilities over the steps
+    zz = _sum_pairwise(P, alpha[...,:-1,:], qbeta, rows, cols)
+    if N > 0:
+        zz *= N / np.sum(zz, axis=(-1,-2), keepdims=True)
+
+    return (z[...,0,:], zz, z[...,1:,:], -logZ)
+
+
+def alpha_beta_recursion_packed(logp0, logP, logq, lengths, pattern=None):
+    """
+    Compute alpha-beta recursion for packed Markov chains.
+
+    Several independent Markov chains of varying lengths share the same
+    initial state and transition probabilities. The chains are concatenated
+    along the time axis and `lengths` gives the length of each chain:
+
+    logp0 = log P(z_0)
+    logP = log P(z_{n+1}|z_n)
+    logq[...,n,:] = log P(y_n|z_n)
+
+    Shapes:
+    logp0:   (...,K)
+    logP:    (...,K,K)
+    logq:    (...,N,K)
+    lengths: (S,), sum(lengths) = N
+
+    The recursions process all the chains simultaneously, one step at a
+    time, so only the chains that are still running are computed at each
+    step. Thus, the chains do not need to be padded to the same length and
+    the number of sequential steps is the length of the longest chain.
+
+    Optional `pattern` is the sparsity pattern of the transitions as in
+    `alpha_beta_recursion_homogeneous`.
+
+    Return:
+    * sum of the posterior probabilities of the initial states, shape (...,K)
+    * sum of the pairwise posterior probabilities, shape (...,K,K)
+    * posterior probabilities of the states, shape (...,N,K)
+    * cumulant-generating function
+    """
+
+    logp0 = utils.atleast_nd(logp0, 1)
+    logP = utils.atleast_nd(logP, 2)
+    logq = utils.atleast_nd(logq, 2)
+
+    lengths = np.asarray(lengths, dtype=int)
+    D = np.shape(logp0)[-1]
+    N = np.shape(logq)[-2]
+    S = len(lengths)
+    plates = utils.broadcasted_shape(np.shape(logp0)[:-1],
+                                     np.shape(logP)[:-2],
+                                     np.shape(logq)[:-2])
+
+    if np.shape(logP)[-2:] != (D,D) or np.shape(logq)[-1] != D:
+        raise ValueError("Dimension mismatch")
+    if np.ndim(lengths) != 1 or np.any(lengths < 1):
+        raise ValueError("Lengths of the chains must be positive")
+    if np.sum(lengths) != N:
+        raise ValueError("Lengths of the chains do not sum to the number of "
+                         "states")
+
+    # Start indices of the chains
+    starts = np.cumsum(lengths) - lengths
+
+    # Sort the chains by decreasing length so that the running chains at
+    # step t are the first active[t] chains
+    order = np.argsort(-lengths, kind='mergesort')
+    sorted_starts = starts[order]
+    active = np.searchsorted(-lengths[order], -np.arange(lengths[order[0]]))
+
+    # Scale the transition matrix and the emission terms. Add the time axis
+    # to the plates of the transition matrix.
+    (P, logm, multiply_P, multiply_PT, rows, cols) = _scaled_transitions(
+        logP[...,None,:,:] if np.ndim(logP) > 2 else logP,
+        pattern)
+    if np.ndim(P) > 2:
+        P = P[...,0,:,:]
+        logm = logm[...,0]
+    logmq = np.amax(logq, axis=-1, keepdims=True)
+    logmq[~np.isfinite(logmq)] = 0
+    q = np.exp(logq - logmq)
+    logZ0 = utils.logsumexp(logp0, axis=-1)
+    p0 = np.exp(logp0 - logZ0[...,None])[...,None,:]
+
+    # Allocate memory. alpha[...,n,:] contains the filtering distribution
+    # and beta[...,n,:] the scaled backward messages
+    alpha = np.empty(plates+(N,D))
+    beta = np.ones(plates+(N,D))
+    qbeta = np.empty(plates+(N,D))
+    scale = np.empty(plates+(N,1))
+
+    # Indices of the running chains at step t and at the previous step. If
+    # only one chain is running, use slices in order to avoid copies.
+    def running(t):
+        m = active[t]
+        if m > 1:
+            ind = sorted_starts[:m] + t
+            return (ind, ind-1)
+        n = sorted_starts[0] + t
+        return (slice(n, n+1), slice(n-1, n))
+
+    # Forward recursion
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for t in range(len(active)):
+            (ind, prev) = running(t)
+            if t == 0:
+                a = p0 * q[...,ind,:]
+            else:
+                a = multiply_P(alpha[...,prev,:]) * q[...,ind,:]
+            c = a.sum(axis=-1, keepdims=True)
+            scale[...,ind,:] = c
+            alpha[...,ind,:] = a / c
+
+    if not np.all(scale > 0) or not np.all(np.isfinite(scale)):
+        # The scaled probabilities underflow, process each chain separately
+        # using the log-space algorithm if necessary
+        z0 = 0
+        zz = 0
+        z = np.empty(plates+(N,D))
+        g = 0
+        for (start, length) in zip(starts, lengths):
+            stop = start + length
+            (z0_s, zz_s, z_s, g_s) = alpha_beta_recursion_homogeneous(
+                logp0 + logq[...,start,:],
+                logP,
+                logq[...,start+1:stop,:],
+                pattern=pattern)
+            z0 = z0 + z0_s
+            zz = zz + zz_s
+            z[...,start,:] = z0_s
+            z[...,start+1:stop,:] = z_s
+            g = g + g_s
+        return (z0, zz, z, g)
+
+    # Backward recursion
+    for t in reversed(range(1, len(active))):
+        (ind, prev) = running(t)
+        b = q[...,ind,:] * beta[...,ind,:] / scale[...,ind,:]
+        qbeta[...,ind,:] = b
+        beta[...,prev,:] = multiply_PT(b)
+
+    logZ = (S * logZ0
+            + np.sum(np.log(scale[...,0]), axis=-1)
+            + (N-S) * logm
+            + np.sum(logmq[...,0], axis=-1))
+
+    # Posterior marginals
+    z = alpha * beta
+    z /= np.sum(z, axis=-1, keepdims=True)
+    z0 = np.sum(z[...,starts,:], axis=-2)
+
+    # Sum of the pairwise posterior probabilities over the transitions
+    # inside the chains
+    is_start = np.zeros(N, dtype=bool)
+    is_start[starts] = True
+    ind = np.nonzero(~is_start)[0]
+    zz = _sum_pairwise(P, alpha[...,ind-1,:], qbeta[...,ind,:], rows, cols)
+    if N > S:
+        zz *= (N-S) / np.sum(zz, axis=(-1,-2), keepdims=True)
+    else:
+        zz = zz * np.ones(plates+(1,1))
+
+    return (z0, zz, z, -logZ)
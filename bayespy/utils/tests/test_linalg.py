@@ -127,6 +127,113 @@ class TestDot(TestCase):
                           [[1,2,3],
                            [4,5,6]])
 
+class TestCholesky(TestCase):
+
+    def test_chol(self):
+        """
+        Test the batched Cholesky kernels for a collection of matrices.
+        """
+        D = 3
+        C = np.random.randn(4,5,D,2*D)
+        C = np.einsum('...ik,...jk->...ij', C, C)
+        b = np.random.randn(6,1,5,D)
+        invC = np.linalg.inv(C)
+
+        U = linalg.chol(C)
+        self.assertAllClose(np.einsum('...ki,...kj->...ij', U, U), C)
+        self.assertAllClose(linalg.chol_inv(U), invC)
+        self.assertAllClose(linalg.chol_logdet(U), np.linalg.slogdet(C)[1])
+        self.assertAllClose(linalg.chol_solve(U, b),
+                            np.einsum('...ij,...j->...i', invC, b))
+
+        # Solve a matrix
+        B = np.random.randn(4,5,D,2)
+        self.assertAllClose(linalg.chol_solve(U, B, matrix=True),
+                            np.einsum('...ij,...jk->...ik', invC, B))
+
+        # Triangular solve
+        self.assertAllClose(linalg.solve_triangular(U, b, trans='T'),
+                            np.einsum('...ji,...j->...i',
+                                      np.linalg.inv(U),
+                                      b))
+
+        # Not positive definite
+        self.assertRaises(np.linalg.LinAlgError,
+                          linalg.chol,
+                          -np.identity(D))
+
+    def test_chol_ill_conditioned(self):
+        """
+        Test the batched Cholesky solves for poorly conditioned factors.
+        """
+        import scipy.linalg
+        D = 6
+        U = np.triu(np.random.randn(3,D,D), 1)
+        U += np.identity(D) * np.logspace(-3, 0, D)
+        b = np.random.randn(2,3,D)
+        B = np.random.randn(3,D,2)
+        for (U_i, b_i, B_i) in [(U, b, B), (U[:1], b[:,:1], B[:1])]:
+            x = linalg.chol_solve(U_i, b_i)
+            X = linalg.chol_solve(U_i, B_i, matrix=True)
+            z = linalg.solve_triangular(U_i, b_i, trans='T')
+            for n in range(len(U_i)):
+                self.assertAllClose(x[:,n], 
+                                    scipy.linalg.cho_solve((U_i[n], False),
+                                                           b_i[:,n].T).T)
+                self.assertAllClose(X[n], 
+                                    scipy.linalg.cho_solve((U_i[n], False),
+                                                           B_i[n]))
+                self.assertAllClose(z[:,n],
+                                    scipy.linalg.solve_triangular(
+                                        U_i[n], 
+                                        b_i[:,n].T,
+                                        trans='T').T)
+
+    def test_chol_solve_broadcast(self):
+        """
+        Test the Cholesky solves with plates of U broadcasted against b.
+        """
+        import scipy.linalg
+        # Fewer plates than rows (solved plate by plate) and more plates than
+        # rows (solved row by row)
+        for (D, M) in [(6, 2), (3, 5)]:
+            C = np.random.randn(M,1,D,2*D)
+            C = np.einsum('...ik,...jk->...ij', C, C)
+            U = linalg.chol(C)
+            b = np.random.randn(4,M,3,D)
+            B = np.random.randn(3,1,1,D,2)
+            x = linalg.chol_solve(U, b)
+            X = linalg.chol_solve(U, B, matrix=True)
+            self.assertEqual(np.shape(x), (4,M,3,D))
+            self.assertEqual(np.shape(X), (3,M,1,D,2))
+            for m in range(M):
+                cho = (U[m,0], False)
+                for k in range(3):
+                    self.assertAllClose(x[:,m,k],
+                                        scipy.linalg.cho_solve(cho,
+                                                               b[:,m,k].T).T)
+                    self.assertAllClose(X[k,m,0],
+                                        scipy.linalg.cho_solve(cho,
+                                                               B[k,0,0]))
+            self.assertAllClose(linalg.chol_inv(U), np.linalg.inv(C))
+
+    def test_chol_threads(self):
+        """
+        Test the batched Cholesky kernels using multiple threads.
+        """
+        C = np.random.randn(3000,2,4)
+        C = np.einsum('...ik,...jk->...ij', C, C)
+        b = np.random.randn(3000,2)
+        U = linalg.chol(C)
+        x = linalg.chol_solve(U, b)
+        try:
+            linalg.set_num_threads(2)
+            self.assertEqual(linalg.get_num_threads(), 2)
+            self.assertAllClose(linalg.chol(C), U)
+            self.assertAllClose(linalg.chol_solve(U, b), x)
+        finally:
+            linalg.set_num_threads(1)
+
 class TestBandedSolve(TestCase):
 
     def test_block_banded_solve(self):
@@ -198,3 +305,105 @@ class TestBandedSolve(TestCase):
         # Check the log determinant
         self.assertAlmostEqual(ldet/np.linalg.slogdet(C)[1], 1)
 
+    def test_block_banded_cyclic_reduction(self):
+        """
+        Test the cyclic reduction algorithm for block-banded matrices.
+        """
+
+        D = 3
+        for N in [1, 2, 5, 8, 33]:
+            # Create a block-banded positive-definite matrix
+            W = np.random.randn(N, D, 2*D)
+            A = np.einsum('...ik,...jk->...ij', W, W)
+            B = np.einsum('...ik,...jk->...ij', 
+                          W[:-1,:,-1:], 
+                          W[1:,:,:1])
+            C = utils.block_banded(list(A), list(B))
+            y = np.random.randn(2, N, D)
+
+            # Compare to the dense inverse
+            invC = np.linalg.inv(C)
+            (V, Cov, x, ldet) = linalg.block_banded_cyclic_reduction(A, B, y)
+            for n in range(N):
+                self.assertAllClose(V[n], 
+                                    invC[n*D:(n+1)*D,n*D:(n+1)*D])
+            for n in range(N-1):
+                self.assertAllClose(Cov[n], 
+                                    invC[n*D:(n+1)*D,(n+1)*D:(n+2)*D])
+            self.assertAllClose(x, 
+                                np.reshape(np.einsum('ij,...j->...i',
+                                                     invC,
+                                                     np.reshape(y, (2,-1))),
+                                           (2,N,D)))
+            self.assertAllClose(ldet, np.linalg.slogdet(C)[1])
+
+            # Compare to the sequential algorithm with broadcasted plates
+            A = A + np.zeros((4,1,1,1))
+            results = linalg.block_banded_solve(A, B, y[:,None])
+            for (r0, r1) in zip(results,
+                                linalg.block_banded_cyclic_reduction(A, 
+                                                                     B, 
+                                                                     y[:,None])):
+                self.assertAllClose(r0, r1)
+
+    def test_block_banded_solve_overwrite(self):
+        """
+        Test the in-place computation of the block-banded inverse.
+        """
+
+        N = 10
+        D = 3
+        W = np.random.randn(N, D, 2*D)
+        A = np.einsum('...ik,...jk->...ij', W, W)
+        B = np.einsum('...ik,...jk->...ij', W[:-1,:,-1:], W[1:,:,:1])
+        y = np.random.randn(N, D)
+        results = linalg.block_banded_solve(A, B, y)
+
+        for solve in [linalg.block_banded_solve,
+                      linalg.block_banded_cyclic_reduction]:
+            A_copy = A.copy()
+            B_copy = B.copy()
+            (V, C, x, ldet) = solve(A_copy, B_copy, y, overwrite=True)
+            self.assertIs(V, A_copy)
+            self.assertIs(C, B_copy)
+            for (r0, r1) in zip(results, (V, C, x, ldet)):
+                self.assertAllClose(r0, r1)
+
+        # Broadcasted blocks can not be overwritten
+        A_copy = A.copy()
+        B_copy = B + np.zeros((2,1,1,1))
+        (V, C, x, ldet) = linalg.block_banded_solve(A_copy, B_copy, y,
+                                                    overwrite=True)
+        self.assertEqual(np.shape(V), (2,N,D,D))
+        self.assertAllClose(A_copy, A)
+        self.assertIs(C, B_copy)
+
+    def test_block_banded_solve_steady_state(self):
+        """
+        Test the steady-state recursions for time-invariant blocks.
+        """
+
+        N = 200
+        D = 3
+        # Time-invariant blocks except for the first and the last ones. The
+        # matrix is positive definite because it is diagonally dominant.
+        W = np.random.randn(D, 2*D)
+        A = np.tile(np.dot(W, W.T) + 2*D*np.identity(D), (N,1,1))
+        A[0] += np.identity(D)
+        A[-1] -= np.identity(D)
+        B = np.random.randn(D, D)
+        B = np.tile(B / np.linalg.norm(B, 2), (N-1,1,1))
+        y = np.random.randn(N, D)
+
+        C = utils.block_banded(list(A), list(B))
+        invC = np.linalg.inv(C)
+        (V, Cov, x, ldet) = linalg.block_banded_solve(A, B, y, tol=1e-12)
+        for n in range(N):
+            self.assertAllClose(V[n], 
+                                invC[n*D:(n+1)*D,n*D:(n+1)*D])
+        for n in range(N-1):
+            self.assertAllClose(Cov[n], 
+                                invC[n*D:(n+1)*D,(n+1)*D:(n+2)*D])
+        self.assertAllClose(x, np.reshape(np.dot(invC, np.ravel(y)), (N,D)))
+        self.assertAllClose(ldet, np.linalg.slogdet(C)[1])
+
@@ -26,6 +26,7 @@ Unit tests for bayespy.utils.random module.
 """
 
 import numpy as np
+import scipy.sparse as sp
 
 from .. import utils
 from .. import random
@@ -275,3 +276,69 @@ class TestAlphaBetaRecursion(utils.TestCase):
                         msg="Nans in results, algorithm not stable")
 
         pass
+
+    def test_scaled_recursion(self):
+        """
+        Test that the scaled recursion equals the log-space recursion
+        """
+
+        logp0 = 10 * np.random.randn(3,1,4)
+        logP = 10 * np.random.randn(2,6,4,4)
+        plates = (3,2)
+        (z0, zz, g) = random.alpha_beta_recursion(logp0, logP)
+        (z0_log, zz_log, g_log) = random._alpha_beta_recursion_logspace(logp0,
+                                                                        logP,
+                                                                        plates)
+        self.assertAllClose(z0, z0_log)
+        self.assertAllClose(zz, zz_log)
+        self.assertAllClose(g, g_log)
+
+    def test_homogeneous(self):
+        """
+        Test alpha-beta recursion for Markov chain with fixed transitions
+        """
+
+        logp0 = np.random.randn(3,1,4)
+        logP = np.random.randn(2,4,4)
+        logq = np.random.randn(6,4)
+        (z0, zz, g) = random.alpha_beta_recursion(logp0,
+                                                  logP[...,None,:,:]
+                                                  + logq[...,:,None,:])
+        (z0_h, zz_h, z_h, g_h) = random.alpha_beta_recursion_homogeneous(logp0,
+                                                                          logP,
+                                                                          logq)
+        self.assertAllClose(z0_h, z0)
+        self.assertAllClose(zz_h, np.sum(zz, axis=-3))
+        self.assertAllClose(z_h, np.sum(zz, axis=-2))
+        self.assertAllClose(g_h, g)
+
+    def test_sparse_transitions(self):
+        """
+        Test alpha-beta recursion with a sparsity pattern for transitions
+        """
+
+        D = 5
+        pattern = sp.diags([np.ones(D), np.ones(D-1)], [0, 1], format='csr')
+        mask = pattern.toarray() > 0
+        logp0 = np.random.randn(3,D)
+        logP = np.random.randn(D,D)
+        logq = np.random.randn(6,D)
+        results = random.alpha_beta_recursion_homogeneous(logp0,
+                                                          np.where(mask,
+                                                                   logP,
+                                                                   -np.inf),
+                                                          logq)
+        # Sparse matrix pattern
+        for (r0, r1) in zip(results,
+                            random.alpha_beta_recursion_homogeneous(logp0,
+                                                                    logP,
+                                                                    logq,
+                                                                    pattern=pattern)):
+            self.assertAllClose(r0, r1)
+        # Boolean array pattern with plates in the transition matrix
+        for (r0, r1) in zip(results,
+                            random.alpha_beta_recursion_homogeneous(logp0,
+                                                                    logP[None],
+                                                                    logq,
+                                                                    pattern=mask)):
+            self.assertAllClose(r0, r1)
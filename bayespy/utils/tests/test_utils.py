@@ -30,6 +30,7 @@ import unittest
 import warnings
 
 import numpy as np
+import scipy.sparse
 
 from numpy import testing
 
@@ -350,6 +351,33 @@ class TestSumMultiply(unittest.TestCase):
                           sumaxis=False,
                           axis=(1,-1))
 
+class TestSumToShape(utils.TestCase):
+
+    def test_sparse(self):
+        """
+        Test summing sparse matrices to a shape
+        """
+
+        X = np.array([[1, 0, 2],
+                      [0, 3, 0]])
+        S = scipy.sparse.csr_matrix(X)
+        for s in [(), (3,), (1,3), (2,1), (2,3), (1,1), (1,2,1), (1,1,2,3)]:
+            self.assertAllClose(utils.sum_to_shape(S, s),
+                                utils.sum_to_shape(X, s))
+
+        # Sparse matrices have only two axes
+        self.assertRaises(ValueError,
+                          utils.sum_to_shape,
+                          S,
+                          (2,2,3))
+        self.assertRaises(ValueError,
+                          utils.sum_to_shape,
+                          S,
+                          (2,2))
+
+        pass
+
+
 class TestLogSumExp(utils.TestCase):
 
     def test_logsumexp(self):
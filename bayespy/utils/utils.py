@@ -155,7 +155,7 @@ def trues(shape):
     return np.ones(shape, dtype=np.bool)
 
 def identity(*shape):
-    return np.reshape(np.identity(np.prod(shape)), shape+shape)
+    return np.reshape(np.identity(int(np.prod(shape))), shape+shape)
 
 def array_to_scalar(x):
     # This transforms an N-dimensional array to a scalar. It's most
@@ -667,7 +667,33 @@ def sum_to_shape(X, s):
     Sum axes of the array such that the resulting shape is as given.
 
     Thus, the shape of the result will be s or an error is raised.
+
+    If X is a scipy.sparse matrix, the sums are computed using the non-zero
+    elements only and the result is a dense array. Because sparse matrices
+    are two-dimensional, s may have more than two axes only if the extra
+    leading axes are singular.
     """
+    if sparse.issparse(X):
+        if any(size != 1 for size in s[:-2]):
+            raise ValueError("Sparse matrix of shape %s can't be summed to "
+                             "shape %s because it has only two axes" %
+                             (np.shape(X), s))
+        t = (1,1) + tuple(s)
+        for (size, size_to) in zip(np.shape(X), t[-2:]):
+            if size_to != 1 and size_to != size:
+                raise ValueError("Shape %s can't be summed to shape %s" %
+                                 (np.shape(X), s))
+        if t[-2] == 1 and t[-1] == 1:
+            Y = np.reshape(X.sum(), (1,1))
+        elif t[-2] == 1:
+            Y = np.asarray(X.sum(axis=0))
+        elif t[-1] == 1:
+            Y = np.asarray(X.sum(axis=1))
+        else:
+            Y = X.toarray()
+        # Remove axes that are not in s
+        return np.reshape(Y, tuple(s)[-2:])
+
     # First, sum and remove axes that are not in s
     if np.ndim(X) > len(s):
         axes = tuple(range(-np.ndim(X), -len(s)))
@@ -689,6 +715,18 @@ def sum_to_shape(X, s):
     
     return Y
 
+def take_chunk(x, chunk, ndim):
+    """
+    Take a chunk of the axis which is `ndim` axes from the end.
+
+    If the array does not have the axis or the axis is singular, the array is
+    returned as it is, because it broadcasts to the chunk.
+    """
+    axis = np.ndim(x) - ndim
+    if axis < 0 or np.shape(x)[axis] == 1:
+        return x
+    return x[(slice(None),)*axis + (chunk,)]
+
 def repeat_to_shape(A, s):
     # Current shape
     t = np.shape(A)
@@ -755,145 +793,31 @@ def logdet_chol(U):
     elif isinstance(U, cholmod.Factor):
         return np.sum(np.log(U.D()))
 
-def m_solve_triangular(U, B, **kwargs):
-    # Allocate memory
-    U = np.atleast_2d(U)
-    B = np.atleast_1d(B)
-    sh_u = U.shape[:-2]
-    sh_b = B.shape[:-1]
-    l_u = len(sh_u)
-    l_b = len(sh_b)
-
-    # Check which axis are iterated over with B along with U
-    ind_b = [Ellipsis] * l_b
-    l_min = min(l_u, l_b)
-    jnd_b = tuple(i for i in range(-l_min,0) if sh_b[i]==sh_u[i])
-
-    # Shape of the result (broadcasting rules)
-    sh = broadcasted_shape(sh_u, sh_b)
-    #out = np.zeros(np.shape(B))
-    out = np.zeros(sh + B.shape[-1:])
-    ## if out == None:
-    ##     # Shape of the result (broadcasting rules)
-    ##     sh = broadcasted_shape(sh_u, sh_b)
-    ##     #out = np.zeros(np.shape(B))
-    ##     out = np.zeros(sh + B.shape[-1:])
-    for i in nested_iterator(np.shape(U)[:-2]):
-
-        # The goal is to run triangular solver once for all vectors of
-        # B for which the matrices of U are the same (according to the
-        # broadcasting rules). Thus, we collect all the axes of B for
-        # which U is singleton and form them as a 2-D matrix and then
-        # run the solver once.
-        
-        # Select those axes of B for which U and B are not singleton
-        for j in jnd_b:
-            ind_b[j] = i[j]
-            
-        # Collect all the axes for which U is singleton
-        b = B[tuple(ind_b) + (Ellipsis,)]
-
-        # Reshape it to a 2-D (or 1-D) array
-        orig_shape = b.shape
-        if b.ndim > 1:
-            b = b.reshape((-1, b.shape[-1]))
-
-        # Ellipsis to all preceeding axes and ellipsis for the last
-        # axis:
-        if len(ind_b) < len(sh):
-            ind_out = (Ellipsis,) + tuple(ind_b) + (Ellipsis,)
-        else:
-            ind_out = tuple(ind_b) + (Ellipsis,)
+# The following functions process collections of matrices. They use the
+# batched kernels of the linalg module, which handle all the plates in one
+# call instead of iterating over them. The module is imported in the functions
+# because linalg imports this module.
 
-        #print('utils.m_solve_triangular', np.shape(U[i]), np.shape(b))
-        out[ind_out] = linalg.solve_triangular(U[i],
-                                               b.T,
-                                               **kwargs).T.reshape(orig_shape)
-        #out[ind_out] = out[ind_out].T.reshape(orig_shape)
-
-        
-    return out
+def m_solve_triangular(U, B, **kwargs):
+    from . import linalg
+    return linalg.solve_triangular(U, B, **kwargs)
     
     
 def m_chol(C):
     # Computes Cholesky decomposition for a collection of matrices.
     # The last two axes of C are considered as the matrix.
-    C = np.atleast_2d(C)
-    U = np.empty(np.shape(C))
-    #print('m_chol', C)
-    for i in nested_iterator(np.shape(U)[:-2]):
-        try:
-            U[i] = linalg.cho_factor(C[i])[0]
-        except np.linalg.linalg.LinAlgError:
-            print(C[i])
-            raise Exception("Matrix not positive definite")
-    return U
+    from . import linalg
+    return linalg.chol(C)
 
 
 def m_chol_solve(U, B, out=None):
-
-    
-    # Allocate memory
-    U = np.atleast_2d(U)
-    B = np.atleast_1d(B)
-    sh_u = U.shape[:-2]
-    sh_b = B.shape[:-1]
-    l_u = len(sh_u)
-    l_b = len(sh_b)
-
-    # Check which axis are iterated over with B along with U
-    ind_b = [Ellipsis] * l_b
-    l_min = min(l_u, l_b)
-    jnd_b = tuple(i for i in range(-l_min,0) if sh_b[i]==sh_u[i])
-
-    if out == None:
-        # Shape of the result (broadcasting rules)
-        sh = broadcasted_shape(sh_u, sh_b)
-        #out = np.zeros(np.shape(B))
-        out = np.zeros(sh + B.shape[-1:])
-    for i in nested_iterator(np.shape(U)[:-2]):
-
-        # The goal is to run Cholesky solver once for all vectors of B
-        # for which the matrices of U are the same (according to the
-        # broadcasting rules). Thus, we collect all the axes of B for
-        # which U is singleton and form them as a 2-D matrix and then
-        # run the solver once.
-        
-        # Select those axes of B for which U and B are not singleton
-        for j in jnd_b:
-            ind_b[j] = i[j]
-            
-        # Collect all the axes for which U is singleton
-        b = B[tuple(ind_b) + (Ellipsis,)]
-
-        # Reshape it to a 2-D (or 1-D) array
-        orig_shape = b.shape
-        if b.ndim > 1:
-            b = b.reshape((-1, b.shape[-1]))
-
-        # Ellipsis to all preceeding axes and ellipsis for the last
-        # axis:
-        if len(ind_b) < len(sh):
-            ind_out = (Ellipsis,) + tuple(ind_b) + (Ellipsis,)
-        else:
-            ind_out = tuple(ind_b) + (Ellipsis,)
-
-        out[ind_out] = linalg.cho_solve((U[i], False),
-                                        b.T).T.reshape(orig_shape)
-
-        
-    return out
+    from . import linalg
+    return linalg.chol_solve(U, B, out=out)
     
 
 def m_chol_inv(U):
-    # Allocate memory
-    V = np.tile(np.identity(np.shape(U)[-1]), np.shape(U)[:-2]+(1,1))
-    for i in nested_iterator(np.shape(U)[:-2]):
-        V[i] = linalg.cho_solve((U[i], False),
-                                V[i],
-                                overwrite_b=True) # This would need Fortran order
-        
-    return V
+    from . import linalg
+    return linalg.chol_inv(U)
     
 
 def m_chol_logdet(U):
@@ -904,7 +828,7 @@ def m_chol_logdet(U):
 def m_digamma(a, d):
     y = 0
     for i in range(d):
-        y += special.digamma(a + 0.5*(1-i))
+        y += special.digamma(a - 0.5*i)
     return y
 
 def m_outer(A,B):